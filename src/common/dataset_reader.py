@@ -0,0 +1,104 @@
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+import pyarrow as pa
+import pyarrow.dataset as ds
+
+# Raw layout: <base>/date=YYYY-MM-DD/hour=HH/*.parquet (see docs/storage_structure.md).
+# Both keys stay strings so "09" is not turned into 9 and ISO dates compare correctly.
+PARTITION_SCHEMA = pa.schema([("date", pa.string()), ("hour", pa.string())])
+PARTITION_COLS = PARTITION_SCHEMA.names
+
+
+def open_dataset(base_dir: Path) -> ds.Dataset:
+    if not base_dir.exists():
+        raise FileNotFoundError(f"Base dir not found: {base_dir}")
+    return ds.dataset(
+        str(base_dir),
+        format="parquet",
+        partitioning=ds.partitioning(PARTITION_SCHEMA, flavor="hive"),
+    )
+
+
+def partition_filter(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    partition_dir: Optional[Path] = None,
+) -> Optional[ds.Expression]:
+    """
+    Predicate on partition keys only, so pyarrow prunes whole directories.
+    - start_date / end_date: inclusive YYYY-MM-DD bounds
+    - partition_dir: a single date=.../hour=... folder (e.g. from latest_partition)
+    """
+    conditions = []
+    if partition_dir is not None:
+        hour = partition_dir.name.split("=", 1)[1]
+        date = partition_dir.parent.name.split("=", 1)[1]
+        conditions += [ds.field("date") == date, ds.field("hour") == hour]
+    if start_date is not None:
+        conditions.append(ds.field("date") >= start_date)
+    if end_date is not None:
+        conditions.append(ds.field("date") <= end_date)
+
+    if not conditions:
+        return None
+    expr = conditions[0]
+    for cond in conditions[1:]:
+        expr = expr & cond
+    return expr
+
+
+def data_columns(dataset: ds.Dataset, columns: Optional[List[str]] = None) -> List[str]:
+    """Requested columns, or every file column (partition keys excluded) when None."""
+    if columns is not None:
+        return columns
+    return [name for name in dataset.schema.names if name not in PARTITION_COLS]
+
+
+def dataset_schema(base_dir: Path, columns: Optional[List[str]] = None) -> pa.Schema:
+    """Schema of the rows read_table / iter_batches would return."""
+    dataset = open_dataset(base_dir)
+    return pa.schema([dataset.schema.field(name) for name in data_columns(dataset, columns)])
+
+
+def read_table(
+    base_dir: Path,
+    columns: Optional[List[str]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    partition_dir: Optional[Path] = None,
+) -> pa.Table:
+    """Read matching partitions as one Arrow table (no per-file pandas concat)."""
+    dataset = open_dataset(base_dir)
+    return dataset.to_table(
+        columns=data_columns(dataset, columns),
+        filter=partition_filter(start_date, end_date, partition_dir),
+    )
+
+
+def iter_batches(
+    base_dir: Path,
+    columns: Optional[List[str]] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    partition_dir: Optional[Path] = None,
+    batch_size: int = 131_072,
+) -> Iterator[pa.RecordBatch]:
+    """Stream matching partitions as record batches; memory is bounded by batch_size."""
+    dataset = open_dataset(base_dir)
+    yield from dataset.to_batches(
+        columns=data_columns(dataset, columns),
+        filter=partition_filter(start_date, end_date, partition_dir),
+        batch_size=batch_size,
+    )
+
+
+def list_files(
+    base_dir: Path,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    partition_dir: Optional[Path] = None,
+) -> List[str]:
+    dataset = open_dataset(base_dir)
+    expr = partition_filter(start_date, end_date, partition_dir)
+    return [f.path for f in dataset.get_fragments(filter=expr)]
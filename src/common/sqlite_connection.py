@@ -0,0 +1,17 @@
+import sqlite3
+
+# Per-connection SQLite settings (not stored in the file), shared by the warehouse writers and
+# the feature store readers. synchronous=NORMAL is durable in WAL mode except for the last
+# commits on power loss.
+CONNECTION_PRAGMAS = {
+    "synchronous": "NORMAL",
+    "mmap_size": 256 * 1024 * 1024,
+    "busy_timeout": 5000,  # ms to wait for a lock (checkpoints, schema changes) before failing
+    "temp_store": "MEMORY",
+}
+
+
+def configure_connection(conn: sqlite3.Connection) -> sqlite3.Connection:
+    for name, value in CONNECTION_PRAGMAS.items():
+        conn.execute(f"PRAGMA {name} = {value}")
+    return conn
@@ -11,4 +11,5 @@ PREPARED_DIR = DATA_DIR / "prepared"
 FEATURES_DIR = DATA_DIR / "features"
 WAREHOUSE_DIR = DATA_DIR / "warehouse"
 WAREHOUSE_DB = WAREHOUSE_DIR / "recomart.db"
+FEATURE_BUILD_FILE = WAREHOUSE_DIR / "feature_build.json"  # written by build_features after each run
 MODELS_DIR = DATA_DIR / "models"
\ No newline at end of file
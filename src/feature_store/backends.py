@@ -0,0 +1,421 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.common.logger import get_logger
+from src.common.sqlite_connection import configure_connection
+
+logger = get_logger("feature_backends")
+
+# Bound parameters per statement. SQLite builds before 3.32 cap this at 999, so IN lists are
+# sent in chunks of at most this many keys.
+SQLITE_MAX_VARIABLES = 900
+
+BATCH_ROWS = 131_072
+ROW_GROUP_SIZE = 250_000
+PARQUET_COMPRESSION = "snappy"
+
+ARROW_TYPES = {"int": pa.int64(), "float": pa.float64(), "string": pa.string()}
+SQLITE_TYPES = {"int": "INTEGER", "float": "REAL", "string": "TEXT"}
+
+# Every backend serves the same rows for a view: the primary key and the registry features,
+# returned by read_rows as tuples (pk, *cols) with None for nulls, like sqlite3 rows.
+#   read_rows(fv, pk, cols, keys)                  point lookups, present keys only
+#   iter_batches(fv, pk, cols, keys, batch_size)   whole view (or keys) as Arrow record batches
+#   write_view(fv, pk, df)                         replace the view's rows (materialization)
+
+
+def view_schema(fv: dict, pk: str, cols: List[str]) -> pa.Schema:
+    types = {f["name"]: f["type"] for f in fv["features"]}
+    return pa.schema([pa.field(pk, pa.string())] + [pa.field(c, ARROW_TYPES[types[c]]) for c in cols])
+
+
+def view_table(fv: dict, pk: str, df: pd.DataFrame) -> pa.Table:
+    """Feature frame as an Arrow table with the registry types (pk + every feature, in order)."""
+    cols = [f["name"] for f in fv["features"]]
+    schema = view_schema(fv, pk, cols)
+    df = df.drop_duplicates(pk, keep="last")
+    return pa.Table.from_arrays(
+        [pa.array(df[f.name].astype(str) if f.name == pk else df[f.name], type=f.type, from_pandas=True)
+         for f in schema],
+        schema=schema,
+    )
+
+
+def _batches_to_rows(batches, cols: List[str]) -> List[tuple]:
+    rows = []
+    for batch in batches:
+        columns = [batch.column(c).to_pylist() for c in cols]
+        rows.extend(zip(*columns))
+    return rows
+
+
+class SqliteBackend:
+    """Feature tables in a SQLite database (the warehouse), one pooled connection per thread."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._conns = []
+        self._conns_lock = threading.Lock()
+
+    def connect(self) -> sqlite3.Connection:
+        """
+        One pooled connection per thread, opened on first use and reused across calls. Only its
+        owner thread queries it; check_same_thread=False lets close() release it from any thread.
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = configure_connection(sqlite3.connect(self.db_path, check_same_thread=False))
+            self._local.conn = conn
+            with self._conns_lock:
+                self._conns.append(conn)
+        return conn
+
+    def close(self):
+        with self._conns_lock:
+            conns, self._conns = self._conns, []
+        self._local = threading.local()
+        for conn in conns:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not close a pooled connection to {self.db_path}: {e}")
+
+    def fetch_rows(
+        self,
+        table: str,
+        pk: str,
+        cols: List[str],
+        keys: List[str],
+        where: str = "",
+        params: tuple = (),
+    ) -> List[tuple]:
+        """
+        Rows of table for the given keys (pk first, then cols), one SELECT per chunk of keys so
+        the statement stays under SQLITE_MAX_VARIABLES. where / params add an extra condition.
+        """
+        select = [pk] + [c for c in cols if c != pk]
+        chunk = SQLITE_MAX_VARIABLES - len(params)
+        conn = self.connect()
+        rows = []
+        for i in range(0, len(keys), chunk):
+            part = list(keys[i: i + chunk])
+            sql = (
+                f"SELECT {', '.join(select)} FROM {table} "
+                f"WHERE {pk} IN ({','.join(['?'] * len(part))}){where}"
+            )
+            rows.extend(conn.execute(sql, part + list(params)).fetchall())
+        return rows
+
+    def read_rows(self, fv: dict, pk: str, cols: List[str], keys: List[str]) -> List[tuple]:
+        return self.fetch_rows(fv["table"], pk, cols, keys)
+
+    def iter_query(
+        self,
+        sql: str,
+        schema: pa.Schema,
+        filters: Optional[Dict[str, List[str]]] = None,
+        batch_size: int = BATCH_ROWS,
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Stream a SELECT as Arrow record batches. filters ({column expression: ids}) are joined
+        through temp tables (no bound-variable limit). Rows are read with fetchmany and each
+        batch of tuples goes to Arrow in one struct-array conversion.
+        """
+        conn = self.connect()
+        row_type = pa.struct(list(schema))
+        temp_tables = []
+        try:
+            for i, (expr, ids) in enumerate((filters or {}).items()):
+                temp = f"temp._filter_{i}"
+                conn.execute(f"CREATE TEMP TABLE IF NOT EXISTS _filter_{i} (id TEXT PRIMARY KEY)")
+                conn.execute(f"DELETE FROM {temp}")
+                conn.executemany(f"INSERT OR IGNORE INTO {temp} VALUES (?)", ((str(k),) for k in ids))
+                temp_tables.append(temp)
+                sql += f" JOIN {temp} f{i} ON f{i}.id = {expr}"
+
+            cur = conn.execute(sql)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield pa.RecordBatch.from_struct_array(pa.array(rows, type=row_type))
+        finally:
+            for temp in temp_tables:
+                conn.execute(f"DROP TABLE IF EXISTS {temp}")
+
+    def iter_batches(
+        self,
+        fv: dict,
+        pk: str,
+        cols: List[str],
+        keys: Optional[List[str]] = None,
+        batch_size: int = BATCH_ROWS,
+    ) -> Iterator[pa.RecordBatch]:
+        sql = f"SELECT {', '.join(f'e.{c}' for c in [pk] + cols)} FROM {fv['table']} e"
+        filters = None if keys is None else {f"e.{pk}": keys}
+        yield from self.iter_query(sql, view_schema(fv, pk, cols), filters, batch_size)
+
+    def write_view(self, fv: dict, pk: str, df: pd.DataFrame):
+        """Replace the view's table contents in one transaction (created from the registry if missing)."""
+        table = view_table(fv, pk, df)
+        types = {f["name"]: f["type"] for f in fv["features"]}
+        defs = [f"{pk} TEXT PRIMARY KEY"] + [f"{c} {SQLITE_TYPES[types[c]]}" for c in table.column_names[1:]]
+        sql = f"INSERT INTO {fv['table']} ({', '.join(table.column_names)}) VALUES ({', '.join(['?'] * table.num_columns)})"
+        conn = self.connect()
+        with conn:
+            conn.execute(f"CREATE TABLE IF NOT EXISTS {fv['table']} ({', '.join(defs)})")
+            conn.execute(f"DELETE FROM {fv['table']}")
+            for batch in table.to_batches(BATCH_ROWS):
+                conn.executemany(sql, _batches_to_rows([batch], table.column_names))
+
+
+class KVBackend:
+    """
+    Embedded key-value online store: per view, a memory-mapped open-addressing hash table of
+    entity ids pointing into an array of packed fixed-width feature rows.
+
+        <path>/<view>/CURRENT            name of the live version directory
+        <path>/<view>/<version>/keys.npy    entity ids (fixed-width unicode)
+                                 slots.npy   hash slots -> row index (-1 = empty), linear probing
+                                 rows.npy    structured array: one field per feature + _nulls bitmask
+                                 meta.json
+
+    A lookup hashes the batch of ids, probes the slot table (O(1) expected per key, load factor
+    <= 0.5) and gathers rows, all vectorized. Writers build a new version directory and swap
+    CURRENT atomically; readers notice the change on their next lookup and remap, so lookups
+    never block on or see a half-written build, and never touch the warehouse.
+    """
+
+    MAX_LOAD = 0.5
+    KEEP_VERSIONS = 2
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+        self._views: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(keys: np.ndarray) -> np.ndarray:
+        return pd.util.hash_array(np.asarray(keys, dtype=object), categorize=False)
+
+    def _open(self, view_name: str) -> dict:
+        current = self.path / view_name / "CURRENT"
+        try:
+            st = current.stat()
+        except OSError:
+            raise FileNotFoundError(
+                f"Online store has no data for {view_name} in {self.path}; run build_features first"
+            ) from None
+        sig = (st.st_mtime_ns, st.st_size, st.st_ino)
+        with self._lock:
+            cached = self._views.get(view_name)
+            if cached is not None and cached[0] == sig:
+                return cached[1]
+            vdir = self.path / view_name / current.read_text(encoding="utf-8").strip()
+            # plain ndarray views of the maps: same pages, without np.memmap's per-index overhead
+            arrays = {
+                name: np.load(vdir / f"{name}.npy", mmap_mode="r", allow_pickle=False).view(np.ndarray)
+                for name in ("keys", "slots", "rows")
+            }
+            arrays["meta"] = json.loads((vdir / "meta.json").read_text(encoding="utf-8"))
+            arrays["null_bits"] = {c: np.uint64(1 << i) for i, c in enumerate(arrays["meta"]["columns"])}
+            self._views[view_name] = (sig, arrays)
+            return arrays
+
+    def _lookup(self, store: dict, keys: np.ndarray) -> np.ndarray:
+        """Row index per key (-1 when absent)."""
+        slots, stored = store["slots"], store["keys"]
+        out = np.full(len(keys), -1, dtype=np.int64)
+        if not len(keys) or not len(stored):
+            return out
+        mask = np.uint64(len(slots) - 1)
+        pos = self._hash(keys) & mask
+        pending = np.arange(len(keys))
+        while pending.size:
+            idx = slots[pos[pending].astype(np.int64)]
+            filled = idx >= 0
+            hit = filled.copy()
+            hit[filled] = stored[idx[filled]] == keys[pending[filled]]
+            out[pending[hit]] = idx[hit]
+            pending = pending[filled & ~hit]
+            pos[pending] = (pos[pending] + np.uint64(1)) & mask
+        return out
+
+    def _to_batch(self, store: dict, idx: np.ndarray, schema: pa.Schema) -> pa.RecordBatch:
+        rows = store["rows"][idx]
+        nulls, bits = rows["_nulls"], store["null_bits"]
+        arrays = [pa.array(store["keys"][idx], type=pa.string())]
+        for f in list(schema)[1:]:
+            values = np.ascontiguousarray(rows[f.name])
+            arrays.append(pa.array(values, type=f.type, mask=(nulls & bits[f.name]) != 0))
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    def read_rows(self, fv: dict, pk: str, cols: List[str], keys: List[str]) -> List[tuple]:
+        store = self._open(fv["name"])
+        idx = self._lookup(store, pd.unique(np.asarray(keys, dtype=str)))
+        idx = idx[idx >= 0]
+        rows = store["rows"][idx]
+        bits = store["null_bits"]
+        columns = [store["keys"][idx].tolist()]
+        for c in cols:
+            values = rows[c].tolist()
+            for i in np.flatnonzero(rows["_nulls"] & bits[c]):
+                values[i] = None
+            columns.append(values)
+        return list(zip(*columns))
+
+    def iter_batches(
+        self,
+        fv: dict,
+        pk: str,
+        cols: List[str],
+        keys: Optional[List[str]] = None,
+        batch_size: int = BATCH_ROWS,
+    ) -> Iterator[pa.RecordBatch]:
+        store = self._open(fv["name"])
+        if keys is None:
+            idx = np.arange(len(store["keys"]))
+        else:
+            idx = self._lookup(store, pd.unique(np.asarray(keys, dtype=str)))
+            idx = idx[idx >= 0]
+        schema = view_schema(fv, pk, cols)
+        for i in range(0, len(idx), batch_size):
+            yield self._to_batch(store, idx[i: i + batch_size], schema)
+
+    def write_view(self, fv: dict, pk: str, df: pd.DataFrame):
+        table = view_table(fv, pk, df)
+        cols = table.column_names[1:]
+        if len(cols) > 64:
+            raise ValueError(f"{fv['name']}: the KV store packs null flags of at most 64 features")
+        keys = table.column(pk).to_numpy(zero_copy_only=False).astype(str)
+        n = len(keys)
+
+        dtypes, values, nulls = [], {}, np.zeros(n, dtype=np.uint64)
+        for i, c in enumerate(cols):
+            col = table.column(c)
+            nulls |= np.where(col.is_null().to_numpy(zero_copy_only=False), np.uint64(1 << i), np.uint64(0))
+            if pa.types.is_string(col.type):
+                v = col.fill_null("").to_numpy(zero_copy_only=False).astype(str)
+                if v.dtype.itemsize == 0:
+                    v = v.astype("U1")
+            else:
+                v = col.fill_null(0).to_numpy()
+            dtypes.append((c, v.dtype))
+            values[c] = v
+        rows = np.empty(n, dtype=dtypes + [("_nulls", np.uint64)])
+        for c, v in values.items():
+            rows[c] = v
+        rows["_nulls"] = nulls
+
+        n_slots = 8
+        while n_slots * self.MAX_LOAD < n:
+            n_slots *= 2
+        slots = np.full(n_slots, -1, dtype=np.int32 if n < 2**31 - 1 else np.int64)
+        mask = np.uint64(n_slots - 1)
+        pos = self._hash(keys) & mask
+        pending = np.arange(n)
+        while pending.size:
+            p = pos[pending].astype(np.int64)
+            free = slots[p] < 0
+            # first pending key wins each free slot; everyone else probes the next slot
+            taken, first = np.unique(p[free], return_index=True)
+            slots[taken] = pending[free][first]
+            placed = np.zeros(len(pending), dtype=bool)
+            placed[np.flatnonzero(free)[first]] = True
+            pending = pending[~placed]
+            pos[pending] = (pos[pending] + np.uint64(1)) & mask
+
+        view_dir = self.path / fv["name"]
+        version = f"v{pd.Timestamp.now(tz='UTC').strftime('%Y%m%dT%H%M%S%f')}"
+        vdir = view_dir / version
+        vdir.mkdir(parents=True)
+        for name, arr in (("keys", keys), ("slots", slots), ("rows", rows)):
+            np.save(vdir / f"{name}.npy", arr, allow_pickle=False)
+        meta = {"view": fv["name"], "primary_key": pk, "columns": cols, "rows": n, "slots": n_slots}
+        (vdir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+
+        tmp = view_dir / ".CURRENT.tmp"
+        tmp.write_text(version, encoding="utf-8")
+        os.replace(tmp, view_dir / "CURRENT")
+
+        # Older versions may still be mapped by readers (fine on POSIX); keep the previous one
+        old = sorted(p for p in view_dir.iterdir() if p.is_dir() and p.name != version)
+        for p in old[: max(0, len(old) - (self.KEEP_VERSIONS - 1))]:
+            shutil.rmtree(p, ignore_errors=True)
+
+    def close(self):
+        with self._lock:
+            self._views.clear()
+
+
+class ParquetBackend:
+    """Offline store: one parquet file per view (<path>/<view>.parquet), replaced atomically."""
+
+    def __init__(self, path: str):
+        self.path = Path(path)
+
+    def _file(self, view_name: str) -> Path:
+        fp = self.path / f"{view_name}.parquet"
+        if not fp.exists():
+            raise FileNotFoundError(
+                f"Offline store has no data for {view_name} in {self.path}; run build_features first"
+            )
+        return fp
+
+    def read_rows(self, fv: dict, pk: str, cols: List[str], keys: List[str]) -> List[tuple]:
+        return _batches_to_rows(self.iter_batches(fv, pk, cols, keys), [pk] + cols)
+
+    def iter_batches(
+        self,
+        fv: dict,
+        pk: str,
+        cols: List[str],
+        keys: Optional[List[str]] = None,
+        batch_size: int = BATCH_ROWS,
+    ) -> Iterator[pa.RecordBatch]:
+        schema = view_schema(fv, pk, cols)
+        if keys is None:
+            yield from pq.ParquetFile(self._file(fv["name"])).iter_batches(batch_size=batch_size, columns=schema.names)
+            return
+        table = pq.read_table(
+            self._file(fv["name"]), columns=schema.names,
+            filters=[(pk, "in", [str(k) for k in keys])],
+        )
+        yield from table.to_batches(batch_size)
+
+    def write_view(self, fv: dict, pk: str, df: pd.DataFrame):
+        self.path.mkdir(parents=True, exist_ok=True)
+        out = self.path / f"{fv['name']}.parquet"
+        tmp = out.with_name(f".{out.name}.tmp")
+        pq.write_table(
+            view_table(fv, pk, df), tmp, row_group_size=ROW_GROUP_SIZE, compression=PARQUET_COMPRESSION
+        )
+        os.replace(tmp, out)
+
+    def close(self):
+        pass
+
+
+BACKENDS = {
+    "sqlite": lambda cfg: SqliteBackend(cfg["db_path"]),
+    "kv": lambda cfg: KVBackend(cfg["path"]),
+    "parquet": lambda cfg: ParquetBackend(cfg["path"]),
+}
+
+
+def make_backend(cfg: dict):
+    """Backend for a registry block ({"type": "sqlite" | "kv" | "parquet", ...})."""
+    if cfg["type"] not in BACKENDS:
+        raise ValueError(f"Unknown feature store backend {cfg['type']!r}; expected one of {sorted(BACKENDS)}")
+    return BACKENDS[cfg["type"]](cfg)
@@ -21,5 +21,13 @@ def main():
     )
     print("\nItem features:\n", item_df)
 
+    # Demo: user + item features for one user's candidate items in a single call
+    batch_df = fs.get_online_features(
+        entity_rows={"user_id": "U1", "item_id": ["P10", "P11", "P12"]},
+        features=["user_features_v1:events_7d", "user_features_v1:avg_price_7d", "item_features_v1"],
+    )
+    print("\nBatch features:\n", batch_df)
+    fs.close()
+
 if __name__ == "__main__":
     main()
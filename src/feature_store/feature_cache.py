@@ -0,0 +1,146 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from src.common.logger import get_logger
+from src.config import FEATURE_BUILD_FILE
+
+logger = get_logger("feature_cache")
+
+# Defaults per feature view; override per view with FeatureCache(views={name: {...}})
+CACHE_MAX_ENTRIES = 100_000
+CACHE_TTL_SECONDS = 300.0
+
+_MISSING = object()
+
+
+class FeatureCache:
+    """
+    In-process cache of feature rows, one LRU per feature view keyed by entity id.
+
+    Rows are only rewritten by build_features, which records a new build id in
+    FEATURE_BUILD_FILE after writing the feature tables. Every lookup stats that file and
+    drops all views when the build id changes; the TTL bounds staleness if the file is not
+    there. Entities missing from a view are cached too (as None).
+    """
+
+    def __init__(
+        self,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl_seconds: float = CACHE_TTL_SECONDS,
+        views: Optional[Dict[str, dict]] = None,
+        version_path: Path = FEATURE_BUILD_FILE,
+        clock=time.monotonic,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.view_config = views or {}
+        self.version_path = Path(version_path)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._views: Dict[str, OrderedDict] = {}
+        self._stats: Dict[str, dict] = {}
+        self._file_sig = None
+        self._version: Optional[str] = None
+        self.invalidations = 0
+
+    def _limits(self, view: str) -> Tuple[int, float]:
+        cfg = self.view_config.get(view, {})
+        return cfg.get("max_entries", self.max_entries), cfg.get("ttl_seconds", self.ttl_seconds)
+
+    def _view(self, view: str) -> Tuple[OrderedDict, dict]:
+        if view not in self._views:
+            self._views[view] = OrderedDict()
+            self._stats[view] = {"hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        return self._views[view], self._stats[view]
+
+    def _check_version(self) -> Optional[str]:
+        """Current build id; clears every view when it differs from the one cached against."""
+        try:
+            st = self.version_path.stat()
+            sig = (st.st_mtime_ns, st.st_size)
+        except OSError:
+            sig = None
+        if sig == self._file_sig:
+            return self._version
+
+        version = None
+        if sig is not None:
+            try:
+                version = json.loads(self.version_path.read_text(encoding="utf-8")).get("build_id")
+            except (OSError, ValueError):
+                version = str(sig)  # unreadable or half-written: treat the mtime as the version
+        self._file_sig = sig
+        if version != self._version:
+            if any(self._views.values()):
+                self.invalidations += 1
+                logger.info(f"Feature build changed ({self._version} -> {version}); cache cleared")
+            for entries in self._views.values():
+                entries.clear()
+            self._version = version
+        return self._version
+
+    @property
+    def build_version(self) -> Optional[str]:
+        with self._lock:
+            return self._check_version()
+
+    def get_many(self, view: str, keys: List[str]) -> Tuple[dict, List[str], Optional[str]]:
+        """
+        (cached rows by key, keys to fetch, build version). Pass the version back to put_many
+        so rows read while a rebuild lands are not cached against the new build.
+        """
+        with self._lock:
+            version = self._check_version()
+            entries, stats = self._view(view)
+            now = self._clock()
+            found, missing = {}, []
+            for key in keys:
+                hit = entries.get(key, _MISSING)
+                if hit is not _MISSING and hit[0] <= now:
+                    del entries[key]
+                    stats["expired"] += 1
+                    hit = _MISSING
+                if hit is _MISSING:
+                    missing.append(key)
+                else:
+                    entries.move_to_end(key)
+                    found[key] = hit[1]
+            stats["hits"] += len(found)
+            stats["misses"] += len(missing)
+            return found, missing, version
+
+    def put_many(self, view: str, rows: dict, version: Optional[str] = None):
+        with self._lock:
+            if self._check_version() != version:
+                return
+            entries, stats = self._view(view)
+            max_entries, ttl = self._limits(view)
+            expires = self._clock() + ttl
+            for key, row in rows.items():
+                entries[key] = (expires, row)
+                entries.move_to_end(key)
+            while len(entries) > max_entries:
+                entries.popitem(last=False)
+                stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            for entries in self._views.values():
+                entries.clear()
+
+    def stats(self) -> Dict[str, dict]:
+        """Per-view hit/miss/eviction/expiry counters, current size and hit rate."""
+        with self._lock:
+            out = {}
+            for view, s in self._stats.items():
+                lookups = s["hits"] + s["misses"]
+                out[view] = {
+                    **s,
+                    "size": len(self._views[view]),
+                    "hit_rate": round(s["hits"] / lookups, 4) if lookups else None,
+                }
+            return out
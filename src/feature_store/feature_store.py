@@ -1,26 +1,64 @@
 import json
+import os
+import shutil
 import sqlite3
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Union
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 
 from src.common.logger import get_logger
+from src.feature_store.backends import ARROW_TYPES, SqliteBackend, make_backend, view_schema
+from src.feature_store.feature_cache import FeatureCache
+from src.feature_store.point_in_time import point_in_time_join
 
 logger = get_logger("feature_store")
 
 REGISTRY_PATH = Path("src/feature_store/feature_registry.json")
 
+# Offline export: rows fetched per cursor round trip (= rows per Arrow record batch), and the
+# parquet layout written by export_parquet
+EXPORT_BATCH_ROWS = 131_072
+EXPORT_ROWS_PER_FILE = 2_000_000
+PARQUET_COMPRESSION = "snappy"
+
 
 class FeatureStore:
-    def __init__(self, registry_path: Path = REGISTRY_PATH):
+    """
+    Registry-driven feature access. "backend" is the SQLite warehouse (feature history and
+    feature services are always read there); "online_store" serves point lookups and
+    "offline_store" whole-view exports, each any backend in backends.py and the warehouse
+    when not configured.
+    """
+
+    def __init__(self, registry_path: Path = REGISTRY_PATH, cache: Optional[FeatureCache] = None):
         self.registry = json.loads(registry_path.read_text(encoding="utf-8"))
         backend = self.registry["backend"]
         if backend["type"] != "sqlite":
-            raise ValueError("This simple feature store only supports sqlite backend.")
+            raise ValueError("The warehouse backend must be sqlite; configure online_store/offline_store for others.")
         self.db_path = backend["db_path"]
+        self.warehouse = SqliteBackend(self.db_path)
+        self.online = make_backend(self.registry["online_store"]) if "online_store" in self.registry else self.warehouse
+        self.offline = make_backend(self.registry["offline_store"]) if "offline_store" in self.registry else self.warehouse
+        self.cache = cache
+
+    def _connect(self) -> sqlite3.Connection:
+        return self.warehouse.connect()
+
+    def _stores(self) -> list:
+        return list({id(b): b for b in (self.warehouse, self.online, self.offline)}.values())
+
+    def close(self):
+        for store in self._stores():
+            store.close()
 
-    def _connect(self):
-        return sqlite3.connect(self.db_path)
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
 
     def list_feature_views(self) -> List[str]:
         return [fv["name"] for fv in self.registry.get("feature_views", [])]
@@ -31,6 +69,71 @@ class FeatureStore:
                 return fv
         raise ValueError(f"Feature view not found: {view_name}")
 
+    def _view_columns(self, view_name: str, features: Optional[List[str]]) -> tuple:
+        """(view, primary key, feature columns) with the features checked against the registry."""
+        fv = self._get_view(view_name)
+        pk = self.registry["entities"][fv["entity"]]["primary_key"]
+        defined = [f["name"] for f in fv["features"]]
+        cols = defined if features is None else list(dict.fromkeys(c for c in features if c != pk))
+        for c in cols:
+            if c not in defined:
+                raise ValueError(f"Feature '{c}' not in registry for {view_name}")
+        return fv, pk, cols
+
+    @staticmethod
+    def _feature_refs(features: List[str]) -> Dict[str, Optional[List[str]]]:
+        """"view:feature" / "view" references -> {view: features, or None for all of them}."""
+        requested = {}
+        for ref in features:
+            view_name, _, feature = ref.partition(":")
+            cols = requested.setdefault(view_name, [])
+            if cols is not None:
+                requested[view_name] = None if not feature else cols + [feature]
+        return requested
+
+    def _view_rows(self, fv: dict, pk: str, cols: List[str], keys: List[str]) -> List[tuple]:
+        """
+        Online-store rows (pk first, then cols) of the present keys, through the cache when
+        there is one. The cache holds whole rows (every registered feature) and serves any
+        column subset from them.
+        """
+        if self.cache is None:
+            return self.online.read_rows(fv, pk, cols, keys)
+
+        view_name = fv["name"]
+        defined = [f["name"] for f in fv["features"]]
+        keys = list(dict.fromkeys(str(k) for k in keys))
+        found, missing, version = self.cache.get_many(view_name, keys)
+        if missing:
+            fetched = {str(r[0]): r for r in self.online.read_rows(fv, pk, defined, missing)}
+            loaded = {k: fetched.get(k) for k in missing}
+            self.cache.put_many(view_name, loaded, version)
+            found.update(loaded)
+        take = [0] + [1 + defined.index(c) for c in cols]
+        return [tuple(row[i] for i in take) for row in (found[k] for k in keys) if row is not None]
+
+    def _history(self, fv: dict) -> tuple:
+        """(history table, snapshot timestamp column, ttl) of a view."""
+        hist = fv.get("history")
+        if not hist:
+            raise ValueError(f"Feature view {fv['name']} has no history table for point-in-time reads")
+        return hist["table"], hist["timestamp_field"], pd.Timedelta(hist["ttl"])
+
+    def _snapshot_rows(self, fv: dict, pk: str, cols: List[str], keys: List[str], as_of_ts: str) -> List[tuple]:
+        """Rows (pk first, then cols) of each key's latest snapshot in (as_of_ts - ttl, as_of_ts]."""
+        table, ts_field, ttl = self._history(fv)
+        as_of = pd.Timestamp(as_of_ts)
+        as_of = as_of.tz_localize("UTC") if as_of.tzinfo is None else as_of.tz_convert("UTC")
+        bounds = tuple(t.strftime("%Y-%m-%dT%H:%M:%SZ") for t in (as_of, as_of - ttl))
+        rows = self.warehouse.fetch_rows(
+            table, pk, [ts_field] + cols, [str(k) for k in keys],
+            f" AND {ts_field} <= ? AND {ts_field} > ?", bounds,
+        )
+        latest = {}
+        for row in sorted(rows, key=lambda r: r[1]):
+            latest[row[0]] = (row[0],) + row[2:]
+        return list(latest.values())
+
     def get_features(
         self,
         view_name: str,
@@ -43,42 +146,20 @@ class FeatureStore:
         - view_name: "user_features_v1" or "item_features_v1"
         - entity_ids: list of user_id or item_id
         - features: subset of feature columns; if None, returns all defined in registry
-        - as_of_ts: optional ISO timestamp for "as of" filtering (best-effort, uses last_event_ts when present)
+        - as_of_ts: optional ISO timestamp; values come from the view's latest history snapshot
+          taken at or before it (within the view's history ttl) instead of the current table
         """
-        fv = self._get_view(view_name)
-        table = fv["table"]
-        entity_type = fv["entity"]
-        pk = self.registry["entities"][entity_type]["primary_key"]
-
-        # Determine columns to return
-        defined = [f["name"] for f in fv["features"]]
-        cols = defined if features is None else features
-
-        # Always include primary key
-        if pk not in cols:
-            cols = [pk] + cols
-
-        # Best-effort: ensure requested columns exist in registry definition
-        for c in cols:
-            if c != pk and c not in defined:
-                raise ValueError(f"Feature '{c}' not in registry for {view_name}")
-
-        placeholders = ",".join(["?"] * len(entity_ids))
-        sql = f"SELECT {', '.join(cols)} FROM {table} WHERE {pk} IN ({placeholders})"
+        fv, pk, feature_cols = self._view_columns(view_name, features)
 
-        # Optional as-of filtering if last_event_ts exists
-        # (This is a simplified approach for the assignment.)
-        if as_of_ts and "last_event_ts" in cols:
-            sql += " AND last_event_ts <= ?"
-            params = entity_ids + [as_of_ts]
+        if as_of_ts:
+            rows = self._snapshot_rows(fv, pk, feature_cols, list(entity_ids), as_of_ts)
         else:
-            params = entity_ids
+            rows = self._view_rows(fv, pk, feature_cols, list(entity_ids))
 
-        conn = self._connect()
-        try:
-            df = pd.read_sql_query(sql, conn, params=params)
-        finally:
-            conn.close()
+        # Rows in entity_ids order (first occurrence), whatever order SQLite returned them in
+        by_key = {str(r[0]): r for r in rows}
+        ordered = [by_key[k] for k in dict.fromkeys(str(e) for e in entity_ids) if k in by_key]
+        df = pd.DataFrame.from_records(ordered, columns=[pk] + feature_cols)
 
         # Ensure all requested entity_ids are represented (left-join behavior)
         # If some are missing, add rows with NaNs
@@ -90,3 +171,246 @@ class FeatureStore:
             df = pd.concat([df, missing_rows], ignore_index=True, sort=False)
 
         return df
+
+    def get_online_features(
+        self,
+        entity_rows: Dict[str, object],
+        features: List[str],
+        as_numpy: bool = False,
+    ) -> Union[pd.DataFrame, Dict[str, np.ndarray]]:
+        """
+        Features of several views for a batch of entity rows, e.g. one user and its candidates:
+
+            fs.get_online_features(
+                {"user_id": "U1", "item_id": candidate_ids},
+                ["user_features_v1:events_7d", "item_features_v1"],
+            )
+
+        - entity_rows: primary key -> list of ids (all the same length; a scalar is repeated)
+        - features: "view:feature" references, or a view name for all of its features
+        - as_numpy: return {column: array} instead of a DataFrame
+
+        Rows stay in entity_rows order. Columns are the primary keys followed by
+        "<view>__<feature>"; entities missing from a view get NaN. Each view is read once for
+        the distinct keys of the batch.
+        """
+        lengths = {len(v) for v in entity_rows.values() if not isinstance(v, str) and np.ndim(v)}
+        if len(lengths) > 1:
+            raise ValueError(f"entity_rows columns differ in length: {sorted(lengths)}")
+        n = lengths.pop() if lengths else 1
+        keys = {
+            pk: np.full(n, str(v), dtype=object) if isinstance(v, str) or not np.ndim(v)
+            else np.asarray(v, dtype=object).astype(str)
+            for pk, v in entity_rows.items()
+        }
+
+        requested = self._feature_refs(features)
+        out = pd.DataFrame(keys)
+        for view_name, cols in requested.items():
+            fv, pk, cols = self._view_columns(view_name, cols)
+            if pk not in keys:
+                raise ValueError(f"{view_name} needs entity key '{pk}' in entity_rows")
+            wanted = pd.unique(keys[pk])
+            rows = self._view_rows(fv, pk, cols, wanted.tolist())
+            block = pd.DataFrame.from_records(rows, columns=[pk] + cols).set_index(pk)
+            missing = len(wanted) - len(block)
+            if missing:
+                logger.warning(f"Missing entities in {view_name}: {missing} of {len(wanted)}")
+            block = block.reindex(keys[pk])
+            for c in cols:
+                out[f"{view_name}__{c}"] = block[c].to_numpy()
+
+        if as_numpy:
+            return {c: out[c].to_numpy() for c in out.columns}
+        return out
+
+    def get_historical_features(
+        self,
+        entity_df: pd.DataFrame,
+        features: List[str],
+        timestamp_col: str = "event_ts",
+    ) -> pd.DataFrame:
+        """
+        Point-in-time correct features for training: each row of entity_df (primary keys plus
+        timestamp_col) gets the values of the latest history snapshot taken at or before its
+        timestamp, within the view's ttl; otherwise NaN. Same feature references and
+        "<view>__<feature>" columns as get_online_features; rows keep entity_df order.
+
+        Each view's history is read once by time range (not by key) and joined with one
+        vectorized as-of merge, so millions of rows are fine.
+        """
+        ts = pd.to_datetime(entity_df[timestamp_col], utc=True, errors="coerce")
+        out = entity_df.copy()
+        if ts.isna().all():
+            lo = hi = None
+        else:
+            lo, hi = ts.min(), ts.max()
+
+        requested = self._feature_refs(features)
+        for view_name, cols in requested.items():
+            fv, pk, cols = self._view_columns(view_name, cols)
+            if pk not in entity_df.columns:
+                raise ValueError(f"{view_name} needs entity key '{pk}' in entity_df")
+            table, ts_field, ttl = self._history(fv)
+            if lo is None:
+                snapshots = pd.DataFrame(columns=[pk, ts_field] + cols)
+            else:
+                snapshots = pd.read_sql_query(
+                    f"SELECT {', '.join([pk, ts_field] + cols)} FROM {table} "
+                    f"WHERE {ts_field} > ? AND {ts_field} <= ?",
+                    self._connect(),
+                    params=[(lo - ttl).strftime("%Y-%m-%dT%H:%M:%SZ"), hi.strftime("%Y-%m-%dT%H:%M:%SZ")],
+                )
+                snapshots = snapshots[snapshots[pk].isin(entity_df[pk].astype(str).unique())]
+            joined = point_in_time_join(
+                pd.DataFrame({pk: entity_df[pk].to_numpy(), "_ts": ts.to_numpy()}),
+                snapshots, pk, "_ts", cols, snapshot_ts_col=ts_field, tolerance=ttl,
+            )
+            for c in cols:
+                out[f"{view_name}__{c}"] = joined[c].to_numpy()
+        return out
+
+    def _get_service(self, name: str) -> Optional[dict]:
+        for svc in self.registry.get("feature_services", []):
+            if svc["name"] == name:
+                return svc
+        return None
+
+    def _service_query(self, svc: dict, features: Optional[List[str]]) -> tuple:
+        """
+        (SELECT statement, Arrow schema, entity keys) for a feature service: the distinct key
+        combinations of its entity_table (in the warehouse) left-joined to each of its views,
+        with "<view>__<feature>" columns.
+        """
+        name = svc["name"]
+        refs = self._feature_refs(features if features is not None else svc["features"])
+        unknown = [v for v in refs if v not in svc["features"]]
+        if unknown:
+            raise ValueError(f"Feature views {unknown} are not part of feature service {name}")
+        views = [(v,) + self._view_columns(v, cols) for v, cols in refs.items()]
+        keys = list(dict.fromkeys(pk for _, _, pk, _ in views))
+        select = [f"e.{pk}" for pk in keys]
+        fields = [pa.field(pk, pa.string()) for pk in keys]
+        joins = []
+        for i, (view_name, fv, pk, cols) in enumerate(views):
+            types = {f["name"]: f["type"] for f in fv["features"]}
+            select += [f"v{i}.{c} AS {view_name}__{c}" for c in cols]
+            fields += [pa.field(f"{view_name}__{c}", ARROW_TYPES[types[c]]) for c in cols]
+            joins.append(f"LEFT JOIN {fv['table']} v{i} ON v{i}.{pk} = e.{pk}")
+        sql = (
+            f"SELECT {', '.join(select)} "
+            f"FROM (SELECT DISTINCT {', '.join(keys)} FROM {svc['entity_table']}) e "
+            + " ".join(joins)
+        )
+        return sql, pa.schema(fields), keys
+
+    def offline_schema(self, name: str, features: Optional[List[str]] = None) -> pa.Schema:
+        """Schema of the batches iter_offline_batches(name, features) yields."""
+        svc = self._get_service(name)
+        if svc is not None:
+            return self._service_query(svc, features)[1]
+        return view_schema(*self._view_columns(name, features))
+
+    def iter_offline_batches(
+        self,
+        name: str,
+        features: Optional[List[str]] = None,
+        entity_ids: Optional[Dict[str, List[str]]] = None,
+        batch_size: int = EXPORT_BATCH_ROWS,
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Stream a whole feature view or feature service as Arrow record batches.
+        - features: feature names of a view, or "view:feature" / "view" references of a service
+        - entity_ids: optional {primary key: ids} filters
+
+        Views stream from the offline store; services are one SQL join over the warehouse, read
+        with fetchmany and converted to Arrow a batch at a time. Memory is bounded by batch_size.
+        """
+        entity_ids = entity_ids or {}
+        svc = self._get_service(name)
+        if svc is None:
+            fv, pk, cols = self._view_columns(name, features)
+            extra = [k for k in entity_ids if k != pk]
+            if extra:
+                raise ValueError(f"{extra} are not entity keys of {name}: {[pk]}")
+            yield from self.offline.iter_batches(fv, pk, cols, entity_ids.get(pk), batch_size)
+            return
+
+        sql, schema, keys = self._service_query(svc, features)
+        extra = [k for k in entity_ids if k not in keys]
+        if extra:
+            raise ValueError(f"{extra} are not entity keys of {name}: {keys}")
+        filters = {f"e.{pk}": ids for pk, ids in entity_ids.items()}
+        yield from self.warehouse.iter_query(sql, schema, filters, batch_size)
+
+    def read_offline_table(self, name: str, features: Optional[List[str]] = None, **kwargs) -> pa.Table:
+        return pa.Table.from_batches(
+            list(self.iter_offline_batches(name, features, **kwargs)),
+            schema=self.offline_schema(name, features),
+        )
+
+    def export_parquet(
+        self,
+        name: str,
+        out_dir: Path,
+        features: Optional[List[str]] = None,
+        entity_ids: Optional[Dict[str, List[str]]] = None,
+        rows_per_file: int = EXPORT_ROWS_PER_FILE,
+        compression: str = PARQUET_COMPRESSION,
+    ) -> List[Path]:
+        """
+        Write a view or service as out_dir/part-00000.parquet, part-00001.parquet, ... of at most
+        rows_per_file rows each (one row group per batch). Files are written to a temp dir that
+        replaces out_dir at the end, so readers never see a partial export.
+        """
+        out_dir = Path(out_dir)
+        tmp_dir = out_dir.with_name(f".{out_dir.name}.tmp")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir(parents=True)
+
+        schema = self.offline_schema(name, features)
+        names, writer, in_file, rows = [], None, 0, 0
+        try:
+            for batch in self.iter_offline_batches(name, features, entity_ids):
+                if writer is None or in_file + batch.num_rows > rows_per_file:
+                    if writer is not None:
+                        writer.close()
+                    names.append(f"part-{len(names):05d}.parquet")
+                    writer = pq.ParquetWriter(tmp_dir / names[-1], schema, compression=compression)
+                    in_file = 0
+                writer.write_batch(batch)
+                in_file += batch.num_rows
+                rows += batch.num_rows
+            if writer is None:  # empty export: one file with the schema
+                names.append("part-00000.parquet")
+                pq.write_table(schema.empty_table(), tmp_dir / names[-1], compression=compression)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        shutil.rmtree(out_dir, ignore_errors=True)
+        os.replace(tmp_dir, out_dir)
+        logger.info(f"Exported {name}: {rows} rows in {len(names)} parquet files -> {out_dir}")
+        return [out_dir / n for n in names]
+
+    def materialize(self, tables: Dict[str, pd.DataFrame]) -> List[str]:
+        """
+        Write freshly built feature tables ({warehouse table: frame}) into the online and offline
+        stores of the views defined on them. Stores that are the warehouse itself are skipped
+        (build_features already wrote the tables there). Returns the views written.
+        """
+        stores = [b for b in (self.online, self.offline) if b is not self.warehouse]
+        stores = list({id(b): b for b in stores}.values())
+        written = []
+        for fv in self.registry.get("feature_views", []):
+            if fv["table"] not in tables or not stores:
+                continue
+            pk = self.registry["entities"][fv["entity"]]["primary_key"]
+            for store in stores:
+                store.write_view(fv, pk, tables[fv["table"]])
+            written.append(fv["name"])
+            logger.info(
+                f"Materialized {fv['name']}: {len(tables[fv['table']])} rows -> "
+                f"{', '.join(type(b).__name__ for b in stores)}"
+            )
+        return written
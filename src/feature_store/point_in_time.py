@@ -0,0 +1,63 @@
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Snapshot timestamp column of the feature history tables
+SNAPSHOT_TS_COL = "feature_ts"
+
+
+def _utc_ns(ts: pd.Series) -> np.ndarray:
+    """int64 UTC nanoseconds (NaT -> int64 min) from datetimes or ISO strings."""
+    values = pd.to_datetime(ts, utc=True, errors="coerce").dt.tz_localize(None)
+    return values.to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def point_in_time_join(
+    entities: pd.DataFrame,
+    snapshots: pd.DataFrame,
+    key: str,
+    ts_col: str,
+    features: Optional[List[str]] = None,
+    snapshot_ts_col: str = SNAPSHOT_TS_COL,
+    tolerance: Optional[pd.Timedelta] = None,
+    suffixes: Tuple[str, str] = ("_x", "_y"),
+) -> pd.DataFrame:
+    """
+    Left as-of join: every entity row gets the feature values of the latest snapshot of its
+    key taken at or before its timestamp (and less than tolerance before it); otherwise
+    NaN. Rows keep their order and index; clashing column names get suffixes as in merge.
+
+    Snapshots must not contain events at or after their own timestamp (a snapshot at D covers
+    events before D), so joining at equal timestamps does not leak the row's own event.
+    One merge_asof over factorized keys, sorted by time, for the whole frame.
+    """
+    features = features or [c for c in snapshots.columns if c not in (key, snapshot_ts_col)]
+    n = len(entities)
+
+    codes, _ = pd.factorize(pd.concat([entities[key], snapshots[key]], ignore_index=True).astype(str))
+    left = pd.DataFrame({
+        "_key": codes[:n],
+        "_ts": _utc_ns(entities[ts_col]),
+        "_pos": np.arange(n),
+    })
+    left = left[left["_ts"] != np.iinfo(np.int64).min]
+    right = pd.DataFrame({"_key": codes[n:], "_ts": _utc_ns(snapshots[snapshot_ts_col])})
+    for c in features:
+        right[c] = snapshots[c].to_numpy()
+
+    merged = pd.merge_asof(
+        left.sort_values("_ts", kind="mergesort"),
+        right.sort_values("_ts", kind="mergesort"),
+        on="_ts",
+        by="_key",
+        direction="backward",
+        tolerance=None if tolerance is None else int(pd.Timedelta(tolerance).value) - 1,
+    )
+    aligned = merged.set_index("_pos")[features].reindex(np.arange(n))
+
+    clash = [c for c in features if c in entities.columns]
+    out = entities.rename(columns={c: c + suffixes[0] for c in clash})
+    for c in features:
+        out[c + suffixes[1] if c in clash else c] = aligned[c].to_numpy()
+    return out
@@ -1,6 +1,16 @@
+import hashlib
+import json
+import os
+import time
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.parquet as pq
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import Optional, Tuple
 from src.common.logger import get_logger
 
 logger = get_logger("ingest_csv")
@@ -8,37 +18,206 @@ logger = get_logger("ingest_csv")
 INCOMING_DIR = Path("data/incoming")
 RAW_BASE = Path("data/raw/interactions/source=csv")
 
+# Explicit types for the expected columns (see validate_interactions.EXPECTED_SCHEMA);
+# ids stay strings even when they look numeric. Other columns are inferred.
+# price is read as text and cast per batch (see _cast_price): one unparseable cell must not
+# abort the whole file.
+CSV_COLUMN_TYPES = {
+    "user_id": pa.string(),
+    "item_id": pa.string(),
+    "event_type": pa.string(),
+    "timestamp": pa.string(),
+    "price": pa.string(),
+}
+PRICE_TYPE = pa.float64()
+PRICE_NULL_VALUES = pa.array(pacsv.ConvertOptions().null_values)  # read as null, as a float column would
+
+# Streaming knobs: CSV bytes parsed per block, parquet codec and rows per row group
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+PARQUET_COMPRESSION = "snappy"
+ROW_GROUP_SIZE = 250_000
+
+# Files already landed, keyed by content hash (underscore prefix: skipped by dataset readers)
+MANIFEST_PATH = RAW_BASE / "_ingest_manifest.json"
+INGEST_WORKERS = os.cpu_count() or 1
+
 def _partitions_now_utc():
     now = datetime.now(timezone.utc)
     return now.strftime("%Y-%m-%d"), now.strftime("%H")
 
-def ingest_file(csv_path: Path) -> int:
-    df = pd.read_csv(csv_path)
-    rows = len(df)
-    logger.info(f"Loaded {rows} rows from {csv_path}")
+def file_sha256(path: Path, chunk_size: int = 8 * 1024 * 1024) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
 
-    date_part, hour_part = _partitions_now_utc()
-    out_dir = RAW_BASE / f"date={date_part}" / f"hour={hour_part}"
-    out_dir.mkdir(parents=True, exist_ok=True)
+def load_manifest() -> dict:
+    if not MANIFEST_PATH.exists():
+        return {}
+    return json.loads(MANIFEST_PATH.read_text(encoding="utf-8"))
+
+def save_manifest(manifest: dict):
+    MANIFEST_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = MANIFEST_PATH.with_name(f".{MANIFEST_PATH.name}.tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, MANIFEST_PATH)
 
+def _cast_price(batch: pa.RecordBatch) -> Tuple[pa.RecordBatch, int]:
+    """
+    The batch with price cast to PRICE_TYPE, and the number of cells that are not a number.
+    Those become null, so validation reports them as missing prices.
+    """
+    i = batch.schema.get_field_index("price")
+    if i < 0:
+        return batch, 0
+    text = batch.column(i)
+    text = pc.if_else(pc.is_in(text, value_set=PRICE_NULL_VALUES), pa.scalar(None, pa.string()), text)
+    try:
+        price = pc.cast(text, PRICE_TYPE)
+        n_bad = 0
+    except pa.ArrowInvalid:
+        raw = text.to_pandas()
+        values = pd.to_numeric(raw, errors="coerce")
+        n_bad = int((values.isna() & raw.notna()).sum())
+        price = pa.array(values, type=PRICE_TYPE, from_pandas=True)
+    return batch.set_column(i, batch.schema.field(i).with_type(PRICE_TYPE), price), n_bad
+
+def ingest_file(
+    csv_path: Path,
+    out_dir: Optional[Path] = None,
+    compression: str = PARQUET_COMPRESSION,
+    row_group_size: int = ROW_GROUP_SIZE,
+    block_size: int = READ_BLOCK_SIZE,
+) -> Tuple[int, int]:
+    """
+    Stream a CSV into a raw parquet partition without loading the whole file:
+    blocks are parsed with the explicit column types and written out row group by row group.
+    The parquet is written to a hidden temp file and renamed into place, so readers of the
+    hour= partition never see a partial file.
+    Returns (rows, price cells that were not a number and were landed as null).
+    """
+    t0 = time.perf_counter()
+    in_bytes = csv_path.stat().st_size
+
+    if out_dir is None:
+        date_part, hour_part = _partitions_now_utc()
+        out_dir = RAW_BASE / f"date={date_part}" / f"hour={hour_part}"
+    out_dir.mkdir(parents=True, exist_ok=True)
     out_path = out_dir / f"{csv_path.stem}.parquet"
-    df.to_parquet(out_path, index=False)
-    logger.info(f"Wrote raw parquet to {out_path}")
-    return rows
+    tmp_path = out_dir / f".{csv_path.stem}.parquet.{os.getpid()}.tmp"
+
+    reader = pacsv.open_csv(
+        csv_path,
+        read_options=pacsv.ReadOptions(block_size=block_size),
+        convert_options=pacsv.ConvertOptions(column_types=CSV_COLUMN_TYPES),
+    )
+    schema = reader.schema
+    if "price" in schema.names:
+        i = schema.get_field_index("price")
+        schema = schema.set(i, schema.field(i).with_type(PRICE_TYPE))
+
+    rows, bad_prices = 0, 0
+    pending, pending_rows = [], 0
+    try:
+        with pq.ParquetWriter(tmp_path, schema, compression=compression) as writer:
+            for batch in reader:
+                batch, n_bad = _cast_price(batch)
+                bad_prices += n_bad
+                pending.append(batch)
+                pending_rows += batch.num_rows
+                rows += batch.num_rows
+                if pending_rows >= row_group_size:
+                    # Flush whole row groups, carry the remainder into the next one
+                    table = pa.Table.from_batches(pending, schema=schema)
+                    full = (pending_rows // row_group_size) * row_group_size
+                    writer.write_table(table.slice(0, full), row_group_size=row_group_size)
+                    rest = table.slice(full)
+                    pending, pending_rows = rest.to_batches(), rest.num_rows
+            if pending_rows or rows == 0:
+                writer.write_table(pa.Table.from_batches(pending, schema=schema), row_group_size=row_group_size)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    secs = max(time.perf_counter() - t0, 1e-9)
+    logger.info(
+        f"Ingested {rows} rows from {csv_path} to {out_path} in {secs:.2f}s "
+        f"({rows / secs:,.0f} rows/s, {in_bytes / secs / 1e6:,.1f} MB/s)"
+    )
+    if bad_prices:
+        logger.warning(f"{csv_path.name}: {bad_prices} price cells are not a number (landed as null)")
+    return rows, bad_prices
 
-def main():
-    INCOMING_DIR.mkdir(parents=True, exist_ok=True)
-    files = sorted(INCOMING_DIR.glob("*.csv"))
+def _ingest_task(csv_path: Path, out_dir: Path) -> dict:
+    """Worker entry point (runs in a child process)."""
+    rows, bad_prices = ingest_file(csv_path, out_dir=out_dir)
+    return {
+        "rows": rows,
+        "bad_price_cells": bad_prices,
+        "output": str(out_dir / f"{csv_path.stem}.parquet"),
+        "ingested_at_utc": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+    }
+
+def main(workers: int = INGEST_WORKERS, incoming_dir: Path = INCOMING_DIR):
+    incoming_dir.mkdir(parents=True, exist_ok=True)
+    files = sorted(incoming_dir.glob("*.csv"))
 
     if not files:
-        logger.info("No CSV files found in data/incoming. Nothing to ingest.")
+        logger.info(f"No CSV files found in {incoming_dir}. Nothing to ingest.")
         return
 
+    manifest = load_manifest()
+
+    # Fast path: same name, size and mtime as a manifest entry -> skip without hashing
+    seen = {(e["file"], e["size"], e["mtime"]) for e in manifest.values()}
+    candidates = []
     for f in files:
-        try:
-            ingest_file(f)
-        except Exception as e:
-            logger.exception(f"FAILED ingest for {f.name}: {e}")
+        st = f.stat()
+        if (f.name, st.st_size, st.st_mtime) in seen:
+            logger.info(f"Skipping {f.name}: already ingested (size/mtime match)")
+        else:
+            candidates.append((f, st))
+
+    # Content hashes (hashlib releases the GIL, so threads hash files in parallel)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as hasher:
+        hashes = list(hasher.map(file_sha256, [f for f, _ in candidates]))
+
+    todo = {}
+    for (f, st), sha in zip(candidates, hashes):
+        if sha in manifest or sha in todo:
+            logger.info(f"Skipping {f.name}: content already ingested (sha256 match)")
+            continue
+        todo[sha] = (f, {"file": f.name, "size": st.st_size, "mtime": st.st_mtime})
+    if not todo:
+        return
+
+    # One partition for the whole run, so parallel workers land in the same hour folder
+    date_part, hour_part = _partitions_now_utc()
+    out_dir = RAW_BASE / f"date={date_part}" / f"hour={hour_part}"
+
+    def _record(sha: str, result: dict):
+        f, entry = todo[sha]
+        manifest[sha] = {**entry, **result}
+        save_manifest(manifest)
+
+    if workers <= 1 or len(todo) == 1:
+        for sha, (f, _) in todo.items():
+            try:
+                _record(sha, _ingest_task(f, out_dir))
+            except Exception as e:
+                logger.exception(f"FAILED ingest for {f.name}: {e}")
+        return
+
+    with ProcessPoolExecutor(max_workers=min(workers, len(todo))) as pool:
+        futures = {pool.submit(_ingest_task, f, out_dir): sha for sha, (f, _) in todo.items()}
+        for fut in as_completed(futures):
+            sha = futures[fut]
+            try:
+                _record(sha, fut.result())
+            except Exception as e:
+                logger.exception(f"FAILED ingest for {todo[sha][0].name}: {e}")
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,14 @@
+import asyncio
 import json
-import time
-import requests
+import math
+import os
+import random
+import httpx
+import pyarrow as pa
+import pyarrow.parquet as pq
 from datetime import datetime, timezone
 from pathlib import Path
+from typing import List, Optional, Tuple
 from src.common.logger import get_logger
 
 logger = get_logger("ingest_api")
@@ -10,39 +16,196 @@ logger = get_logger("ingest_api")
 API_URL = "https://fakestoreapi.com/products"
 RAW_BASE = Path("data/raw/products/source=api")
 
+# ETag / Last-Modified per URL from the last successful fetch (underscore: ignored by readers)
+HTTP_CACHE_PATH = RAW_BASE / "_http_cache.json"
+
+# Pagination: ?page=N&limit=PAGE_SIZE; a short or empty page, or a 404 past page 1, ends the catalog.
+# If the server sends X-Total-Count, all remaining pages are requested at once.
+PAGE_PARAM, LIMIT_PARAM = "page", "limit"
+PAGE_SIZE = 100
+MAX_CONCURRENCY = 8
+MAX_PAGES = 10_000  # a catalog past this many pages fails instead of paging forever
+
+MAX_RETRIES = 5
+BACKOFF_BASE_SEC = 0.5
+BACKOFF_MAX_SEC = 30.0
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+TIMEOUT_SEC = 15
+
+OUTPUT_FORMATS = ("jsonl", "parquet")
+OUTPUT_FORMAT = "jsonl"
+
 def _partitions_now_utc():
     now = datetime.now(timezone.utc)
     return now.strftime("%Y-%m-%d"), now.strftime("%H")
 
-def fetch_with_retries(url: str, max_retries: int = 3, timeout_sec: int = 15) -> list:
-    for attempt in range(1, max_retries + 1):
-        try:
-            r = requests.get(url, timeout=timeout_sec)
-            if r.status_code == 200:
-                return r.json()
+def _backoff_sec(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(BACKOFF_MAX_SEC, BACKOFF_BASE_SEC * 2 ** (attempt - 1)))
+
+def _records(payload) -> list:
+    # FakeStore returns a bare list; paginated APIs often wrap it
+    if isinstance(payload, list):
+        return payload
+    for key in ("items", "data", "products", "results"):
+        if isinstance(payload.get(key), list):
+            return payload[key]
+    raise ValueError(f"Unrecognized catalog payload with keys: {list(payload)[:10]}")
 
-            logger.warning(f"Attempt {attempt}: status={r.status_code}, body={r.text[:200]}")
-        except Exception as e:
-            logger.warning(f"Attempt {attempt} exception: {e}")
+async def get_with_retries(
+    client: httpx.AsyncClient,
+    sem: asyncio.Semaphore,
+    url: str,
+    params: dict,
+    headers: Optional[dict] = None,
+) -> httpx.Response:
+    async with sem:
+        for attempt in range(1, MAX_RETRIES + 1):
+            try:
+                r = await client.get(url, params=params, headers=headers)
+                if r.status_code in (200, 304):
+                    return r
+                if r.status_code not in RETRY_STATUSES:
+                    r.raise_for_status()
+                logger.warning(f"Attempt {attempt} {params}: status={r.status_code}, body={r.text[:200]}")
+            except httpx.TransportError as e:
+                logger.warning(f"Attempt {attempt} {params} exception: {e}")
+
+            if attempt < MAX_RETRIES:
+                await asyncio.sleep(_backoff_sec(attempt))
+
+    raise RuntimeError(f"API fetch failed after {MAX_RETRIES} retries: {url} {params}")
+
+async def get_page_or_end(client: httpx.AsyncClient, sem: asyncio.Semaphore, url: str, params: dict) -> Optional[list]:
+    """Records of a page past the first, or None when the server answers 404 (past the end)."""
+    try:
+        r = await get_with_retries(client, sem, url, params)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            return None
+        raise
+    return _records(r.json())
 
-        time.sleep(2 * attempt)  # simple backoff
+async def fetch_catalog(url: str, validators: dict, page_size: int = PAGE_SIZE) -> Tuple[Optional[list], dict]:
+    """
+    Fetch every catalog page over one pooled keep-alive client with at most MAX_CONCURRENCY
+    requests in flight. The first page is sent with If-None-Match / If-Modified-Since; a 304
+    returns (None, validators) so an unchanged catalog is skipped.
+    """
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
 
-    raise RuntimeError(f"API fetch failed after {max_retries} retries: {url}")
+    def page_params(page: int) -> dict:
+        return {PAGE_PARAM: page, LIMIT_PARAM: page_size}
 
-def main():
-    date_part, hour_part = _partitions_now_utc()
-    out_dir = RAW_BASE / f"date={date_part}" / f"hour={hour_part}"
+    sem = asyncio.Semaphore(MAX_CONCURRENCY)
+    limits = httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY)
+    async with httpx.AsyncClient(limits=limits, timeout=TIMEOUT_SEC) as client:
+        first = await get_with_retries(client, sem, url, page_params(1), headers)
+        if first.status_code == 304:
+            return None, validators
+
+        new_validators = {
+            "etag": first.headers.get("ETag"),
+            "last_modified": first.headers.get("Last-Modified"),
+        }
+        records = _records(first.json())
+        if len(records) < page_size:
+            return records, new_validators
+
+        total = first.headers.get("X-Total-Count")
+        if total is not None:
+            last_page = math.ceil(int(total) / page_size)
+            if last_page > MAX_PAGES:
+                raise RuntimeError(f"Catalog has {last_page} pages (X-Total-Count={total}), over MAX_PAGES={MAX_PAGES}")
+            pages = await asyncio.gather(*[
+                get_with_retries(client, sem, url, page_params(p)) for p in range(2, last_page + 1)
+            ])
+            for r in pages:
+                records.extend(_records(r.json()))
+            return records, new_validators
+
+        # Unknown page count: fetch windows of pages concurrently until a short, empty or missing
+        # page shows up. A page equal to the previous one means the server ignores the page
+        # parameter, so it ends the catalog too.
+        previous = records
+        page = 2
+        while True:
+            if page > MAX_PAGES:
+                raise RuntimeError(f"Catalog still has full pages after MAX_PAGES={MAX_PAGES}: {url}")
+            window = await asyncio.gather(*[
+                get_page_or_end(client, sem, url, page_params(p))
+                for p in range(page, min(page + MAX_CONCURRENCY, MAX_PAGES + 1))
+            ])
+            for p, chunk in enumerate(window, start=page):
+                if chunk is None:
+                    return records, new_validators
+                if chunk == previous:
+                    logger.warning(f"Page {p} repeats page {p - 1}; the server seems to ignore {PAGE_PARAM!r}")
+                    return records, new_validators
+                records.extend(chunk)
+                if len(chunk) < page_size:
+                    return records, new_validators
+                previous = chunk
+            page += len(window)
+
+def load_http_cache() -> dict:
+    if not HTTP_CACHE_PATH.exists():
+        return {}
+    return json.loads(HTTP_CACHE_PATH.read_text(encoding="utf-8"))
+
+def save_http_cache(cache: dict):
+    HTTP_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = HTTP_CACHE_PATH.with_name(f".{HTTP_CACHE_PATH.name}.tmp")
+    tmp.write_text(json.dumps(cache, indent=2), encoding="utf-8")
+    os.replace(tmp, HTTP_CACHE_PATH)
+
+def write_products(records: List[dict], out_dir: Path, output_format: str) -> Path:
+    """Compact JSON lines or parquet, written to a temp file and renamed into place."""
     out_dir.mkdir(parents=True, exist_ok=True)
+    out_path = out_dir / f"products.{output_format}"
+    tmp_path = out_dir / f".{out_path.name}.tmp"
+    if output_format == "jsonl":
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for rec in records:
+                f.write(json.dumps(rec, ensure_ascii=False, separators=(",", ":")))
+                f.write("\n")
+    else:
+        pq.write_table(pa.Table.from_pylist(records), tmp_path)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+def main(url: str = API_URL, output_format: str = OUTPUT_FORMAT, strict: bool = False) -> Optional[Path]:
+    """
+    Fetch the catalog; returns the file written, or None when unchanged or failed.
+    strict re-raises failures instead of logging them (the pipeline must not mistake a failed
+    fetch for an unchanged catalog).
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output_format {output_format!r}; expected one of {OUTPUT_FORMATS}")
 
     try:
-        data = fetch_with_retries(API_URL)
-        out_path = out_dir / "products.json"
-        with open(out_path, "w", encoding="utf-8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        cache = load_http_cache()
+        data, validators = asyncio.run(fetch_catalog(url, cache.get(url, {})))
+        if data is None:
+            logger.info(f"Catalog unchanged since last fetch (HTTP 304): {url}")
+            return
+
+        date_part, hour_part = _partitions_now_utc()
+        out_dir = RAW_BASE / f"date={date_part}" / f"hour={hour_part}"
+        out_path = write_products(data, out_dir, output_format)
 
+        cache[url] = validators
+        save_http_cache(cache)
         logger.info(f"Fetched {len(data)} products and saved to {out_path}")
+        return out_path
     except Exception as e:
         logger.exception(f"FAILED API ingestion: {e}")
+        if strict:
+            raise
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,140 @@
+"""
+Startup time and memory of N serving processes: joblib pickle vs memory-mapped arrays.
+
+    python -m src.modeling.bench_model_loading             # 4 workers, 50k items
+    python -m src.modeling.bench_model_loading 8 200000    # workers, items
+
+Each worker is a fresh interpreter (spawn, like a gunicorn worker without preload). It loads
+the model, builds a Recommender, serves REQUESTS recommendations and then waits while the
+parent reads /proc/<pid>/smaps_rollup (Linux only). RSS counts shared pages in every
+process; PSS splits them between the processes sharing them, so summed PSS is the real
+footprint. A "baseline" run (imports only, no model) is shown for reference.
+"""
+import multiprocessing as mp
+import os
+import queue
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from src.common.logger import get_logger
+from src.modeling.model_artifacts import TOP_N, load_model_arrays, model_index, save_model_arrays
+from src.modeling.serve import Recommender
+
+logger = get_logger("bench_model_loading")
+
+N_WORKERS = 4
+N_ITEMS = 50_000  # the joblib workers hold ~250 MB each at this size
+REQUESTS = 200
+MODES = ("baseline", "joblib", "mmap")
+
+
+def synthetic_model(n_items: int, n_neighbors: int = TOP_N, seed: int = 5) -> dict:
+    """Every item has a full neighbor list, as in a trained model on a dense catalog."""
+    rng = np.random.default_rng(seed)
+    items = [f"P{i:07d}" for i in range(n_items)]
+    nbrs = rng.integers(0, n_items, (n_items, n_neighbors))
+    cnts = -np.sort(-rng.integers(1, 1000, (n_items, n_neighbors)), axis=1)
+    neighbors = {
+        items[i]: [(items[b], int(c)) for b, c in zip(nbrs[i], cnts[i])] for i in range(n_items)
+    }
+    pop = pd.DataFrame({"item_id": items, "popularity": rng.integers(0, 10_000, n_items).astype(float)})
+    return {"popularity": pop.sort_values("popularity", ascending=False), "neighbors": neighbors}
+
+
+def _worker(mode: str, path: str, results, stop):
+    t0 = time.perf_counter()
+    if mode == "joblib":
+        rec = Recommender.from_model(joblib.load(path))
+    elif mode == "mmap":
+        rec = Recommender(load_model_arrays(Path(path), mmap_mode="r"))
+    else:
+        rec = None
+    load_secs = time.perf_counter() - t0
+
+    if rec is not None:
+        rng = np.random.default_rng(os.getpid())
+        for _ in range(REQUESTS):
+            rec.recommend(rec.item_ids[rng.integers(0, len(rec.item_ids), 10)].tolist())
+
+    results.put((os.getpid(), load_secs))
+    stop.wait()
+
+
+def _smaps_kb(pid: int) -> dict:
+    """Rss / Pss in kB from /proc/<pid>/smaps_rollup ({} where unavailable)."""
+    try:
+        lines = Path(f"/proc/{pid}/smaps_rollup").read_text().splitlines()
+    except OSError:
+        return {}
+    out = {}
+    for line in lines:
+        key, _, rest = line.partition(":")
+        if key in ("Rss", "Pss"):
+            out[key] = int(rest.split()[0])
+    return out
+
+
+def run_mode(mode: str, path: Path, workers: int) -> dict:
+    ctx = mp.get_context("spawn")
+    results, stop = ctx.Queue(), ctx.Event()
+    procs = [ctx.Process(target=_worker, args=(mode, str(path), results, stop)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    loads = []
+    while len(loads) < workers:
+        try:
+            loads.append(results.get(timeout=1))
+        except queue.Empty:
+            dead = [p.exitcode for p in procs if p.exitcode not in (None, 0)]
+            if dead:  # e.g. killed by the OOM killer while loading the pickle
+                stop.set()
+                raise RuntimeError(f"{mode}: worker exited with code {dead[0]}")
+    mem = [_smaps_kb(pid) for pid, _ in loads]
+    stop.set()
+    for p in procs:
+        p.join()
+
+    secs = [s for _, s in loads]
+    return {
+        "mode": mode,
+        "load_p50_s": float(np.median(secs)),
+        "load_max_s": max(secs),
+        "rss_mb": sum(m.get("Rss", 0) for m in mem) / 1024 if all(mem) else None,
+        "pss_mb": sum(m.get("Pss", 0) for m in mem) / 1024 if all(mem) else None,
+    }
+
+
+def main(workers: int = N_WORKERS, n_items: int = N_ITEMS):
+    with tempfile.TemporaryDirectory(prefix="bench_model_") as tmp:
+        model = synthetic_model(n_items)
+        pkl_path = Path(tmp) / "recomart_model_bench.pkl"
+        joblib.dump(model, pkl_path)
+        model_dir = save_model_arrays(model_index(model), Path(tmp) / "recomart_model_bench")
+        del model
+        logger.info(
+            f"{n_items:,} items x {TOP_N} neighbors: pickle {pkl_path.stat().st_size / 1e6:,.0f} MB, "
+            f"arrays {sum(f.stat().st_size for f in model_dir.iterdir()) / 1e6:,.0f} MB"
+        )
+
+        for mode in MODES:
+            path = model_dir if mode == "mmap" else pkl_path
+            r = run_mode(mode, path, workers)
+            mem = (
+                f"total RSS {r['rss_mb']:8,.0f} MB  total PSS {r['pss_mb']:8,.0f} MB"
+                if r["rss_mb"] is not None else "memory n/a (no /proc)"
+            )
+            logger.info(
+                f"{mode:<8} workers={workers}  load p50 {r['load_p50_s'] * 1000:9.1f} ms  "
+                f"max {r['load_max_s'] * 1000:9.1f} ms  {mem}"
+            )
+
+
+if __name__ == "__main__":
+    args = [int(a) for a in sys.argv[1:]]
+    main(*args)
@@ -0,0 +1,81 @@
+"""
+Benchmark for neighbor-list construction in training.
+
+    python -m src.modeling.bench_neighbors               # 1M, 10M, 30M co-occurrence rows
+    python -m src.modeling.bench_neighbors 5000000       # custom sizes
+
+Synthetic co-occurrence pairs use categorical item ids (as few distinct strings as a real
+catalog). The previous itertuples/append/sort loop is timed up to LEGACY_MAX_ROWS only and
+its lists (truncated to TOP_N) are checked against the vectorized builder.
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from src.common.logger import get_logger
+from src.modeling.model_artifacts import TOP_N
+from src.modeling.train_recommender import build_neighbor_arrays, neighbor_lists
+
+logger = get_logger("bench_neighbors")
+
+SIZES = [1_000_000, 10_000_000, 30_000_000]
+N_ITEMS = 200_000
+LEGACY_MAX_ROWS = 1_000_000
+
+
+def synthetic_cooccurrence(n_rows: int, seed: int = 3) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    items = pd.Index([f"P{i:07d}" for i in range(N_ITEMS)])
+    a = rng.integers(0, N_ITEMS - 1, n_rows)
+    b = a + 1 + (rng.integers(0, N_ITEMS, n_rows) % (N_ITEMS - 1 - a))
+    counts = rng.zipf(1.8, n_rows).clip(max=10_000)
+    df = pd.DataFrame({
+        "item_id_a": pd.Categorical.from_codes(a, categories=items),
+        "item_id_b": pd.Categorical.from_codes(b, categories=items),
+        "cooc_count_30d": counts,
+    })
+    # Same order as the warehouse table: count desc
+    return df.sort_values("cooc_count_30d", ascending=False, kind="stable", ignore_index=True)
+
+
+def legacy_neighbors(cooc: pd.DataFrame) -> dict:
+    """Previous train_model loop (lists truncated to TOP_N for comparison)."""
+    neighbors = {}
+    for row in cooc.itertuples(index=False):
+        a, b, c = row.item_id_a, row.item_id_b, int(row.cooc_count_30d)
+        neighbors.setdefault(a, []).append((b, c))
+        neighbors.setdefault(b, []).append((a, c))
+    for k in neighbors:
+        neighbors[k].sort(key=lambda x: x[1], reverse=True)
+    return {k: v[:TOP_N] for k, v in neighbors.items()}
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main(sizes=None):
+    sizes = sizes or SIZES
+    for n in sizes:
+        cooc = synthetic_cooccurrence(n)
+        (src, dst, counts), secs = _timed(build_neighbor_arrays, cooc)
+        logger.info(
+            f"arrays  rows={n:>11,}  {secs:8.2f}s  {n / secs:>14,.0f} rows/s  "
+            f"items={len(np.unique(src)):,} edges={len(src):,}"
+        )
+
+        if n <= LEGACY_MAX_ROWS:
+            ref, ref_secs = _timed(legacy_neighbors, cooc)
+            match = ref == neighbor_lists(src, dst, counts)
+            logger.info(
+                f"legacy  rows={n:>11,}  {ref_secs:8.2f}s  {n / ref_secs:>14,.0f} rows/s  "
+                f"speedup={ref_secs / secs:.1f}x  outputs_match={match}"
+            )
+        del cooc, src, dst, counts
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or None)
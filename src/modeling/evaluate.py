@@ -1,23 +1,34 @@
+import math
+import multiprocessing as mp
+import os
 import sqlite3
+import time
+import zlib
 import numpy as np
 import pandas as pd
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+from scipy import sparse
 import mlflow
-import joblib
 
 from src.common.logger import get_logger
 from src.config import WAREHOUSE_DB, MODELS_DIR
+from src.modeling.model_artifacts import (
+    COOC_BOOST, K, MODEL_MMAP_MODE, TOP_N, load_latest_index, load_model_arrays,
+)
 
 logger = get_logger("evaluate")
 
-K = 5
-COOC_BOOST = 0.2  # how much to boost neighbor counts into ranking
+MAX_NEIGHBORS = TOP_N  # neighbors per history item used for boosting
 
-def load_latest_model():
-    models = sorted(MODELS_DIR.glob("recomart_model_*.pkl"))
-    if not models:
-        raise FileNotFoundError("No model found in data/models. Run training first.")
-    return models[-1]
+# Batch evaluation: users scored together in one sparse/dense block
+EVAL_BLOCK_USERS = 2048
+# Candidate cells (users x padded candidates) per dense sub-block: ~32 MB per candidate array
+EVAL_BLOCK_CELLS = 4_000_000
+# Sharded evaluation: users are split by crc32(user_id) into one shard per worker
+EVAL_WORKERS = os.cpu_count() or 1
 
 def load_interactions():
     conn = sqlite3.connect(WAREHOUSE_DB)
@@ -41,7 +52,7 @@ def recommend(model, user_history_items, k=5):
     # Boost items that co-occur with user's history items
     boost = {}
     for it in user_history_items:
-        for nbr, cnt in neighbors.get(it, [])[:50]:
+        for nbr, cnt in neighbors.get(it, [])[:MAX_NEIGHBORS]:
             boost[nbr] = boost.get(nbr, 0) + cnt
 
     if boost:
@@ -78,46 +89,268 @@ def precision_recall_ndcg_at_k(recs, relevant_set, k):
 
     return precision, recall, ndcg
 
-def main():
-    model_path = load_latest_model()
-    model = joblib.load(model_path)
-    logger.info(f"Loaded model: {model_path.name}")
+def user_splits(df: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Sort interactions once by (user_id, event_ts) and cut them into per-user groups.
+    Returns (user_ids, item_ids in sorted order, group starts, group ends) for users with
+    >= 2 events; a user's history is items[start:end-1] and the target is items[end-1].
+    """
+    df = df.sort_values(["user_id", "event_ts"], kind="mergesort", ignore_index=True)
+    codes, users = pd.factorize(df["user_id"])
+    sizes = np.bincount(codes)
+    ends = np.cumsum(sizes)
+    starts = ends - sizes
+    keep = sizes >= 2
+    items = df["item_id"].astype(str).to_numpy(dtype=object)
+    return np.asarray(users, dtype=object)[keep], items, starts[keep], ends[keep]
 
-    df = load_interactions()
+def budget_groups(width: np.ndarray, budget: int) -> List[np.ndarray]:
+    """
+    Split rows into groups of similar width so len(group) * max width in group <= budget
+    (a single row wider than budget gets a group of its own). Returns row positions per group.
+    """
+    order = np.argsort(width, kind="stable")
+    w = width[order]
+    groups = []
+    s = 0
+    while s < len(order):
+        cells = np.arange(1, len(order) - s + 1) * w[s:]
+        e = s + max(1, int(np.searchsorted(cells, budget, side="right")))
+        groups.append(order[s:e])
+        s = e
+    return groups
 
-    # Split: use each user's last event as "context" and any purchases as "relevant"
-    # For tiny data, we keep it extremely simple.
-    users = df["user_id"].unique().tolist()
-    if len(users) == 0:
-        raise ValueError("No interactions found to evaluate.")
+def _score_rows(
+    boost: sparse.csr_matrix,
+    hist_keys: np.ndarray,
+    hist_len: np.ndarray,
+    target: np.ndarray,
+    popularity: np.ndarray,
+    pop_order: np.ndarray,
+    pop_rank: np.ndarray,
+    k: int,
+    cooc_boost: float,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Metrics of one dense sub-block; hist_keys are row * n_items + item of history items."""
+    n_block = boost.shape[0]
+    n_items = len(popularity)
+
+    # Boosted candidates, ragged rows padded to the longest row
+    nnz = np.diff(boost.indptr)
+    width = int(nnz.max(initial=0))
+    b_rows = np.repeat(np.arange(n_block), nnz)
+    b_slot = np.arange(boost.nnz) - np.repeat(boost.indptr[:-1], nnz)
+    b_score = popularity[boost.indices] + cooc_boost * boost.data
+    b_score[np.isin(b_rows.astype(np.int64) * n_items + boost.indices, hist_keys)] = -np.inf
+    boosted_item = np.full((n_block, width), -1, dtype=np.int64)
+    boosted_score = np.full((n_block, width), -np.inf)
+    boosted_item[b_rows, b_slot] = boost.indices
+    boosted_score[b_rows, b_slot] = b_score
+
+    # Popular pool: unboosted score, masked where the item is boosted or in history
+    pool = pop_order[: min(n_items, k + int(hist_len.max(initial=0)))]
+    pool_pos = np.full(n_items, -1, dtype=np.int64)
+    pool_pos[pool] = np.arange(len(pool))
+    pool_score = np.broadcast_to(popularity[pool], (n_block, len(pool))).copy()
+    in_pool = pool_pos[boost.indices] >= 0
+    pool_score[b_rows[in_pool], pool_pos[boost.indices[in_pool]]] = -np.inf
+    h_rows, h_items = hist_keys // n_items, hist_keys % n_items
+    in_pool = pool_pos[h_items] >= 0
+    pool_score[h_rows[in_pool], pool_pos[h_items[in_pool]]] = -np.inf
+
+    cand_item = np.hstack([boosted_item, np.broadcast_to(pool, (n_block, len(pool)))])
+    cand_score = np.hstack([boosted_score, pool_score])
 
-    metrics = []
-    for u in users:
-        u_df = df[df["user_id"] == u].sort_values("event_ts")
-        if len(u_df) < 2:
-            continue
+    # Rank of the target = 1 + candidates ahead of it (higher score, or equal score and
+    # more popular), so ties resolve the same way whatever users share the block
+    cand_rank = np.where(cand_item >= 0, pop_rank[np.maximum(cand_item, 0)], n_items)
+    match = (cand_item == target[:, None]) & (cand_score > -np.inf)
+    found = match.any(axis=1)
+    t_score = np.take_along_axis(cand_score, match.argmax(axis=1)[:, None], axis=1)
+    t_rank = pop_rank[np.maximum(target, 0)][:, None]
+    ahead = (cand_score > t_score) | ((cand_score == t_score) & (cand_rank < t_rank))
+    rank = ahead.sum(axis=1) + 1
 
-        # history = all but last
-        history_items = u_df.iloc[:-1]["item_id"].astype(str).tolist()
+    hit = found & (rank <= k)
+    return hit / k, hit.astype(np.float64), np.where(hit, 1.0 / np.log2(rank + 1), 0.0)
+
+def evaluate_users(
+    index: dict,
+    items: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    k: int = K,
+    cooc_boost: float = COOC_BOOST,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Per-user precision/recall/NDCG@k for the groups from user_splits, scored in blocks of users:
+    boost = history counts @ neighbors, score = popularity + cooc_boost * boost, history masked,
+    and the target's rank among the remaining items (ties go to the more popular item).
+    Same scores as recommend(); with a single relevant item, recall = hit and
+    NDCG = 1 / log2(rank + 1). Each user's result does not depend on the rest of the block.
+
+    Each user is only scored on their boosted items plus the k + (longest history in block)
+    most popular items: every other item has a lower score than one of those. Rows are padded
+    to the widest row of their dense sub-block, so users of similar width are grouped into
+    sub-blocks of at most EVAL_BLOCK_CELLS cells (one heavy user does not widen the others).
+    """
+    popularity = np.asarray(index["popularity"], dtype=np.float64)
+    neighbors = index["neighbors"]
+    n_items = len(popularity)
+    pop_order = np.argsort(-popularity, kind="stable")
+    pop_rank = np.empty(n_items, dtype=np.int64)
+    pop_rank[pop_order] = np.arange(n_items)
+
+    item_col = pd.Index(index["item_ids"]).get_indexer(items)
+
+    n_users = len(starts)
+    precision = np.zeros(n_users)
+    recall = np.zeros(n_users)
+    ndcg = np.zeros(n_users)
+
+    for b0 in range(0, n_users, EVAL_BLOCK_USERS):
+        b1 = min(b0 + EVAL_BLOCK_USERS, n_users)
+        n_block = b1 - b0
+        hist_len = ends[b0:b1] - starts[b0:b1] - 1
+        rows = np.repeat(np.arange(n_block), hist_len)
+        offsets = np.cumsum(hist_len) - hist_len
+        events = np.arange(len(rows)) - np.repeat(offsets, hist_len) + np.repeat(starts[b0:b1], hist_len)
+        target = item_col[ends[b0:b1] - 1]
+
+        # History counts (repeat events count again, as in recommend) times neighbor counts
+        src = item_col[events]
+        has_src = src >= 0
+        hist = sparse.csr_matrix(
+            (np.ones(int(has_src.sum())), (rows[has_src], src[has_src])),
+            shape=(n_block, neighbors.shape[0]),
+        )
+        boost = (hist @ neighbors).tocsr()
+        boost.sum_duplicates()
 
-        # relevant = last item if it was purchase; else treat last item as relevant anyway
-        last_row = u_df.iloc[-1]
-        if str(last_row["event_type"]).lower() == "purchase":
-            relevant = {str(last_row["item_id"])}
-        else:
-            # fallback: next interaction target (still valid for ranking evaluation)
-            relevant = {str(last_row["item_id"])}
+        # (row, item) keys of history items, masked out of both candidate sets
+        in_vocab = item_col[events] >= 0
+        hist_keys = np.unique(rows[in_vocab].astype(np.int64) * n_items + item_col[events][in_vocab])
+        key_rows = hist_keys // n_items
 
-        recs = recommend(model, history_items, k=K)
-        p, r, n = precision_recall_ndcg_at_k(recs, relevant, K)
-        metrics.append((p, r, n))
+        width = np.diff(boost.indptr) + np.minimum(n_items, k + hist_len)
+        sub_row = np.empty(n_block, dtype=np.int64)
+        for sub in budget_groups(width, EVAL_BLOCK_CELLS):
+            sub_row[sub] = np.arange(len(sub))
+            in_sub = np.isin(key_rows, sub)
+            sub_keys = sub_row[key_rows[in_sub]] * n_items + hist_keys[in_sub] % n_items
+            p, r, n = _score_rows(
+                boost[sub], np.sort(sub_keys), hist_len[sub], target[sub],
+                popularity, pop_order, pop_rank, k, cooc_boost,
+            )
+            precision[b0 + sub] = p
+            recall[b0 + sub] = r
+            ndcg[b0 + sub] = n
 
-    if not metrics:
+    return precision, recall, ndcg
+
+# Worker-side inputs, set once per process by _init_shard_worker (inherited, not copied, under fork)
+_SHARD_INPUTS = {}
+
+def _init_shard_worker(
+    index: Optional[dict],
+    model_dir: Optional[Path],
+    items: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+):
+    if model_dir is not None:
+        # Map the model files here instead of receiving a pickled copy (spawn start method)
+        index = load_model_arrays(model_dir, mmap_mode=MODEL_MMAP_MODE)
+    _SHARD_INPUTS.update(index=index, items=items, starts=starts, ends=ends)
+
+def _evaluate_shard(shard: int, positions: np.ndarray):
+    t0 = time.perf_counter()
+    metrics = evaluate_users(
+        _SHARD_INPUTS["index"],
+        _SHARD_INPUTS["items"],
+        _SHARD_INPUTS["starts"][positions],
+        _SHARD_INPUTS["ends"][positions],
+    )
+    return shard, positions, metrics, time.perf_counter() - t0
+
+def user_shards(users: np.ndarray, n_shards: int) -> np.ndarray:
+    """Stable shard id per user: crc32(user_id) % n_shards (same split on every run)."""
+    return np.fromiter((zlib.crc32(str(u).encode("utf-8")) % n_shards for u in users), dtype=np.int64, count=len(users))
+
+def evaluate_sharded(
+    index: dict,
+    users: np.ndarray,
+    items: np.ndarray,
+    starts: np.ndarray,
+    ends: np.ndarray,
+    workers: int = EVAL_WORKERS,
+    model_dir: Optional[Path] = None,
+) -> Tuple[Tuple[np.ndarray, np.ndarray, np.ndarray], List[dict]]:
+    """
+    evaluate_users over hash shards in a process pool. Per-user metrics are written back to
+    their serial positions, so (with evaluate_users being per-user independent and the
+    means taken with math.fsum) the result is bit-identical to a serial run.
+    With model_dir (a compact model directory), workers memory-map the model themselves.
+    Returns ((precision, recall, ndcg), per-shard stats).
+    """
+    shard_ids = user_shards(users, workers)
+    ctx = mp.get_context("fork") if "fork" in mp.get_all_start_methods() else None
+
+    precision, recall, ndcg = (np.zeros(len(users)) for _ in range(3))
+    stats = []
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=ctx,
+        initializer=_init_shard_worker,
+        initargs=(None if model_dir is not None else index, model_dir, items, starts, ends),
+    ) as pool:
+        futures = [pool.submit(_evaluate_shard, s, np.flatnonzero(shard_ids == s)) for s in range(workers)]
+        for fut in futures:
+            shard, positions, (p, r, n), secs = fut.result()
+            precision[positions], recall[positions], ndcg[positions] = p, r, n
+            stats.append({
+                "shard": shard,
+                "users": len(positions),
+                "seconds": secs,
+                "users_per_sec": len(positions) / secs if secs > 0 else 0.0,
+            })
+    return (precision, recall, ndcg), stats
+
+def main(workers: int = EVAL_WORKERS, model_dir: Optional[Path] = None) -> Path:
+    """Evaluate model_dir (default: the newest model) and log to MLflow. Returns the report path."""
+    if model_dir is not None:
+        model_path = Path(model_dir)
+        index = load_model_arrays(model_path, mmap_mode=MODEL_MMAP_MODE)
+    else:
+        index, model_path = load_latest_index()
+    logger.info(f"Loaded model: {model_path.name}")
+
+    df = load_interactions()
+
+    # Split: each user's last event is the relevant item, everything before it is history
+    # (purchase or not: still valid for ranking evaluation)
+    if df.empty:
+        raise ValueError("No interactions found to evaluate.")
+
+    users, items, starts, ends = user_splits(df)
+    if not len(starts):
         raise ValueError("Not enough user history to evaluate (need at least 2 events per user).")
 
-    p_mean = float(np.mean([m[0] for m in metrics]))
-    r_mean = float(np.mean([m[1] for m in metrics]))
-    n_mean = float(np.mean([m[2] for m in metrics]))
+    t0 = time.perf_counter()
+    shard_stats = []
+    if workers <= 1:
+        precision, recall, ndcg = evaluate_users(index, items, starts, ends, k=K)
+    else:
+        model_dir = model_path if model_path.is_dir() else None
+        (precision, recall, ndcg), shard_stats = evaluate_sharded(
+            index, users, items, starts, ends, workers, model_dir=model_dir
+        )
+    n_users = len(starts)
+    eval_secs = time.perf_counter() - t0
+    logger.info(f"Scored {n_users} users in {eval_secs:.2f}s with {max(workers, 1)} worker(s)")
+    p_mean = math.fsum(precision) / n_users
+    r_mean = math.fsum(recall) / n_users
+    n_mean = math.fsum(ndcg) / n_users
 
     # Log to MLflow
     mlflow.set_experiment("recomart-recommender")
@@ -128,6 +361,14 @@ def main():
         mlflow.log_metric("recall_at_k", r_mean)
         mlflow.log_metric("ndcg_at_k", n_mean)
 
+        mlflow.log_param("eval_workers", max(workers, 1))
+        mlflow.log_metric("eval_seconds", eval_secs)
+        mlflow.log_metric("eval_users_per_sec", n_users / eval_secs if eval_secs > 0 else 0.0)
+        for st in shard_stats:
+            mlflow.log_metric("shard_users", st["users"], step=st["shard"])
+            mlflow.log_metric("shard_seconds", st["seconds"], step=st["shard"])
+            mlflow.log_metric("shard_users_per_sec", st["users_per_sec"], step=st["shard"])
+
         # Save a small report artifact
         report = (
             f"Model: {model_path.name}\n"
@@ -135,7 +376,7 @@ def main():
             f"precision@{K}: {p_mean:.4f}\n"
             f"recall@{K}: {r_mean:.4f}\n"
             f"ndcg@{K}: {n_mean:.4f}\n"
-            f"evaluated_users: {len(metrics)}\n"
+            f"evaluated_users: {n_users}\n"
         )
         out_report = MODELS_DIR / f"model_eval_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.txt"
         out_report.write_text(report, encoding="utf-8")
@@ -143,6 +384,7 @@ def main():
 
     logger.info("Evaluation complete.")
     logger.info(f"precision@{K}={p_mean:.4f}, recall@{K}={r_mean:.4f}, ndcg@{K}={n_mean:.4f}")
+    return out_report
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,207 @@
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Optional
+
+import joblib
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.common.logger import get_logger
+from src.config import MODELS_DIR
+
+logger = get_logger("model_artifacts")
+
+# Compact model layout: MODELS_DIR/recomart_model_<ts>/ with one .npy per array (memory-mappable)
+# plus meta.json. All arrays share one item vocabulary:
+#   items.npy       item ids (fixed-width unicode); rankable items first, in popularity order
+#   popularity.npy  float32 per item; -inf for items that only appear as neighbors
+#   indptr.npy / indices.npy / counts.npy
+#                   CSR neighbor lists (row = item, columns = item positions), each row
+#                   sorted by count desc and truncated to TOP_N
+#   sorted_items.npy / sorted_pos.npy
+#                   items in sorted order and their positions, for id -> position lookups
+#                   by binary search (no per-process dict)
+#   item_meta.parquet  item attributes (title, category, price); not needed for scoring
+TOP_N = 50  # neighbors kept per item; evaluate.recommend boosts with the first 50
+
+# Ranking parameters shared by evaluation and serving (popularity + COOC_BOOST * neighbor counts)
+K = 5
+COOC_BOOST = 0.2  # how much to boost neighbor counts into ranking
+FORMAT_VERSION = 2
+ARRAY_FILES = ("items", "popularity", "indptr", "indices", "counts", "sorted_items", "sorted_pos")
+# Format 1 had no sorted_items / sorted_pos; they are derived on load (in the process heap)
+V1_ARRAY_FILES = ("items", "popularity", "indptr", "indices", "counts")
+
+# Read-only memory map: processes loading the same model share its pages (page cache),
+# and loading only maps the files. None reads every array into the process heap.
+MODEL_MMAP_MODE = "r"
+
+
+def _index_dtype(n: int):
+    # scipy keeps int32 index arrays as-is (no copy) when they fit
+    return np.int32 if n < np.iinfo(np.int32).max else np.int64
+
+
+def build_index(
+    rankable: np.ndarray,
+    popularity: np.ndarray,
+    src: np.ndarray,
+    dst: np.ndarray,
+    counts: np.ndarray,
+) -> dict:
+    """
+    Model index from flat arrays: rankable items with their popularity, and neighbor edges
+    src -> dst already in per-source order (count desc) and truncated to top-N.
+    """
+    vocab = pd.unique(np.concatenate([rankable, src, dst]).astype(str))
+    pos = pd.Index(vocab)
+    n = len(vocab)
+    idx_dtype = _index_dtype(max(n, len(dst)))
+
+    rows = pos.get_indexer(src)
+    order = np.argsort(rows, kind="stable")  # group by row, keep each row's count order
+    indptr = np.zeros(n + 1, dtype=idx_dtype)
+    np.cumsum(np.bincount(rows, minlength=n), out=indptr[1:])
+
+    pop = np.full(n, -np.inf, dtype=np.float32)
+    pop[: len(rankable)] = popularity
+
+    item_ids = vocab.astype(str)
+    sorted_pos = np.argsort(item_ids, kind="stable").astype(idx_dtype)
+    return {
+        "item_ids": item_ids,
+        "popularity": pop,
+        "sorted_items": item_ids[sorted_pos],
+        "sorted_pos": sorted_pos,
+        "neighbors": sparse.csr_matrix(
+            (
+                np.asarray(counts, dtype=np.int32)[order],
+                pos.get_indexer(dst)[order].astype(idx_dtype),
+                indptr,
+            ),
+            shape=(n, n),
+        ),
+    }
+
+
+def model_index(model: dict, top_n: int = TOP_N) -> dict:
+    """Index for a pickled dict model (popularity DataFrame + neighbors dict of lists)."""
+    pop = model["popularity"]
+    tops = {str(a): nbrs[:top_n] for a, nbrs in model["neighbors"].items()}
+    return build_index(
+        pop["item_id"].astype(str).to_numpy(),
+        pop["popularity"].to_numpy(dtype=np.float32),
+        np.repeat(np.asarray(list(tops), dtype=object), [len(t) for t in tops.values()]).astype(str),
+        np.asarray([str(b) for t in tops.values() for b, _ in t], dtype=str),
+        np.asarray([c for t in tops.values() for _, c in t], dtype=np.int64),
+    )
+
+
+def save_model_arrays(
+    index: dict,
+    out_dir: Path,
+    meta: Optional[dict] = None,
+    item_meta: Optional[pd.DataFrame] = None,
+) -> Path:
+    """Write the index as .npy files + meta.json into a temp dir, then rename into place."""
+    out_dir = Path(out_dir)
+    tmp_dir = out_dir.with_name(f".{out_dir.name}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    nbrs = index["neighbors"]
+    arrays = {
+        "items": index["item_ids"],
+        "popularity": index["popularity"],
+        "indptr": nbrs.indptr,
+        "indices": nbrs.indices,
+        "counts": nbrs.data,
+        "sorted_items": index["sorted_items"],
+        "sorted_pos": index["sorted_pos"],
+    }
+    for name, arr in arrays.items():
+        np.save(tmp_dir / f"{name}.npy", np.ascontiguousarray(arr), allow_pickle=False)
+
+    meta = {
+        **(meta or {}),
+        "format_version": FORMAT_VERSION,
+        "n_items": int(len(index["item_ids"])),
+        "n_rankable": int(np.isfinite(index["popularity"]).sum()),
+        "n_edges": int(nbrs.nnz),
+    }
+    (tmp_dir / "meta.json").write_text(json.dumps(meta, indent=2), encoding="utf-8")
+    if item_meta is not None:
+        item_meta.to_parquet(tmp_dir / "item_meta.parquet", index=False)
+    os.replace(tmp_dir, out_dir)
+    return out_dir
+
+
+def load_model_arrays(model_dir: Path, mmap_mode: Optional[str] = None) -> dict:
+    """
+    Index saved by save_model_arrays; with mmap_mode="r" arrays are mapped, not read.
+    Format 1 directories load with the sorted lookup arrays derived; newer formats raise ValueError.
+    """
+    model_dir = Path(model_dir)
+    meta = json.loads((model_dir / "meta.json").read_text(encoding="utf-8"))
+    version = meta.get("format_version", 1)
+    if version not in (1, FORMAT_VERSION):
+        raise ValueError(
+            f"{model_dir}: model format_version {version} is not supported (expected <= {FORMAT_VERSION})"
+        )
+    files = V1_ARRAY_FILES if version == 1 else ARRAY_FILES
+    arr = {
+        name: np.load(model_dir / f"{name}.npy", mmap_mode=mmap_mode, allow_pickle=False)
+        for name in files
+    }
+    n = len(arr["items"])
+    if version == 1:
+        arr["sorted_pos"] = np.argsort(arr["items"], kind="stable").astype(_index_dtype(n))
+        arr["sorted_items"] = arr["items"][arr["sorted_pos"]]
+    return {
+        "item_ids": arr["items"],
+        "popularity": arr["popularity"],
+        "sorted_items": arr["sorted_items"],
+        "sorted_pos": arr["sorted_pos"],
+        # counts/indices/indptr are int32 when they fit, so scipy wraps the mapped arrays as-is
+        "neighbors": sparse.csr_matrix((arr["counts"], arr["indices"], arr["indptr"]), shape=(n, n), copy=False),
+        "meta": meta,
+    }
+
+
+def item_positions(index: dict, ids) -> np.ndarray:
+    """Vocabulary positions of item ids (-1 for unknown ids), by binary search on sorted_items."""
+    sorted_items = index["sorted_items"]
+    ids = np.asarray(ids, dtype=str)
+    if not len(sorted_items) or not len(ids):
+        return np.full(len(ids), -1, dtype=np.int64)
+    i = np.minimum(np.searchsorted(sorted_items, ids), len(sorted_items) - 1)
+    return np.where(sorted_items[i] == ids, index["sorted_pos"][i], -1).astype(np.int64)
+
+
+def latest_model_dir() -> Optional[Path]:
+    dirs = sorted(p for p in MODELS_DIR.glob("recomart_model_*") if p.is_dir())
+    return dirs[-1] if dirs else None
+
+
+def load_latest_index(mmap_mode: Optional[str] = MODEL_MMAP_MODE) -> tuple:
+    """
+    (index, source path) for the newest model: the compact directory (memory-mapped by
+    default) when one exists and its format is supported, otherwise the newest
+    recomart_model_*.pkl converted in memory.
+    """
+    models = sorted(MODELS_DIR.glob("recomart_model_*.pkl"))
+    model_dir = latest_model_dir()
+    if model_dir is not None:
+        try:
+            return load_model_arrays(model_dir, mmap_mode=mmap_mode), model_dir
+        except ValueError as e:
+            if not models:
+                raise
+            logger.warning(f"{e}; falling back to {models[-1]}")
+
+    if not models:
+        raise FileNotFoundError("No model found in data/models. Run training first.")
+    return model_index(joblib.load(models[-1])), models[-1]
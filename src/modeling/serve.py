@@ -0,0 +1,184 @@
+import json
+import sys
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+
+from src.common.logger import get_logger
+from src.modeling.model_artifacts import COOC_BOOST, K, item_positions, load_latest_index, model_index
+
+logger = get_logger("serve")
+
+LATENCY_WINDOW = 10_000  # recent requests kept for p50/p99
+
+
+class Recommender:
+    """
+    In-process recommender over a model index loaded once (see model_artifacts).
+    Popularity is a dense vector indexed by item position; neighbor lists are CSR arrays
+    truncated to TOP_N, so a request is a few NumPy gathers, one scatter-add and an
+    argpartition top-k.
+    Ranking matches evaluate.recommend (ties may be broken differently).
+    """
+
+    def __init__(self, index: dict, cooc_boost: float = COOC_BOOST):
+        # Arrays are used as loaded (memory-mapped when the index came from load_latest_index),
+        # so nothing here is proportional to the catalog size
+        self.model = index
+        self.item_ids = index["item_ids"]
+        self.popularity = index["popularity"]
+        self.cooc_boost = cooc_boost
+
+        # CSR neighbors: row per item, columns are positions in item_ids
+        self.indptr = index["neighbors"].indptr
+        self.indices = index["neighbors"].indices
+        self.counts = index["neighbors"].data
+
+        self._latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @classmethod
+    def from_model(cls, model: dict) -> "Recommender":
+        return cls(model_index(model))
+
+    @classmethod
+    def from_latest(cls) -> "Recommender":
+        t0 = time.perf_counter()
+        index, model_path = load_latest_index()
+        rec = cls(index)
+        logger.info(f"Loaded {model_path.name} in {time.perf_counter() - t0:.3f}s ({len(rec.item_ids)} items)")
+        return rec
+
+    def recommend(self, user_history_items: List[str], k: int = K) -> List[str]:
+        t0 = time.perf_counter()
+
+        scores = self.popularity.astype(np.float64)
+        rows = item_positions(self.model, user_history_items)
+        rows = rows[rows >= 0]
+        if len(rows):
+            nbr = np.concatenate([self.indices[self.indptr[r]:self.indptr[r + 1]] for r in rows])
+            cnt = np.concatenate([self.counts[self.indptr[r]:self.indptr[r + 1]] for r in rows])
+            if len(nbr):
+                # Sum counts per neighbor first so the score is popularity + boost * total count
+                uniq, inv = np.unique(nbr, return_inverse=True)
+                scores[uniq] += self.cooc_boost * np.bincount(inv, weights=cnt)
+
+        hist = np.unique(rows)
+        scores[hist] = -np.inf
+
+        k = min(k, len(scores) - len(hist))
+        if k <= 0:
+            recs = []
+        else:
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top], kind="stable")]
+            recs = self.item_ids[top[scores[top] > -np.inf]].tolist()  # drop non-rankable items
+
+        self._latencies.append(time.perf_counter() - t0)
+        return recs
+
+    def latency_stats(self) -> dict:
+        if not self._latencies:
+            return {"requests": 0}
+        ms = np.asarray(self._latencies) * 1000.0
+        return {
+            "requests": len(ms),
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "max_ms": float(ms.max()),
+        }
+
+
+def serve_http(recommender: Recommender, host: str = "127.0.0.1", port: int = 8080):
+    """
+    Local HTTP endpoint:
+      GET /recommend?items=P1,P2&k=5  -> {"recommendations": [...]}
+      GET /stats                      -> latency percentiles
+    """
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, status: int, payload: dict):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            query = parse_qs(url.query)
+            if url.path == "/recommend":
+                items = [i for i in query.get("items", [""])[0].split(",") if i]
+                n_items = len(recommender.item_ids)
+                try:
+                    k = int(query.get("k", [K])[0])
+                except ValueError:
+                    k = 0
+                if not 1 <= k <= n_items:
+                    self._send(400, {"error": f"k must be an integer between 1 and {n_items}"})
+                    return
+                self._send(200, {"recommendations": recommender.recommend(items, k=k)})
+            elif url.path == "/stats":
+                self._send(200, recommender.latency_stats())
+            else:
+                self._send(404, {"error": f"unknown path {url.path}"})
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    logger.info(f"Serving recommendations on http://{host}:{port}/recommend")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+
+def synthetic_model(n_items: int = 100_000, n_neighbors: int = 100, seed: int = 11) -> dict:
+    """Model dict shaped like train_recommender.train_model output, for benchmarking."""
+    rng = np.random.default_rng(seed)
+    items = [f"P{i}" for i in range(n_items)]
+    pop = pd.DataFrame({"item_id": items, "popularity": rng.integers(0, 1000, n_items).astype(float)})
+    neighbors = {}
+    for i in range(0, n_items, 10):  # every 10th item has a neighbor list
+        nbrs = rng.integers(0, n_items, n_neighbors)
+        cnts = np.sort(rng.integers(1, 100, n_neighbors))[::-1]
+        neighbors[items[i]] = [(items[b], int(c)) for b, c in zip(nbrs, cnts)]
+    return {"popularity": pop.sort_values("popularity", ascending=False), "neighbors": neighbors}
+
+
+def benchmark(n_items: int = 100_000, n_requests: int = 2_000, history_len: int = 10, model: Optional[dict] = None):
+    model = model or synthetic_model(n_items)
+    rec = Recommender.from_model(model)
+    rng = np.random.default_rng(3)
+    histories = [
+        rec.item_ids[rng.integers(0, len(rec.item_ids), history_len)].tolist() for _ in range(n_requests)
+    ]
+    for h in histories[:50]:  # warm-up
+        rec.recommend(h)
+    rec._latencies.clear()
+    for h in histories:
+        rec.recommend(h)
+    stats = rec.latency_stats()
+    logger.info(
+        f"{len(rec.item_ids):,} items, history={history_len}: "
+        f"p50={stats['p50_ms']:.3f}ms p99={stats['p99_ms']:.3f}ms over {stats['requests']} requests"
+    )
+    return stats
+
+
+def main():
+    if sys.argv[1:2] == ["bench"]:
+        benchmark()
+        return
+    port = int(sys.argv[1]) if len(sys.argv) > 1 else 8080
+    serve_http(Recommender.from_latest(), port=port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,16 @@
 import sqlite3
 import joblib
+import numpy as np
 import pandas as pd
 from datetime import datetime
+from pandas.api.types import union_categoricals
 from pathlib import Path
 
 import mlflow
 
 from src.common.logger import get_logger
 from src.config import WAREHOUSE_DB, MODELS_DIR
+from src.modeling.model_artifacts import TOP_N, build_index, save_model_arrays
 
 logger = get_logger("train_model")
 
@@ -16,16 +19,58 @@ W_VIEW = 1
 W_CART = 3
 W_PURCHASE = 5
 
+# Rows per read_sql chunk for the co-occurrence table
+READ_CHUNKSIZE = 500_000
+POPULARITY_COLS = ["popularity_score_7d", "views_7d", "carts_7d", "purchases_7d"]
+
+# Also save the model dict as recomart_model_<ts>.pkl (joblib). Evaluation and serving load the
+# compact directory; the only reader of the pickle is the fallback of
+# model_artifacts.load_latest_index, for a reader that does not support the directory's
+# FORMAT_VERSION (e.g. older serving code during a rollout). Enable only while such readers run.
+WRITE_LEGACY_PICKLE = False
+
+def table_columns(conn: sqlite3.Connection, table: str) -> list:
+    return [r[1] for r in conn.execute(f"PRAGMA table_info({table})")]
+
+def read_cooccurrence(conn: sqlite3.Connection, chunksize: int = READ_CHUNKSIZE) -> pd.DataFrame:
+    """
+    Pair columns only, read in chunks; item ids become categoricals over one shared
+    vocabulary, so memory is the int codes plus the distinct ids (not one string per row).
+    Rows keep table order (count desc), which build_neighbor_arrays uses to break ties.
+    """
+    ids, counts = [], []
+    for chunk in pd.read_sql_query(
+        "SELECT item_id_a, item_id_b, cooc_count_30d FROM item_item_cooccurrence", conn, chunksize=chunksize
+    ):
+        ids += [pd.Categorical(chunk["item_id_a"]), pd.Categorical(chunk["item_id_b"])]
+        counts.append(chunk["cooc_count_30d"].to_numpy(dtype=np.int64))
+    if not ids:
+        return pd.DataFrame({"item_id_a": [], "item_id_b": [], "cooc_count_30d": np.empty(0, dtype=np.int64)})
+
+    # One vocabulary for all chunks, then split back into a / b columns chunk by chunk
+    vocab = union_categoricals(ids).categories
+    codes = [pd.Categorical(c, categories=vocab).codes for c in ids]
+    return pd.DataFrame({
+        "item_id_a": pd.Categorical.from_codes(np.concatenate(codes[0::2]), categories=vocab),
+        "item_id_b": pd.Categorical.from_codes(np.concatenate(codes[1::2]), categories=vocab),
+        "cooc_count_30d": np.concatenate(counts),
+    })
+
 def load_tables():
+    """
+    Only what training uses: item attributes, the popularity columns of features_item and
+    the co-occurrence pairs. fact_interactions is not read, so training memory does not
+    grow with the fact table.
+    """
     conn = sqlite3.connect(WAREHOUSE_DB)
     try:
         items = pd.read_sql_query("SELECT item_id, title, category, price FROM dim_items", conn)
-        item_feat = pd.read_sql_query("SELECT * FROM features_item", conn)
-        cooc = pd.read_sql_query("SELECT * FROM item_item_cooccurrence", conn)
-        interactions = pd.read_sql_query("SELECT user_id, item_id, event_type, event_ts FROM fact_interactions", conn)
+        feat_cols = [c for c in POPULARITY_COLS if c in table_columns(conn, "features_item")]
+        item_feat = pd.read_sql_query(f"SELECT {', '.join(['item_id'] + feat_cols)} FROM features_item", conn)
+        cooc = read_cooccurrence(conn)
     finally:
         conn.close()
-    return items, item_feat, cooc, interactions
+    return items, item_feat, cooc
 
 def build_popularity(item_feat: pd.DataFrame) -> pd.DataFrame:
     # If popularity_score_7d exists (from Task 6), use it
@@ -43,34 +88,73 @@ def build_popularity(item_feat: pd.DataFrame) -> pd.DataFrame:
     )
     return item_feat[["item_id", "popularity"]].sort_values("popularity", ascending=False)
 
+def build_neighbor_arrays(cooc: pd.DataFrame, top_n: int = TOP_N):
+    """
+    Symmetric neighbor lists from co-occurrence pairs as flat arrays (src, dst, count):
+    (a, b, c) and (b, a, c) are concatenated, lexsorted by (src, -count, pair row), and each
+    src keeps its first top_n entries. The row key keeps equal counts in pair order, so every
+    list equals the old per-item sort of appended tuples, truncated to top_n.
+    """
+    n = len(cooc)
+    codes, uniques = pd.factorize(pd.concat([cooc["item_id_a"], cooc["item_id_b"]], ignore_index=True))
+    src = np.concatenate([codes[:n], codes[n:]])
+    dst = np.concatenate([codes[n:], codes[:n]])
+    cnt = np.tile(cooc["cooc_count_30d"].to_numpy(dtype=np.int64), 2)
+    row = np.tile(np.arange(n), 2)
+
+    order = np.lexsort((row, -cnt, src))
+    src, dst, cnt = src[order], dst[order], cnt[order]
+
+    # Position within each src group; groups are contiguous after the sort
+    starts = np.flatnonzero(np.r_[True, src[1:] != src[:-1]])
+    sizes = np.diff(np.r_[starts, len(src)])
+    rank = np.arange(len(src)) - np.repeat(starts, sizes)
+    keep = rank < top_n
+
+    labels = np.asarray(uniques, dtype=object)
+    return labels[src[keep]], labels[dst[keep]], cnt[keep]
+
+def neighbor_lists(src: np.ndarray, dst: np.ndarray, counts: np.ndarray) -> dict:
+    """dict[item_id] -> list[(item_id, count)] from grouped neighbor arrays."""
+    bounds = np.flatnonzero(np.r_[True, src[1:] != src[:-1], True])
+    dst, counts = dst.tolist(), counts.tolist()
+    return {
+        src[s]: list(zip(dst[s:e], counts[s:e]))
+        for s, e in zip(bounds[:-1].tolist(), bounds[1:].tolist())
+    }
+
 def train_model():
-    items, item_feat, cooc, interactions = load_tables()
+    """Returns (model dict, array index for model_artifacts)."""
+    items, item_feat, cooc = load_tables()
 
     pop = build_popularity(item_feat)
 
-    # Build a simple "neighbors" map from co-occurrence
-    # Store for fast lookup: for each item A, list of (B, count)
-    neighbors = {}
-    for row in cooc.itertuples(index=False):
-        a, b, c = row.item_id_a, row.item_id_b, int(row.cooc_count_30d)
-        neighbors.setdefault(a, []).append((b, c))
-        neighbors.setdefault(b, []).append((a, c))  # symmetric
-
-    # Keep sorted neighbors
-    for k in neighbors:
-        neighbors[k].sort(key=lambda x: x[1], reverse=True)
+    # Neighbors from co-occurrence: for each item A, its top-N (B, count), count desc
+    src, dst, counts = build_neighbor_arrays(cooc, top_n=TOP_N)
+    neighbors = neighbor_lists(src, dst, counts)
+    index = build_index(
+        pop["item_id"].astype(str).to_numpy(),
+        pop["popularity"].to_numpy(dtype=np.float32),
+        src.astype(str),
+        dst.astype(str),
+        counts,
+    )
 
     model = {
         "created_at_utc": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
         "popularity": pop,           # DataFrame: item_id, popularity
-        "neighbors": neighbors,      # dict[item_id] -> list[(item_id, count)]
+        "neighbors": neighbors,      # dict[item_id] -> list[(item_id, count)], top TOP_N
         "item_meta": items.set_index("item_id").to_dict(orient="index"),
         "weights": {"view": W_VIEW, "cart": W_CART, "purchase": W_PURCHASE},
     }
 
-    return model
+    return model, index
 
-def main():
+def main() -> Path:
+    """
+    Train, save the compact arrays (and the pickle with WRITE_LEGACY_PICKLE) and log to MLflow.
+    Returns the compact model directory.
+    """
     MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
     mlflow.set_experiment("recomart-recommender")
@@ -82,17 +166,30 @@ def main():
         mlflow.log_param("w_cart", W_CART)
         mlflow.log_param("w_purchase", W_PURCHASE)
 
-        model = train_model()
+        model, index = train_model()
 
         run_ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
-        model_path = MODELS_DIR / f"recomart_model_{run_ts}.pkl"
-        joblib.dump(model, model_path)
-        logger.info(f"Saved model to {model_path}")
+        if WRITE_LEGACY_PICKLE:
+            model_path = MODELS_DIR / f"recomart_model_{run_ts}.pkl"
+            joblib.dump(model, model_path)
+            mlflow.log_artifact(str(model_path))
+            logger.info(f"Saved legacy pickle to {model_path}")
+
+        # Compact array format (memory-mappable), loaded by evaluate / serve when present
+        item_meta = pd.DataFrame.from_dict(model["item_meta"], orient="index").rename_axis("item_id").reset_index()
+        model_dir = save_model_arrays(
+            index,
+            MODELS_DIR / f"recomart_model_{run_ts}",
+            meta={"created_at_utc": model["created_at_utc"], "weights": model["weights"], "top_n": TOP_N},
+            item_meta=item_meta,
+        )
+        logger.info(f"Saved compact model arrays to {model_dir}")
 
         # Log artifact to MLflow
-        mlflow.log_artifact(str(model_path))
+        mlflow.log_artifacts(str(model_dir), artifact_path=model_dir.name)
 
         logger.info("Training completed successfully.")
+    return model_dir
 
 if __name__ == "__main__":
     main()
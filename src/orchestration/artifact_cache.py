@@ -0,0 +1,162 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+
+from src.common.logger import get_logger
+from src.config import REPORTS_DIR
+
+logger = get_logger("artifact_cache")
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+# Every stage key includes the whole source tree (modules, SQL, registry JSON): a stage's code
+# depends on shared modules (kernels, engines, config), so any code change reruns the pipeline
+SOURCE_DIR = Path(__file__).resolve().parents[1]
+
+# Seconds of each stage's last executed run; a cached stage is reported as saving that much
+STAGE_SECONDS_PATH = REPORTS_DIR / "_stage_seconds.json"
+
+_digests: Dict[tuple, str] = {}  # (path, size, mtime_ns) -> sha256, each file hashed once per process
+_executed: Dict[str, float] = {}  # stages whose body ran in the current flow run -> seconds
+_lock = threading.Lock()
+
+
+def file_digest(path: Path) -> str:
+    st = path.stat()
+    memo = (str(path), st.st_size, st.st_mtime_ns)
+    if memo not in _digests:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+                h.update(chunk)
+        _digests[memo] = h.hexdigest()
+    return _digests[memo]
+
+
+def _skipped(rel: Path) -> bool:
+    # Manifests, caches and temp files ("_" / "." prefix), as the dataset readers skip them
+    return any(part.startswith(("_", ".")) for part in rel.parts)
+
+
+def artifact_digest(value) -> str:
+    """
+    Content hash of a task input: a file by its bytes, a directory by the relative names and
+    bytes of its files, lists / tuples / dicts element-wise, anything else by repr.
+    File names do not matter, so a re-landed identical file gets the same hash.
+    """
+    if isinstance(value, Path):
+        if value.is_file():
+            return "file:" + file_digest(value)
+        if value.is_dir():
+            h = hashlib.sha256()
+            for p in sorted(value.rglob("*")):
+                rel = p.relative_to(value)
+                if p.is_file() and not _skipped(rel):
+                    h.update(rel.as_posix().encode("utf-8"))
+                    h.update(file_digest(p).encode("ascii"))
+            return "dir:" + h.hexdigest()
+        return "missing"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(artifact_digest(v) for v in value) + "]"
+    if isinstance(value, dict):
+        return "{" + ",".join(f"{k}={artifact_digest(v)}" for k, v in sorted(value.items())) + "}"
+    return repr(value)
+
+
+def artifact_cache_key(module: str) -> Callable:
+    """
+    Prefect cache_key_fn for a stage that runs `module`: the hash of the module name, the
+    src/ source tree and every task input's content. The stage is skipped (its previous result
+    returned) until the code or one of its input artifacts changes.
+    """
+    def cache_key(context, parameters: dict) -> str:
+        h = hashlib.sha256(module.encode("utf-8"))
+        h.update(artifact_digest(SOURCE_DIR).encode("ascii"))
+        h.update(artifact_digest(parameters).encode("utf-8"))
+        return h.hexdigest()
+
+    return cache_key
+
+
+def outputs_exist(value) -> bool:
+    """Whether every path in a task result still exists (a cached result may point at deleted files)."""
+    if isinstance(value, Path):
+        return value.exists()
+    if isinstance(value, (list, tuple)):
+        return all(outputs_exist(v) for v in value)
+    if isinstance(value, dict):
+        return all(outputs_exist(v) for v in value.values())
+    return True
+
+
+def load_stage_seconds() -> dict:
+    if not STAGE_SECONDS_PATH.exists():
+        return {}
+    return json.loads(STAGE_SECONDS_PATH.read_text(encoding="utf-8"))
+
+
+def _save_stage_seconds(seconds: dict):
+    STAGE_SECONDS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = STAGE_SECONDS_PATH.with_name(f".{STAGE_SECONDS_PATH.name}.tmp")
+    tmp.write_text(json.dumps(seconds, indent=2, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, STAGE_SECONDS_PATH)
+
+
+def start_run():
+    """Forget the stages executed by a previous flow run in this process."""
+    with _lock:
+        _executed.clear()
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """Time a stage body that actually runs (cached stages never enter it) and record it."""
+    t0 = time.perf_counter()
+    yield
+    secs = time.perf_counter() - t0
+    with _lock:
+        _executed[stage] = secs
+        seconds = load_stage_seconds()
+        seconds[stage] = round(secs, 3)
+        _save_stage_seconds(seconds)
+
+
+def run_summary(stages: List[str]) -> dict:
+    """
+    Per stage of this flow run: "ran" with its seconds, or "cached" with the seconds saved
+    (its last executed run). Written to REPORTS_DIR/pipeline_run_<ts>.json and logged.
+    """
+    last = load_stage_seconds()
+    rows = []
+    for stage in stages:
+        if stage in _executed:
+            rows.append({"stage": stage, "status": "ran", "seconds": round(_executed[stage], 3)})
+        else:
+            rows.append({"stage": stage, "status": "cached", "seconds_saved": last.get(stage)})
+    summary = {
+        "run_at_utc": datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "stages": rows,
+        "seconds_run": round(sum(r.get("seconds", 0.0) for r in rows), 3),
+        "seconds_saved": round(sum(r.get("seconds_saved") or 0.0 for r in rows), 3),
+    }
+
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    out = REPORTS_DIR / f"pipeline_run_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.json"
+    out.write_text(json.dumps(summary, indent=2), encoding="utf-8")
+    for r in rows:
+        if r["status"] == "ran":
+            logger.info(f"  {r['stage']:<22} ran      {r['seconds']:8.2f}s")
+        else:
+            saved = "unknown" if r["seconds_saved"] is None else f"{r['seconds_saved']:.2f}s"
+            logger.info(f"  {r['stage']:<22} cached   saved ~{saved}")
+    logger.info(
+        f"Pipeline: {summary['seconds_run']:.2f}s of stage work, ~{summary['seconds_saved']:.2f}s saved "
+        f"by cached stages ({out})"
+    )
+    return summary
@@ -1,99 +1,180 @@
 from prefect import flow, task
-from prefect.tasks import task_input_hash
-from datetime import timedelta
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Tuple
 
 from src.common.logger import get_logger
+from src.config import INTERACTIONS_RAW
+from src.ingestion.ingest_interactions_csv import INCOMING_DIR
+from src.orchestration.artifact_cache import (
+    artifact_cache_key, outputs_exist, run_summary, stage_timer, start_run,
+)
 
 logger = get_logger("prefect_flow")
 
 # --- Each task calls your existing modules ---
+# Tasks take their input artifact paths and return their output paths. Cached tasks are keyed on
+# the content of those inputs (and of the src/ sources): an unchanged stage is skipped and
+# returns the paths of its previous run, so everything downstream of it is skipped as well.
+# Results are persisted (Prefect result storage) so the cache holds across flow runs.
 
-@task(retries=2, retry_delay_seconds=10)
-def ingest_csv():
+STAGES = [
+    "ingest_csv", "ingest_api", "validate_interactions", "validate_products", "generate_dq_pdf",
+    "prepare_and_eda", "build_features", "maintain_warehouse", "train_model", "evaluate_model",
+]
+
+
+def cached(module: str):
+    return {"cache_key_fn": artifact_cache_key(module), "persist_result": True}
+
+
+@task(retries=2, retry_delay_seconds=10, **cached("src.ingestion.ingest_interactions_csv"))
+def ingest_csv(incoming_dir: Path) -> Path:
+    """Lands the CSVs of incoming_dir; returns the latest raw interactions partition."""
     logger.info("Starting CSV ingestion...")
     from src.ingestion.ingest_interactions_csv import main as run
-    run()
+    from src.validation.utils_latest_partition import latest_partition
+    with stage_timer("ingest_csv"):
+        run(incoming_dir=incoming_dir)
     logger.info("CSV ingestion done.")
+    return latest_partition(INTERACTIONS_RAW)
 
+# Not cached: the source is the remote API (the module skips unchanged catalogs via ETag)
 @task(retries=2, retry_delay_seconds=10)
-def ingest_api():
+def ingest_api() -> Path:
+    """
+    Fetches the catalog; returns the file written, or the latest raw products file when the
+    catalog is unchanged (HTTP 304). A failed fetch fails the task instead.
+    """
     logger.info("Starting API ingestion...")
     from src.ingestion.ingest_products_api import main as run
-    run()
+    from src.validation.validate_products import latest_products_file
+    with stage_timer("ingest_api"):
+        out = run(strict=True)
     logger.info("API ingestion done.")
+    return out if out is not None else latest_products_file()
 
-@task(retries=1, retry_delay_seconds=5)
-def validate_interactions():
+@task(retries=1, retry_delay_seconds=5, **cached("src.validation.validate_interactions"))
+def validate_interactions(partition_dir: Path) -> Tuple[Path, Path]:
     logger.info("Validating interactions...")
     from src.validation.validate_interactions import main as run
-    run()
+    with stage_timer("validate_interactions"):
+        out = run(partition_dir=partition_dir)
     logger.info("Validation interactions done.")
+    return out
 
-@task(retries=1, retry_delay_seconds=5)
-def validate_products():
+@task(retries=1, retry_delay_seconds=5, **cached("src.validation.validate_products"))
+def validate_products(products_file: Path) -> Tuple[Path, Path]:
     logger.info("Validating products...")
     from src.validation.validate_products import main as run
-    run()
+    with stage_timer("validate_products"):
+        out = run(products_file=products_file)
     logger.info("Validation products done.")
+    return out
 
-@task
-def generate_dq_pdf():
+@task(**cached("src.validation.generate_data_quality_pdf"))
+def generate_dq_pdf(interactions_report: Path, products_report: Path) -> Path:
     logger.info("Generating Data Quality Report PDF...")
     from src.validation.generate_data_quality_pdf import main as run
-    run()
+    with stage_timer("generate_dq_pdf"):
+        out = run(interactions_report, products_report)
     logger.info("DQ PDF generated.")
+    return out
 
-@task
-def prepare_and_eda():
+@task(**cached("src.preparation.clean_and_eda"))
+def prepare_and_eda(interactions_validated: Path, products_validated: Path) -> Tuple[Path, Path]:
     logger.info("Running preparation + EDA...")
     from src.preparation.clean_and_eda import main as run
-    run()
+    with stage_timer("prepare_and_eda"):
+        out = run(interactions_validated, products_validated)
     logger.info("Preparation + EDA done.")
-
-@task
-def build_features():
+    return out
+
+@task(**cached("src.transformation.build_features"))
+def build_features(interactions_prepared: Path, products_prepared: Path, run_day: str) -> Tuple[Path, Path]:
+    """
+    Returns (feature build file, training frame). Feature windows end at run time, so run_day
+    (UTC date) is part of the cache key: features are rebuilt at least once a day.
+    """
     logger.info("Building features + warehouse tables...")
     from src.transformation.build_features import main as run
-    run()
+    with stage_timer("build_features"):
+        out = run(interactions_fp=interactions_prepared, products_fp=products_prepared)
     logger.info("Features built.")
-
-@task
-def train_model():
+    return out
+
+@task(**cached("src.transformation.warehouse_maintenance"))
+def maintain_warehouse(build_file: Path) -> Path:
+    logger.info("Warehouse maintenance (WAL, declared schema, indexes, ANALYZE)...")
+    from src.transformation.warehouse_maintenance import main as run
+    with stage_timer("maintain_warehouse"):
+        run()
+    logger.info("Warehouse maintenance done.")
+    return build_file
+
+@task(**cached("src.modeling.train_recommender"))
+def train_model(build_file: Path) -> Path:
+    """Trains on the warehouse of build_file's feature build; returns the model directory."""
     logger.info("Training model...")
     from src.modeling.train_recommender import main as run
-    run()
+    with stage_timer("train_model"):
+        out = run()
     logger.info("Model training done.")
+    return out
 
-@task
-def evaluate_model():
+@task(**cached("src.modeling.evaluate"))
+def evaluate_model(model_dir: Path, build_file: Path) -> Path:
     logger.info("Evaluating model + logging to MLflow...")
     from src.modeling.evaluate import main as run
-    run()
+    with stage_timer("evaluate_model"):
+        out = run(model_dir=model_dir)
     logger.info("Model evaluation done.")
+    return out
+
+
+def checked(stage, result, *args):
+    """A cached result whose files were deleted since is recomputed with a refreshed cache."""
+    if outputs_exist(result):
+        return result
+    logger.info(f"{stage.name}: cached outputs are missing, running it again")
+    return stage.with_options(refresh_cache=True)(*args)
+
 
 @flow(name="recomart-end-to-end-pipeline")
-def recomart_pipeline():
+def recomart_pipeline(incoming_dir: Path = INCOMING_DIR):
+    start_run()
+
     # Ingestion can run in parallel
-    ingest_csv_future = ingest_csv.submit()
+    ingest_csv_future = ingest_csv.submit(incoming_dir)
     ingest_api_future = ingest_api.submit()
 
     # Wait for ingestion tasks to finish before validation
-    ingest_csv_future.result()
-    ingest_api_future.result()
+    partition_dir = checked(ingest_csv, ingest_csv_future.result(), incoming_dir)
+    products_file = ingest_api_future.result()
+
+    validate_interactions_future = validate_interactions.submit(partition_dir)
+    validate_products_future = validate_products.submit(products_file)
 
-    validate_interactions_future = validate_interactions.submit()
-    validate_products_future = validate_products.submit()
+    interactions_validated, interactions_report = checked(
+        validate_interactions, validate_interactions_future.result(), partition_dir
+    )
+    products_validated, products_report = checked(
+        validate_products, validate_products_future.result(), products_file
+    )
 
-    validate_interactions_future.result()
-    validate_products_future.result()
+    checked(generate_dq_pdf, generate_dq_pdf(interactions_report, products_report),
+            interactions_report, products_report)
 
-    generate_dq_pdf()
+    prepared = checked(prepare_and_eda, prepare_and_eda(interactions_validated, products_validated),
+                       interactions_validated, products_validated)
+    run_day = datetime.now(timezone.utc).strftime("%Y-%m-%d")
+    build_file, _ = checked(build_features, build_features(*prepared, run_day), *prepared, run_day)
+    maintain_warehouse(build_file)
 
-    prepare_and_eda()
-    build_features()
+    model_dir = checked(train_model, train_model(build_file), build_file)
+    checked(evaluate_model, evaluate_model(model_dir, build_file), model_dir, build_file)
 
-    train_model()
-    evaluate_model()
+    return run_summary(STAGES)
 
 if __name__ == "__main__":
     recomart_pipeline()
@@ -2,6 +2,7 @@ import pandas as pd
 import matplotlib.pyplot as plt
 from datetime import datetime
 from pathlib import Path
+from typing import Optional, Tuple
 
 from src.common.logger import get_logger
 from src.config import VALIDATED_DIR, PREPARED_DIR, REPORTS_DIR
@@ -136,12 +137,13 @@ def write_eda_summary(interactions: pd.DataFrame, products: pd.DataFrame, run_ts
     out_md.write_text("\n".join(lines), encoding="utf-8")
     logger.info(f"Wrote EDA summary: {out_md}")
 
-def main():
+def main(interactions_file: Optional[Path] = None, products_file: Optional[Path] = None) -> Tuple[Path, Path]:
+    """Clean + EDA of the given validated files (default: the latest). Returns the prepared files."""
     PREPARED_DIR.mkdir(parents=True, exist_ok=True)
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
-    interactions_file = latest_file(VALIDATED_DIR, "interactions_validated_*.parquet")
-    products_file = latest_file(VALIDATED_DIR, "products_validated_*.parquet")
+    interactions_file = interactions_file or latest_file(VALIDATED_DIR, "interactions_validated_*.parquet")
+    products_file = products_file or latest_file(VALIDATED_DIR, "products_validated_*.parquet")
 
     logger.info(f"Using validated interactions: {interactions_file}")
     logger.info(f"Using validated products: {products_file}")
@@ -168,6 +170,7 @@ def main():
     write_eda_summary(interactions_clean, products_clean, run_ts)
 
     logger.info("Task 5 completed successfully.")
+    return out_i, out_p
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,113 @@
+"""
+Micro-benchmark for the 7-day feature kernel.
+
+    python -m src.transformation.bench_feature_kernels              # 1M, 10M, 50M rows
+    python -m src.transformation.bench_feature_kernels 1000000      # custom sizes
+
+Synthetic interactions use categorical user/item ids so 50M rows fit in memory.
+The previous lambda/multi-groupby implementation is timed up to LEGACY_MAX_ROWS only
+(it is too slow beyond that) and its output is checked against the kernel.
+"""
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from src.common.logger import get_logger
+from src.transformation.feature_kernels import feature_kernel_7d
+
+logger = get_logger("bench_feature_kernels")
+
+SIZES = [1_000_000, 10_000_000, 50_000_000]
+N_USERS = 1_000_000
+N_ITEMS = 100_000
+EVENT_TYPES = ["cart", "purchase", "view"]
+LEGACY_MAX_ROWS = 1_000_000
+
+
+def synthetic_interactions(n_rows: int, seed: int = 7) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    users = pd.Index([f"U{i:07d}" for i in range(N_USERS)])
+    items = pd.Index([f"P{i:06d}" for i in range(N_ITEMS)])
+    start = pd.Timestamp("2026-01-01", tz="UTC").value
+    return pd.DataFrame({
+        "user_id": pd.Categorical.from_codes(rng.integers(0, N_USERS, n_rows), categories=users),
+        "item_id": pd.Categorical.from_codes(rng.integers(0, N_ITEMS, n_rows), categories=items),
+        "event_type": pd.Categorical.from_codes(rng.choice(3, n_rows, p=[0.2, 0.1, 0.7]), categories=EVENT_TYPES),
+        "timestamp": pd.to_datetime(start + rng.integers(0, 7 * 86400, n_rows) * 10**9, utc=True),
+        "price": rng.uniform(1, 500, n_rows).round(2),
+    })
+
+
+def legacy_features(i7: pd.DataFrame):
+    """The per-group lambda / four-groupby implementation the kernel replaced."""
+    i7 = i7.astype({"user_id": str, "item_id": str, "event_type": str})
+    user_features = (
+        i7.groupby("user_id", as_index=False)
+          .agg(
+              events_7d=("event_type", "count"),
+              purchases_7d=("event_type", lambda s: int((s == "purchase").sum())),
+              avg_price_7d=("price", "mean"),
+              last_event_ts=("timestamp", "max"),
+          )
+    )
+    user_features["avg_price_7d"] = user_features["avg_price_7d"].fillna(0.0)
+    user_features["last_event_ts"] = user_features["last_event_ts"].dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+    views = i7[i7["event_type"] == "view"].groupby("item_id").size().rename("views_7d")
+    carts = i7[i7["event_type"] == "cart"].groupby("item_id").size().rename("carts_7d")
+    purchases = i7[i7["event_type"] == "purchase"].groupby("item_id").size().rename("purchases_7d")
+    last_ts = i7.groupby("item_id")["timestamp"].max().dt.strftime("%Y-%m-%dT%H:%M:%SZ").rename("last_event_ts")
+    item_features = pd.concat([views, carts, purchases, last_ts], axis=1).fillna(0).reset_index()
+    for c in ["views_7d", "carts_7d", "purchases_7d"]:
+        item_features[c] = item_features[c].astype(int)
+    item_features["popularity_score_7d"] = (
+        item_features["views_7d"] + item_features["carts_7d"] * 3 + item_features["purchases_7d"] * 5
+    ).astype(float)
+    return user_features, item_features
+
+
+def _timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def _same(a: pd.DataFrame, b: pd.DataFrame) -> bool:
+    # Row order is not part of the contract (the legacy item concat is only partly sorted)
+    key = a.columns[0]
+    if len(a) != len(b):
+        return False
+    a = a.sort_values(key, ignore_index=True)
+    b = b.sort_values(key, ignore_index=True)
+    for col in a.columns:
+        if pd.api.types.is_float_dtype(a[col]):
+            if not np.allclose(a[col], b[col], rtol=1e-9):
+                return False
+        elif not (a[col].astype(str) == b[col].astype(str)).all():
+            return False
+    return True
+
+
+def main(sizes=None):
+    sizes = sizes or SIZES
+    for n in sizes:
+        df = synthetic_interactions(n)
+        (users, items), secs = _timed(feature_kernel_7d, df)
+        logger.info(
+            f"kernel  rows={n:>11,}  {secs:8.2f}s  {n / secs:>14,.0f} rows/s  "
+            f"users={len(users):,} items={len(items):,}"
+        )
+
+        if n <= LEGACY_MAX_ROWS:
+            (ref_users, ref_items), ref_secs = _timed(legacy_features, df)
+            match = _same(ref_users, users) and _same(ref_items, items)
+            logger.info(
+                f"legacy  rows={n:>11,}  {ref_secs:8.2f}s  {n / ref_secs:>14,.0f} rows/s  "
+                f"speedup={ref_secs / secs:.1f}x  outputs_match={match}"
+            )
+        del df
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or None)
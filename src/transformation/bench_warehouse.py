@@ -0,0 +1,169 @@
+"""
+Lookup latency of the warehouse before and after warehouse maintenance.
+
+    python -m src.transformation.bench_warehouse              # 1M, 5M fact rows
+    python -m src.transformation.bench_warehouse 200000       # custom sizes
+
+Each run writes a synthetic warehouse the way build_features' replace mode does
+(DataFrame.to_sql, so no keys or indexes), times the hot queries, runs maintain_warehouse and
+times them again. It then times single-key reads while a writer thread keeps rewriting
+features_user, in the rollback journal (before) and in WAL mode (after).
+"""
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.common.logger import get_logger
+from src.common.sqlite_connection import configure_connection
+from src.transformation.bench_feature_kernels import synthetic_interactions
+from src.transformation.feature_kernels import feature_kernel_7d
+from src.transformation.warehouse_maintenance import maintain_warehouse
+
+logger = get_logger("bench_warehouse")
+
+SIZES = [1_000_000, 5_000_000]
+SCAN_REPEATS = 20  # queries per timing before maintenance (full table scans)
+INDEXED_REPEATS = 500
+LOOKUP_KEYS = 100
+CONCURRENT_SECONDS = 3.0
+
+
+def write_synthetic_warehouse(db_path: Path, n_rows: int) -> dict:
+    interactions = synthetic_interactions(n_rows)
+    user_features, item_features = feature_kernel_7d(interactions)
+    fact = pd.DataFrame({
+        "user_id": interactions["user_id"].astype(str),
+        "item_id": interactions["item_id"].astype(str),
+        "event_type": interactions["event_type"].astype(str),
+        "event_ts": interactions["timestamp"].dt.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "price": interactions["price"],
+    })
+    conn = sqlite3.connect(db_path)
+    fact.to_sql("fact_interactions", conn, if_exists="replace", index=False)
+    user_features.to_sql("features_user", conn, if_exists="replace", index=False)
+    item_features.to_sql("features_item", conn, if_exists="replace", index=False)
+    conn.close()
+    return {
+        "users": user_features["user_id"].astype(str).to_numpy(),
+        "items": item_features["item_id"].astype(str).to_numpy(),
+        "since": fact["event_ts"].max()[:10],
+    }
+
+
+def hot_queries(keys: dict, rng: np.random.Generator) -> dict:
+    """Query name -> function(conn) running one randomly keyed query."""
+    users, items, since = keys["users"], keys["items"], keys["since"]
+    in_list = ", ".join(["?"] * LOOKUP_KEYS)
+
+    def features_batch(conn):
+        batch = rng.choice(users, LOOKUP_KEYS, replace=False).tolist()
+        return conn.execute(f"SELECT * FROM features_user WHERE user_id IN ({in_list})", batch).fetchall()
+
+    def features_single(conn):
+        return conn.execute("SELECT * FROM features_item WHERE item_id = ?", (rng.choice(items),)).fetchall()
+
+    def user_history(conn):
+        return conn.execute(
+            "SELECT item_id, event_type, event_ts FROM fact_interactions WHERE user_id = ? AND event_ts >= ?",
+            (rng.choice(users), since),
+        ).fetchall()
+
+    def item_count(conn):
+        return conn.execute(
+            "SELECT COUNT(*) FROM fact_interactions WHERE item_id = ? AND event_ts >= ?",
+            (rng.choice(items), since),
+        ).fetchall()
+
+    return {
+        f"features_user x{LOOKUP_KEYS}": features_batch,
+        "features_item x1": features_single,
+        "user history since day": user_history,
+        "item count since day": item_count,
+    }
+
+
+def _latencies(fn, conn, repeats: int) -> np.ndarray:
+    out = np.empty(repeats)
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        fn(conn)
+        out[i] = time.perf_counter() - t0
+    return out * 1000
+
+
+def _fmt(ms: np.ndarray) -> str:
+    return f"p50={np.percentile(ms, 50):9.3f}ms  p99={np.percentile(ms, 99):9.3f}ms"
+
+
+def time_queries(db_path: Path, queries: dict, repeats: int) -> dict:
+    conn = configure_connection(sqlite3.connect(db_path))
+    try:
+        return {name: _latencies(fn, conn, repeats) for name, fn in queries.items()}
+    finally:
+        conn.close()
+
+
+def reads_under_writes(db_path: Path, keys: dict, rng: np.random.Generator) -> tuple:
+    """Single-key read latencies (ms) while another connection keeps rewriting features_user."""
+    stop = threading.Event()
+    commits = [0]
+
+    def writer():
+        conn = configure_connection(sqlite3.connect(db_path))
+        while not stop.is_set():
+            with conn:
+                conn.execute("UPDATE features_user SET events_7d = events_7d + 1")
+            commits[0] += 1
+        conn.close()
+
+    users = keys["users"]
+    conn = configure_connection(sqlite3.connect(db_path))
+    thread = threading.Thread(target=writer)
+    thread.start()
+    latencies = []
+    deadline = time.perf_counter() + CONCURRENT_SECONDS
+    while time.perf_counter() < deadline:
+        t0 = time.perf_counter()
+        conn.execute("SELECT * FROM features_user WHERE user_id = ?", (rng.choice(users),)).fetchall()
+        latencies.append(time.perf_counter() - t0)
+    stop.set()
+    thread.join()
+    conn.close()
+    return np.array(latencies) * 1000, commits[0]
+
+
+def main(sizes=None):
+    sizes = sizes or SIZES
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = Path(tmp) / "bench.db"
+            keys = write_synthetic_warehouse(db_path, n)
+            rng = np.random.default_rng(11)
+            queries = hot_queries(keys, rng)
+
+            before = time_queries(db_path, queries, SCAN_REPEATS)
+            busy_before, commits_before = reads_under_writes(db_path, keys, rng)
+
+            summary = maintain_warehouse(db_path)
+
+            after = time_queries(db_path, queries, INDEXED_REPEATS)
+            busy_after, commits_after = reads_under_writes(db_path, keys, rng)
+
+        logger.info(f"rows={n:,}  journal_mode={summary['journal_mode']}  indexes={summary['indexes']}")
+        for name in queries:
+            speedup = np.percentile(before[name], 50) / np.percentile(after[name], 50)
+            logger.info(f"  {name:<24} before {_fmt(before[name])}   after {_fmt(after[name])}   {speedup:8.1f}x")
+        logger.info(f"  reads during writes, rollback journal: {_fmt(busy_before)}  "
+                    f"reads={len(busy_before):,} writer commits={commits_before}")
+        logger.info(f"  reads during writes, WAL:              {_fmt(busy_after)}  "
+                    f"reads={len(busy_after):,} writer commits={commits_after}")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or None)
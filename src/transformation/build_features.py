@@ -1,16 +1,69 @@
+import json
+import os
 import sqlite3
+import uuid
 import pandas as pd
+import pyarrow.parquet as pq
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from typing import Iterable, Optional, Tuple
 
 from src.common.logger import get_logger
-from src.config import PREPARED_DIR, FEATURES_DIR, WAREHOUSE_DIR, WAREHOUSE_DB
+from src.feature_store.feature_store import FeatureStore
+from src.feature_store.point_in_time import point_in_time_join
+from src.config import PREPARED_DIR, FEATURES_DIR, WAREHOUSE_DIR, WAREHOUSE_DB, FEATURE_BUILD_FILE
 from src.preparation.utils_latest_file import latest_file
+from src.transformation.cooccurrence import build_approximate_cooccurrence, build_cooccurrence
+from src.transformation.feature_kernels import feature_kernel_7d
+from src.transformation.feature_history import (
+    SNAPSHOT_INTERVAL, read_history, reset_feature_history, update_feature_history,
+)
+from src.transformation.warehouse_load import (
+    LOAD_MODES, BATCH_SIZE, FACT_KEY_INDEX_SQL, ensure_declared_schema, loaded_snapshots,
+    append_snapshot, upsert_snapshot, replace_rows, reset_watermark,
+)
+from src.transformation.rolling_features import (
+    update_daily_buckets, prune_buckets, rolling_features_7d, rolling_user_items_30d,
+    reset_rolling_state, diff_frames,
+)
+from src.transformation.warehouse_maintenance import connect_warehouse
 
 logger = get_logger("build_features")
 
 SCHEMA_PATH = Path("src/transformation/warehouse_schema.sql")
 
+# Co-occurrence knobs: cap items per user (None = no cap) and drop rare pairs
+COOC_MAX_ITEMS_PER_USER = None
+COOC_MIN_COUNT = 1
+
+# "exact" counts every pair; "approximate" samples at most COOC_SAMPLE_ITEMS_PER_USER items per
+# user, keeps pair counts in a count-min sketch (overcount <= epsilon * total pair count with
+# probability 1 - delta) and keeps the COOC_TOP_K neighbors per item.
+# Recall against exact: python -m src.transformation.cooc_recall_report
+COOC_MODES = ("exact", "approximate")
+COOC_MODE = "exact"
+COOC_SAMPLE_ITEMS_PER_USER = 200
+COOC_TOP_K = 50
+COOC_SKETCH_EPSILON = 1e-5
+COOC_SKETCH_DELTA = 1e-3
+
+# "replace" rewrites every table from the latest snapshots (original behaviour);
+# "incremental" appends unseen prepared snapshots to fact_interactions and upserts dim_items
+LOAD_MODE = "incremental"
+
+# Only used with incremental loads: how feature tables are computed from the fact history
+# ("full" recompute, "incremental" rolling buckets, or "verify" = incremental + diff vs full)
+FEATURE_MODES = ("full", "incremental", "verify")
+FEATURE_MODE = "incremental"
+
+# Engine computing the replace-mode features, history and training frame: "pandas" loads the
+# prepared interactions into memory; "duckdb" runs the same definitions as SQL over the parquet
+# (src/transformation/duckdb_engine.py; multi-threaded, spills to disk) with identical output
+ENGINES = ("pandas", "duckdb")
+ENGINE = "pandas"
+
+FACT_COLS = ["user_id", "item_id", "event_type", "event_ts", "price"]
+
 
 def utc_now() -> datetime:
     return datetime.now(timezone.utc)
@@ -22,17 +75,187 @@ def ensure_no_duplicate_columns(df: pd.DataFrame, df_name: str):
         raise ValueError(f"{df_name} has duplicate columns: {dupes}")
 
 
-def main():
+def to_fact_rows(interactions: pd.DataFrame) -> pd.DataFrame:
+    needed_fact_cols = ["user_id", "item_id", "event_type", "timestamp", "price"]
+    missing_fact_cols = [c for c in needed_fact_cols if c not in interactions.columns]
+    if missing_fact_cols:
+        raise ValueError(f"Prepared interactions missing columns: {missing_fact_cols}")
+
+    fact = interactions.rename(columns={"timestamp": "event_ts"}).copy()
+
+    # Store timestamp as ISO string for SQLite
+    fact["event_ts"] = pd.to_datetime(fact["event_ts"], utc=True, errors="coerce").dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    fact = fact[FACT_COLS]
+    ensure_no_duplicate_columns(fact, "fact_interactions")
+    return fact
+
+
+def write_table(conn: sqlite3.Connection, table: str, df: pd.DataFrame, load_mode: str):
+    if load_mode == "replace":
+        df.to_sql(table, conn, if_exists="replace", index=False)
+    else:
+        replace_rows(conn, table, df)
+
+
+def write_build_version(path: Path, **info) -> str:
+    """
+    Record a new feature build id once the feature tables are committed; online feature
+    caches (src/feature_store/feature_cache.py) drop their entries when it changes.
+    """
+    build_id = f"{utc_now().strftime('%Y%m%dT%H%M%SZ')}_{uuid.uuid4().hex[:8]}"
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps({"build_id": build_id, **info}, indent=2), encoding="utf-8")
+    os.replace(tmp, path)
+    return build_id
+
+
+def write_batches(conn: sqlite3.Connection, table: str, frames: Iterable[pd.DataFrame]) -> int:
+    """Replace a table (as to_sql) with the concatenated frames, writing one frame at a time."""
+    rows = 0
+    for i, df in enumerate(frames):
+        ensure_no_duplicate_columns(df, table)
+        df.to_sql(table, conn, if_exists="replace" if i == 0 else "append", index=False)
+        rows += len(df)
+    return rows
+
+
+def load_fact_batches(conn: sqlite3.Connection, interactions_fp: Path, batch_size: int = BATCH_SIZE) -> int:
+    """Replace fact_interactions from a prepared snapshot one parquet record batch at a time."""
+    batches = pq.ParquetFile(interactions_fp).iter_batches(batch_size=batch_size)
+    return write_batches(conn, "fact_interactions", (to_fact_rows(b.to_pandas()) for b in batches))
+
+
+def load_fact_snapshots(conn: sqlite3.Connection, latest_fp: Path, latest: pd.DataFrame) -> int:
+    """Append every prepared interactions snapshot not yet recorded in load_watermark."""
+    done = loaded_snapshots(conn, "fact_interactions")
+    pending = [fp for fp in sorted(PREPARED_DIR.glob("interactions_prepared_*.parquet")) if fp.name not in done]
+    if not pending:
+        logger.info("fact_interactions: no new prepared snapshots")
+        return 0
+
+    total = 0
+    for fp in pending:
+        if fp == latest_fp:
+            snapshot = latest
+        else:
+            snapshot = pd.read_parquet(fp, columns=["user_id", "item_id", "event_type", "timestamp", "price"])
+        inserted = append_snapshot(conn, "fact_interactions", to_fact_rows(snapshot), fp.name)
+        logger.info(f"fact_interactions: appended {inserted} new rows from {fp.name}")
+        total += inserted
+    return total
+
+
+def cooccurrence(window: pd.DataFrame, since: datetime, cooc_mode: str = COOC_MODE) -> pd.DataFrame:
+    if cooc_mode not in COOC_MODES:
+        raise ValueError(f"Unknown cooc_mode {cooc_mode!r}; expected one of {COOC_MODES}")
+    if cooc_mode == "approximate":
+        return build_approximate_cooccurrence(
+            window,
+            since=since,
+            sample_items=COOC_SAMPLE_ITEMS_PER_USER,
+            top_k=COOC_TOP_K,
+            epsilon=COOC_SKETCH_EPSILON,
+            delta=COOC_SKETCH_DELTA,
+            min_count=COOC_MIN_COUNT,
+        )
+    return build_cooccurrence(
+        window,
+        since=since,
+        max_items_per_user=COOC_MAX_ITEMS_PER_USER,
+        min_count=COOC_MIN_COUNT,
+    )
+
+
+def full_features(window: pd.DataFrame, t7: datetime, t30: datetime):
+    """Recompute user/item (7 days) and co-occurrence (30 days) features from raw events."""
+    i7 = window[window["timestamp"] >= t7]
+    user_features, item_features = feature_kernel_7d(i7)
+    cooc = cooccurrence(window, since=t30)
+    return user_features, item_features, cooc
+
+
+def duckdb_features(engine, t7: datetime, t30: datetime):
+    """
+    full_features on the DuckDB engine; co-occurrence comes as an iterator of frames to stream
+    into the warehouse (approximate or capped modes run in pandas over the 30-day window).
+    """
+    user_features, item_features = engine.features_7d(t7)
+    if COOC_MODE == "exact" and COOC_MAX_ITEMS_PER_USER is None:
+        cooc = engine.cooccurrence_batches(t30, min_count=COOC_MIN_COUNT)
+    else:
+        cooc = iter([cooccurrence(engine.window(t30), since=t30)])
+    return user_features, item_features, cooc
+
+
+def read_fact_window(conn: sqlite3.Connection, since: datetime) -> pd.DataFrame:
+    window = pd.read_sql_query(
+        "SELECT user_id, item_id, event_type, event_ts, price FROM fact_interactions WHERE event_ts >= ?",
+        conn, params=[since.strftime("%Y-%m-%dT%H:%M:%SZ")],
+    )
+    window = window.rename(columns={"event_ts": "timestamp"})
+    window["timestamp"] = pd.to_datetime(window["timestamp"], utc=True, errors="coerce")
+    return window
+
+
+def warehouse_features(conn: sqlite3.Connection, t7: datetime, t30: datetime, feature_mode: str):
+    """
+    Features over the warehouse fact history (incremental load mode).
+    - full: recompute from fact_interactions
+    - incremental: fold new events into daily buckets and sum the buckets inside each window
+    - verify: incremental, then diff against a full recompute and fail on any mismatch
+    """
+    if feature_mode == "full":
+        return full_features(read_fact_window(conn, t30), t7, t30)
+
+    update_daily_buckets(conn)
+    prune_buckets(conn, t7, t30)
+    user_features, item_features = rolling_features_7d(conn, t7)
+    cooc = cooccurrence(rolling_user_items_30d(conn, t30), since=t30)
+
+    if feature_mode == "verify":
+        exp_user, exp_item, exp_cooc = full_features(read_fact_window(conn, t30), t7, t30)
+        issues = (
+            diff_frames(exp_user, user_features, ["user_id"], "features_user")
+            + diff_frames(exp_item, item_features, ["item_id"], "features_item")
+            + diff_frames(exp_cooc, cooc, ["item_id_a", "item_id_b"], "item_item_cooccurrence")
+        )
+        if issues:
+            raise ValueError("Incremental features differ from full recompute: " + "; ".join(issues))
+        logger.info("Verified incremental features against full recompute: identical")
+
+    return user_features, item_features, cooc
+
+
+def main(
+    load_mode: str = LOAD_MODE,
+    feature_mode: str = FEATURE_MODE,
+    engine: str = ENGINE,
+    interactions_fp: Optional[Path] = None,
+    products_fp: Optional[Path] = None,
+) -> Tuple[Path, Path]:
+    """
+    Build the warehouse and features from the prepared files (default: the latest of each).
+    Returns (FEATURE_BUILD_FILE, training frame parquet).
+    """
+    if load_mode not in LOAD_MODES:
+        raise ValueError(f"Unknown load_mode {load_mode!r}; expected one of {LOAD_MODES}")
+    if feature_mode not in FEATURE_MODES:
+        raise ValueError(f"Unknown feature_mode {feature_mode!r}; expected one of {FEATURE_MODES}")
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}; expected one of {ENGINES}")
+    if engine == "duckdb" and load_mode != "replace":
+        # Incremental runs compute features from the warehouse fact history, not the parquet
+        raise ValueError("engine='duckdb' requires load_mode='replace'")
+
     FEATURES_DIR.mkdir(parents=True, exist_ok=True)
     WAREHOUSE_DIR.mkdir(parents=True, exist_ok=True)
 
     # 1) Load latest prepared datasets (Task 5 output)
-    interactions_fp = latest_file(PREPARED_DIR, "interactions_prepared_*.parquet")
-    products_fp = latest_file(PREPARED_DIR, "products_prepared_*.parquet")
+    interactions_fp = Path(interactions_fp or latest_file(PREPARED_DIR, "interactions_prepared_*.parquet"))
+    products_fp = Path(products_fp or latest_file(PREPARED_DIR, "products_prepared_*.parquet"))
     logger.info(f"Using prepared interactions: {interactions_fp}")
     logger.info(f"Using prepared products: {products_fp}")
 
-    interactions = pd.read_parquet(interactions_fp)
     products = pd.read_parquet(products_fp)
 
     # Normalize key names: products has "id" from FakeStore; rename to item_id
@@ -40,19 +263,35 @@ def main():
         products = products.rename(columns={"id": "item_id"})
 
     # Convert timestamps for feature calculations
-    if "timestamp" not in interactions.columns:
+    if "timestamp" not in pq.read_schema(interactions_fp).names:
         raise ValueError("Prepared interactions must contain a 'timestamp' column.")
-    interactions["timestamp"] = pd.to_datetime(interactions["timestamp"], utc=True, errors="coerce")
+    if engine == "duckdb":
+        from src.transformation.duckdb_engine import DuckDBFeatureEngine
+
+        # The parquet is scanned by DuckDB and streamed in record batches, never loaded whole
+        interactions = None
+        duck = DuckDBFeatureEngine(interactions_fp)
+    else:
+        interactions = pd.read_parquet(interactions_fp)
+        interactions["timestamp"] = pd.to_datetime(interactions["timestamp"], utc=True, errors="coerce")
 
     # 2) Create / connect SQLite warehouse
-    conn = sqlite3.connect(WAREHOUSE_DB)
+    conn = connect_warehouse(WAREHOUSE_DB)
     cur = conn.cursor()
 
     # 3) Create schema
     schema_sql = SCHEMA_PATH.read_text(encoding="utf-8")
     cur.executescript(schema_sql)
     conn.commit()
-    logger.info(f"Initialized schema in {WAREHOUSE_DB}")
+    if load_mode == "incremental":
+        rebuilt = ensure_declared_schema(conn, schema_sql)
+        if rebuilt:
+            # Indexes are dropped with the legacy tables; recreate them
+            cur.executescript(schema_sql)
+        if "fact_interactions" in rebuilt:
+            reset_rolling_state(conn)
+        conn.execute(FACT_KEY_INDEX_SQL)
+    logger.info(f"Initialized schema in {WAREHOUSE_DB} (load_mode={load_mode})")
 
     # 4) Load dim_items
     needed_item_cols = ["item_id", "title", "category", "price"]
@@ -64,121 +303,105 @@ def main():
     dim_items["source_snapshot"] = str(products_fp.name)
     ensure_no_duplicate_columns(dim_items, "dim_items")
 
-    dim_items.to_sql("dim_items", conn, if_exists="replace", index=False)
-    logger.info(f"Loaded dim_items: {len(dim_items)} rows")
+    if load_mode == "replace":
+        dim_items.to_sql("dim_items", conn, if_exists="replace", index=False)
+        reset_watermark(conn, "dim_items", products_fp.name, len(dim_items))
+        logger.info(f"Loaded dim_items: {len(dim_items)} rows")
+    elif products_fp.name in loaded_snapshots(conn, "dim_items"):
+        logger.info(f"dim_items: {products_fp.name} already loaded")
+    else:
+        upserted = upsert_snapshot(conn, "dim_items", dim_items, ["item_id"], products_fp.name)
+        logger.info(f"Upserted dim_items: {upserted} rows")
 
     # 5) Load fact_interactions
-    needed_fact_cols = ["user_id", "item_id", "event_type", "timestamp", "price"]
-    missing_fact_cols = [c for c in needed_fact_cols if c not in interactions.columns]
-    if missing_fact_cols:
-        raise ValueError(f"Prepared interactions missing columns: {missing_fact_cols}")
-
-    fact = interactions.rename(columns={"timestamp": "event_ts"}).copy()
-
-    # Store timestamp as ISO string for SQLite
-    fact["event_ts"] = pd.to_datetime(fact["event_ts"], utc=True, errors="coerce").dt.strftime("%Y-%m-%dT%H:%M:%SZ")
-    fact = fact[["user_id", "item_id", "event_type", "event_ts", "price"]]
-    ensure_no_duplicate_columns(fact, "fact_interactions")
-
-    fact.to_sql("fact_interactions", conn, if_exists="replace", index=False)
-    logger.info(f"Loaded fact_interactions: {len(fact)} rows")
+    if load_mode == "replace" and engine == "duckdb":
+        loaded = load_fact_batches(conn, interactions_fp)
+        reset_watermark(conn, "fact_interactions", interactions_fp.name, loaded)
+        logger.info(f"Loaded fact_interactions: {loaded} rows")
+    elif load_mode == "replace":
+        fact = to_fact_rows(interactions)
+        fact.to_sql("fact_interactions", conn, if_exists="replace", index=False)
+        reset_watermark(conn, "fact_interactions", interactions_fp.name, len(fact))
+        logger.info(f"Loaded fact_interactions: {len(fact)} rows")
+    else:
+        load_fact_snapshots(conn, interactions_fp, interactions)
 
     # 6) Feature windows
-    now = utc_now()
+    now = utc_now().replace(microsecond=0)  # fact event_ts has whole-second resolution
     t7 = now - timedelta(days=7)
     t30 = now - timedelta(days=30)
 
-    # ---------- User features (7 days) ----------
-    i7 = interactions[interactions["timestamp"] >= t7].copy()
-
-    user_features = (
-        i7.groupby("user_id", as_index=False)
-          .agg(
-              events_7d=("event_type", "count"),
-              purchases_7d=("event_type", lambda s: int((s == "purchase").sum())),
-              avg_price_7d=("price", "mean"),
-              last_event_ts=("timestamp", "max"),
-          )
-    )
-
-    user_features["avg_price_7d"] = pd.to_numeric(user_features["avg_price_7d"], errors="coerce").fillna(0.0)
-    user_features["last_event_ts"] = pd.to_datetime(user_features["last_event_ts"], utc=True, errors="coerce") \
-                                        .dt.strftime("%Y-%m-%dT%H:%M:%SZ")
+    if load_mode == "replace":
+        # fact_interactions was rewritten, so any rolling buckets are stale
+        reset_rolling_state(conn)
+        if engine == "duckdb":
+            user_features, item_features, cooc = duckdb_features(duck, t7, t30)
+        else:
+            user_features, item_features, cooc = full_features(interactions, t7, t30)
+    else:
+        user_features, item_features, cooc = warehouse_features(conn, t7, t30, feature_mode)
 
     ensure_no_duplicate_columns(user_features, "user_features")
-    user_features.to_sql("features_user", conn, if_exists="replace", index=False)
+    write_table(conn, "features_user", user_features, load_mode)
     logger.info(f"Wrote features_user: {len(user_features)} rows")
 
-    # ---------- Item features (7 days) ----------
-    # Counts per event type
-    views = i7[i7["event_type"] == "view"].groupby("item_id").size().rename("views_7d")
-    carts = i7[i7["event_type"] == "cart"].groupby("item_id").size().rename("carts_7d")
-    purchases = i7[i7["event_type"] == "purchase"].groupby("item_id").size().rename("purchases_7d")
-
-    # Last event timestamp per item
-    last_ts = (
-        i7.groupby("item_id")["timestamp"]
-          .max()
-          .dt.strftime("%Y-%m-%dT%H:%M:%SZ")
-          .rename("last_event_ts")
-    )
-
-    item_features = pd.concat([views, carts, purchases, last_ts], axis=1).fillna(0).reset_index()
-
-    # Cast counts to int
-    for c in ["views_7d", "carts_7d", "purchases_7d"]:
-        item_features[c] = item_features[c].astype(int)
-
-    # Weighted popularity score
-    item_features["popularity_score_7d"] = (
-        item_features["views_7d"] * 1
-        + item_features["carts_7d"] * 3
-        + item_features["purchases_7d"] * 5
-    ).astype(float)
-
     ensure_no_duplicate_columns(item_features, "item_features")
-    item_features.to_sql("features_item", conn, if_exists="replace", index=False)
+    write_table(conn, "features_item", item_features, load_mode)
     logger.info(f"Wrote features_item: {len(item_features)} rows")
 
-    # ---------- Co-occurrence features (30 days) ----------
-    i30 = interactions[interactions["timestamp"] >= t30].copy()
-    user_items = (
-        i30.groupby("user_id")["item_id"]
-           .apply(lambda s: sorted(set(map(str, s))))
-           .reset_index(name="items")
+    if engine == "duckdb":
+        cooc_rows = write_batches(conn, "item_item_cooccurrence", cooc)
+    else:
+        ensure_no_duplicate_columns(cooc, "cooc")
+        write_table(conn, "item_item_cooccurrence", cooc, load_mode)
+        cooc_rows = len(cooc)
+    logger.info(f"Wrote item_item_cooccurrence: {cooc_rows} rows")
+
+    # Online/offline stores (registry online_store / offline_store): lookups read these files
+    # instead of contending with warehouse writes
+    with FeatureStore() as fs:
+        fs.materialize({"features_user": user_features, "features_item": item_features})
+
+    build_id = write_build_version(
+        FEATURE_BUILD_FILE, built_at_utc=now.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        load_mode=load_mode, feature_mode=feature_mode,
     )
+    logger.info(f"Feature build {build_id} recorded in {FEATURE_BUILD_FILE}")
 
-    pairs = []
-    for _, row in user_items.iterrows():
-        items = row["items"]
-        for i in range(len(items)):
-            for j in range(i + 1, len(items)):
-                pairs.append((items[i], items[j]))
-
-    if pairs:
-        pair_df = pd.DataFrame(pairs, columns=["item_id_a", "item_id_b"])
-        cooc = pair_df.value_counts().reset_index(name="cooc_count_30d")
+    # 7) Daily feature snapshots for point-in-time joins
+    if load_mode == "replace":
+        reset_feature_history(conn)
+    if engine == "duckdb":
+        duck.update_feature_history(conn, now)
     else:
-        cooc = pd.DataFrame(columns=["item_id_a", "item_id_b", "cooc_count_30d"])
-
-    ensure_no_duplicate_columns(cooc, "cooc")
-    cooc.to_sql("item_item_cooccurrence", conn, if_exists="replace", index=False)
-    logger.info(f"Wrote item_item_cooccurrence: {len(cooc)} rows")
-
-    # 7) Save a model-ready feature frame (optional but helpful for Task 9)
-    training_frame = (
-        interactions.merge(item_features, on="item_id", how="left")
-                    .merge(user_features, on="user_id", how="left")
-    )
-    ensure_no_duplicate_columns(training_frame, "training_frame")
+        update_feature_history(conn, now)
 
+    # 8) Save a model-ready feature frame (optional but helpful for Task 9). Each interaction
+    # gets the user/item features of the snapshot at the start of its day (events before that
+    # day only), not today's features, which would leak later events into training.
     run_ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
     out_fp = FEATURES_DIR / f"training_frame_{run_ts}.parquet"
-    training_frame.to_parquet(out_fp, index=False)
+    if engine == "duckdb":
+        duck.write_training_frame(out_fp)
+        duck.close()
+    else:
+        since = interactions["timestamp"].min()
+        since = None if pd.isna(since) else since.to_pydatetime() - SNAPSHOT_INTERVAL
+        training_frame = point_in_time_join(
+            interactions, read_history(conn, "item_id", since=since), "item_id", "timestamp",
+            tolerance=SNAPSHOT_INTERVAL,
+        )
+        training_frame = point_in_time_join(
+            training_frame, read_history(conn, "user_id", since=since), "user_id", "timestamp",
+            tolerance=SNAPSHOT_INTERVAL,
+        )
+        ensure_no_duplicate_columns(training_frame, "training_frame")
+        training_frame.to_parquet(out_fp, index=False)
     logger.info(f"Wrote training frame parquet: {out_fp}")
 
     conn.close()
     logger.info("Task 6 completed successfully.")
+    return FEATURE_BUILD_FILE, out_fp
 
 
 if __name__ == "__main__":
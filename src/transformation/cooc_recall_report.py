@@ -0,0 +1,68 @@
+"""
+Offline check of approximate co-occurrence against the exact computation.
+
+    python -m src.transformation.cooc_recall_report
+
+Reads the 30-day window from fact_interactions, builds exact and approximate co-occurrence
+with the knobs in build_features, and writes recall@K of each item's top-K neighbors
+(K = COOC_TOP_K) plus timings to reports/cooc_recall_<ts>.json.
+"""
+import json
+import sqlite3
+import time
+from datetime import timedelta
+
+from src.common.logger import get_logger
+from src.config import REPORTS_DIR, WAREHOUSE_DB
+from src.transformation.build_features import (
+    COOC_SAMPLE_ITEMS_PER_USER, COOC_SKETCH_DELTA, COOC_SKETCH_EPSILON, COOC_TOP_K,
+    cooccurrence, read_fact_window, utc_now,
+)
+from src.transformation.cooccurrence import neighbor_recall
+
+logger = get_logger("cooc_recall_report")
+
+
+def main():
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    now = utc_now().replace(microsecond=0)
+    t30 = now - timedelta(days=30)
+
+    conn = sqlite3.connect(WAREHOUSE_DB)
+    try:
+        window = read_fact_window(conn, t30)
+    finally:
+        conn.close()
+
+    t0 = time.perf_counter()
+    exact = cooccurrence(window, t30, cooc_mode="exact")
+    exact_secs = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    approx = cooccurrence(window, t30, cooc_mode="approximate")
+    approx_secs = time.perf_counter() - t0
+
+    report = {
+        "window_start_utc": t30.strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "events": int(len(window)),
+        "params": {
+            "sample_items_per_user": COOC_SAMPLE_ITEMS_PER_USER,
+            "top_k": COOC_TOP_K,
+            "epsilon": COOC_SKETCH_EPSILON,
+            "delta": COOC_SKETCH_DELTA,
+        },
+        "exact": {"pairs": int(len(exact)), "seconds": round(exact_secs, 3)},
+        "approximate": {"pairs": int(len(approx)), "seconds": round(approx_secs, 3)},
+        "recall": neighbor_recall(exact, approx, k=COOC_TOP_K),
+    }
+
+    out = REPORTS_DIR / f"cooc_recall_{now.strftime('%Y%m%d_%H%M%S')}.json"
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    logger.info(
+        f"recall@{COOC_TOP_K}={report['recall']['recall_mean']}, exact {exact_secs:.2f}s, "
+        f"approximate {approx_secs:.2f}s -> {out}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,301 @@
+import math
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from typing import Optional
+from scipy import sparse
+
+from src.common.logger import get_logger
+
+logger = get_logger("cooccurrence")
+
+COOC_COLUMNS = ["item_id_a", "item_id_b", "cooc_count_30d"]
+
+# Approximate mode: users are processed in chunks of at most this many candidate pairs
+SKETCH_CHUNK_PAIRS = 2_000_000
+
+
+def user_item_pairs(
+    interactions: pd.DataFrame,
+    since: datetime,
+    max_items_per_user: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Distinct (user_id, item_id) pairs with an event at or after `since`.
+    If max_items_per_user is set, only each user's most recently touched items are kept.
+    """
+    window = interactions.loc[interactions["timestamp"] >= since, ["user_id", "item_id", "timestamp"]]
+    window = window.dropna(subset=["user_id"])
+    window = window.assign(item_id=window["item_id"].astype(str))
+
+    if max_items_per_user is None:
+        return window.drop_duplicates(subset=["user_id", "item_id"])[["user_id", "item_id"]]
+
+    # Latest event per (user, item), then rank items per user by recency
+    latest = (
+        window.sort_values("timestamp", ascending=False, kind="stable")
+              .drop_duplicates(subset=["user_id", "item_id"])
+    )
+    keep = latest.groupby("user_id", sort=False).cumcount() < max_items_per_user
+    capped = latest[keep]
+    logger.info(f"Per-user cap {max_items_per_user}: kept {len(capped)} of {len(latest)} user-item pairs")
+    return capped[["user_id", "item_id"]]
+
+
+def _upper_pair_counts(user_codes: np.ndarray, item_codes: np.ndarray, n_items: int) -> sparse.coo_matrix:
+    """Upper triangle of X^T X for the sparse user x item matrix X (pair counts, A < B)."""
+    x = sparse.csr_matrix(
+        (np.ones(len(user_codes), dtype=np.int32), (user_codes, item_codes)),
+        shape=(int(user_codes.max()) + 1, n_items),
+    )
+    return sparse.triu(x.T.tocsr() @ x, k=1).tocoo()
+
+
+def _cooc_frame(items: np.ndarray, a: np.ndarray, b: np.ndarray, counts: np.ndarray, min_count: int) -> pd.DataFrame:
+    keep = counts >= min_count
+    cooc = pd.DataFrame({
+        "item_id_a": items[a[keep]],
+        "item_id_b": items[b[keep]],
+        "cooc_count_30d": counts[keep].astype(np.int64),
+    })
+    return cooc.sort_values(
+        ["cooc_count_30d", "item_id_a", "item_id_b"], ascending=[False, True, True]
+    ).reset_index(drop=True)
+
+
+def cooccurrence_from_pairs(pairs: pd.DataFrame, min_count: int = 1) -> pd.DataFrame:
+    """
+    Count item pairs (A, B) with A < B over distinct (user_id, item_id) pairs.
+    Builds a sparse user x item matrix X and takes the upper triangle of X^T X.
+    """
+    if pairs.empty:
+        return pd.DataFrame(columns=COOC_COLUMNS)
+
+    user_codes, _ = pd.factorize(pairs["user_id"])
+    # sort=True keeps item codes in string order, so code_a < code_b <=> item_a < item_b
+    item_codes, items = pd.factorize(pairs["item_id"], sort=True)
+
+    upper = _upper_pair_counts(user_codes, item_codes, len(items))
+    return _cooc_frame(np.asarray(items, dtype=object), upper.row, upper.col, upper.data, min_count)
+
+
+class CountMinSketch:
+    """
+    Count-min sketch over uint64 keys. Estimates never undercount; with probability
+    1 - delta a key is overcounted by at most epsilon * (total count added)
+    (the bound of the standard sketch; conservative update only lowers the error).
+    width = e / epsilon (rounded up to a power of two), depth = ln(1 / delta),
+    one multiply-shift hash per row.
+    """
+
+    def __init__(self, epsilon: float, delta: float, seed: int = 0):
+        self.log_width = max(1, math.ceil(math.log2(math.e / epsilon)))
+        self.width = 1 << self.log_width
+        self.depth = max(1, math.ceil(math.log(1.0 / delta)))
+        rng = np.random.default_rng(seed)
+        self._mul = rng.integers(0, np.iinfo(np.uint64).max, self.depth, dtype=np.uint64) | np.uint64(1)
+        self._add = rng.integers(0, np.iinfo(np.uint64).max, self.depth, dtype=np.uint64)
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    def _buckets(self, keys: np.ndarray) -> np.ndarray:
+        keys = keys.astype(np.uint64)
+        h = keys[None, :] * self._mul[:, None] + self._add[:, None]  # wraps mod 2^64
+        return (h >> np.uint64(64 - self.log_width)).astype(np.intp)
+
+    def add(self, keys: np.ndarray, counts: np.ndarray):
+        """
+        Conservative update for distinct keys: each counter is raised only as far as
+        (current estimate + count) of the keys hashing to it, which keeps every estimate
+        >= the true count while overcounting far less than adding to every row.
+        """
+        buckets = self._buckets(keys)
+        target = self.table[np.arange(self.depth)[:, None], buckets].min(axis=0) + counts.astype(np.int64)
+        for row in range(self.depth):
+            np.maximum.at(self.table[row], buckets[row], target)
+        self.total += int(counts.sum())
+
+    def estimate(self, keys: np.ndarray) -> np.ndarray:
+        buckets = self._buckets(keys)
+        return self.table[np.arange(self.depth)[:, None], buckets].min(axis=0)
+
+
+def sample_items_per_user(pairs: pd.DataFrame, max_items: int, seed: int = 0) -> pd.DataFrame:
+    """
+    At most max_items distinct items per user, sampled uniformly. The sample is ranked by a
+    hash of (user_id, item_id), so it does not depend on row order.
+    """
+    key = pd.util.hash_pandas_object(pairs[["user_id", "item_id"]], index=False, hash_key=f"{seed:016d}")
+    ranked = pairs.assign(_key=key.to_numpy()).sort_values(["user_id", "_key"], kind="stable")
+    keep = ranked.groupby("user_id", sort=False).cumcount() < max_items
+    logger.info(f"Per-user sample {max_items}: kept {int(keep.sum())} of {len(pairs)} user-item pairs")
+    return ranked.loc[keep, ["user_id", "item_id"]]
+
+
+def _rank_in_group(src: np.ndarray) -> np.ndarray:
+    """0-based position of each row within its run of equal (sorted) src values."""
+    starts = np.flatnonzero(np.r_[True, src[1:] != src[:-1]])
+    return np.arange(len(src)) - np.repeat(starts, np.diff(np.r_[starts, len(src)]))
+
+
+def _top_k_per_source(src: np.ndarray, dst: np.ndarray, est: np.ndarray, top_k: int):
+    """Keep each src's top_k distinct dst by estimate (ties: lower dst code first)."""
+    order = np.lexsort((dst, -est, src))
+    src, dst = src[order], dst[order]
+    # Duplicate (src, dst) rows carry the same estimate, so they are adjacent after the sort
+    first = np.r_[True, (src[1:] != src[:-1]) | (dst[1:] != dst[:-1])]
+    src, dst = src[first], dst[first]
+    keep = _rank_in_group(src) < top_k
+    return src[keep], dst[keep]
+
+
+def approximate_cooccurrence(
+    pairs: pd.DataFrame,
+    top_k: int,
+    epsilon: float,
+    delta: float,
+    min_count: int = 1,
+    chunk_pairs: int = SKETCH_CHUNK_PAIRS,
+    seed: int = 0,
+) -> pd.DataFrame:
+    """
+    Approximate pair counts over distinct (user_id, item_id) pairs.
+    Users are processed in chunks (in user_id order); each chunk's exact pair counts are added
+    to a count-min sketch, and a per-item table of the top_k neighbors by sketch estimate is
+    updated, so memory is the sketch plus items * top_k candidates rather than every pair.
+    Returned counts are sketch estimates for the pairs that are a top_k neighbor of either item.
+    """
+    if pairs.empty:
+        return pd.DataFrame(columns=COOC_COLUMNS)
+
+    pairs = pairs.sort_values(["user_id", "item_id"], kind="stable")
+    user_codes, _ = pd.factorize(pairs["user_id"], sort=True)
+    item_codes, items = pd.factorize(pairs["item_id"], sort=True)
+    n_items = np.uint64(len(items))
+
+    sketch = CountMinSketch(epsilon, delta, seed=seed)
+
+    def keys(a, b):
+        lo, hi = np.minimum(a, b), np.maximum(a, b)
+        return lo.astype(np.uint64) * n_items + hi.astype(np.uint64)
+
+    # Chunk boundaries by user, each chunk adding about chunk_pairs candidate pairs
+    sizes = np.bincount(user_codes).astype(np.int64)
+    user_pairs = np.cumsum(sizes * (sizes - 1) // 2)
+    user_bounds = np.r_[0, np.flatnonzero(np.diff(user_pairs // max(chunk_pairs, 1))) + 1, len(sizes)]
+    row_bounds = np.r_[0, np.cumsum(sizes)][np.unique(user_bounds)]
+
+    cand_src = np.empty(0, dtype=np.int64)
+    cand_dst = np.empty(0, dtype=np.int64)
+    for r0, r1 in zip(row_bounds[:-1], row_bounds[1:]):
+        u = user_codes[r0:r1]
+        upper = _upper_pair_counts(u - u[0], item_codes[r0:r1], len(items))
+        if upper.nnz == 0:
+            continue
+        a, b = upper.row.astype(np.int64), upper.col.astype(np.int64)
+        sketch.add(keys(a, b), upper.data)
+
+        src = np.concatenate([cand_src, a, b])
+        dst = np.concatenate([cand_dst, b, a])
+        cand_src, cand_dst = _top_k_per_source(src, dst, sketch.estimate(keys(src, dst)), top_k)
+
+    uniq = np.sort(keys(cand_src, cand_dst))
+    uniq = uniq[np.r_[True, uniq[1:] != uniq[:-1]]]
+    a, b = (uniq // n_items).astype(np.int64), (uniq % n_items).astype(np.int64)
+    logger.info(
+        f"Count-min sketch {sketch.depth}x{sketch.width}: {sketch.total} pair counts, "
+        f"max overcount ~{epsilon * sketch.total:.1f} (p={1 - delta})"
+    )
+    return _cooc_frame(np.asarray(items, dtype=object), a, b, sketch.estimate(uniq), min_count)
+
+
+def build_cooccurrence(
+    interactions: pd.DataFrame,
+    since: datetime,
+    max_items_per_user: Optional[int] = None,
+    min_count: int = 1,
+) -> pd.DataFrame:
+    pairs = user_item_pairs(interactions, since, max_items_per_user)
+    cooc = cooccurrence_from_pairs(pairs, min_count=min_count)
+    logger.info(
+        f"Co-occurrence: {pairs['user_id'].nunique()} users, {pairs['item_id'].nunique()} items, "
+        f"{len(cooc)} pairs (min_count={min_count})"
+    )
+    return cooc
+
+
+def build_approximate_cooccurrence(
+    interactions: pd.DataFrame,
+    since: datetime,
+    sample_items: Optional[int],
+    top_k: int,
+    epsilon: float,
+    delta: float,
+    min_count: int = 1,
+) -> pd.DataFrame:
+    pairs = user_item_pairs(interactions, since)
+    if sample_items is not None:
+        pairs = sample_items_per_user(pairs, sample_items)
+    cooc = approximate_cooccurrence(pairs, top_k=top_k, epsilon=epsilon, delta=delta, min_count=min_count)
+    logger.info(
+        f"Approximate co-occurrence: {pairs['user_id'].nunique()} users, {pairs['item_id'].nunique()} items, "
+        f"{len(cooc)} pairs (top_k={top_k}, epsilon={epsilon}, delta={delta})"
+    )
+    return cooc
+
+
+def _symmetric(cooc: pd.DataFrame, vocab: pd.Index):
+    a = vocab.get_indexer(cooc["item_id_a"].astype(str)).astype(np.int64)
+    b = vocab.get_indexer(cooc["item_id_b"].astype(str)).astype(np.int64)
+    c = cooc["cooc_count_30d"].to_numpy(dtype=np.int64)
+    return np.r_[a, b], np.r_[b, a], np.r_[c, c]
+
+
+def neighbor_recall(exact: pd.DataFrame, approx: pd.DataFrame, k: int = 50) -> dict:
+    """
+    Recall of each item's exact top-k neighbors within its approximate top-k, over items
+    with exact neighbors. An approximate neighbor is a hit when its exact count reaches the
+    item's k-th exact count, so ties at the cut-off do not count as misses.
+    """
+    vocab = pd.Index(pd.unique(np.concatenate([
+        exact["item_id_a"].astype(str), exact["item_id_b"].astype(str),
+        approx["item_id_a"].astype(str), approx["item_id_b"].astype(str),
+    ])))
+    n = np.int64(max(len(vocab), 1))
+
+    if exact.empty:
+        return {"k": k, "items": 0, "recall_mean": None, "recall_p10": None, "recall_median": None,
+                "neighbors_exact": 0, "neighbors_found": 0}
+
+    e_src, e_dst, e_cnt = _symmetric(exact, vocab)
+    order = np.lexsort((e_dst, -e_cnt, e_src))
+    e_src, e_dst, e_cnt = e_src[order], e_dst[order], e_cnt[order]
+    in_top = _rank_in_group(e_src) < k
+    expected = np.bincount(e_src[in_top], minlength=len(vocab))           # min(k, #neighbors)
+    kth = np.full(len(vocab), np.iinfo(np.int64).max, dtype=np.int64)
+    np.minimum.at(kth, e_src[in_top], e_cnt[in_top])                        # k-th exact count
+
+    a_src, a_dst, a_est = _symmetric(approx, vocab)
+    a_src, a_dst = _top_k_per_source(a_src, a_dst, a_est, k)
+
+    # Exact count of each approximate neighbor (0 if the pair never co-occurred)
+    e_keys = e_src * n + e_dst
+    key_order = np.argsort(e_keys)
+    a_keys = a_src * n + a_dst
+    pos = np.minimum(np.searchsorted(e_keys, a_keys, sorter=key_order), len(e_keys) - 1)
+    match = key_order[pos]
+    true_cnt = np.where(e_keys[match] == a_keys, e_cnt[match], 0)
+    hit = (true_cnt > 0) & (true_cnt >= kth[a_src])
+
+    has = expected > 0
+    hits = np.minimum(np.bincount(a_src, weights=hit, minlength=len(vocab)), expected)
+    recall = hits[has] / expected[has]
+    return {
+        "k": k,
+        "items": int(has.sum()),
+        "recall_mean": float(recall.mean()) if len(recall) else None,
+        "recall_p10": float(np.percentile(recall, 10)) if len(recall) else None,
+        "recall_median": float(np.median(recall)) if len(recall) else None,
+        "neighbors_exact": int(expected.sum()),
+        "neighbors_found": int(hits.sum()),
+    }
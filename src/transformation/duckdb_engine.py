@@ -0,0 +1,266 @@
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import duckdb
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from src.common.logger import get_logger
+from src.config import WAREHOUSE_DIR
+from src.transformation.feature_history import (
+    HISTORY_TABLES, SNAPSHOT_WINDOW, mark_history_folded, snapshot_batches, stale_snapshot_days,
+    write_snapshots,
+)
+from src.transformation.feature_kernels import W_CART, W_PURCHASE, W_VIEW
+
+logger = get_logger("duckdb_engine")
+
+TS_FMT = "%Y-%m-%dT%H:%M:%SZ"
+
+# DuckDB runs the queries on DUCKDB_THREADS threads (None = all cores). Past DUCKDB_MEMORY_LIMIT
+# (None = DuckDB's default, 80% of RAM) joins, aggregates and temp tables spill to DUCKDB_TEMP_DIR.
+DUCKDB_THREADS = None
+DUCKDB_MEMORY_LIMIT = None
+DUCKDB_TEMP_DIR = WAREHOUSE_DIR / "duckdb_tmp"
+
+# Rows per Arrow batch when streaming the training frame
+BATCH_ROWS = 500_000
+
+# The 7-day feature definitions of feature_kernel_7d, as aggregates over events `e`. Prices are
+# summed with the compensated (Kahan) sum pandas' groupby uses, fed in the order the pandas engine
+# sees the rows ({order}), so avg_price_7d matches it to the last bit.
+USER_AGGREGATES = f"""
+    count(e.event_type) AS events_7d,
+    count(*) FILTER (WHERE e.event_type = 'purchase') AS purchases_7d,
+    CASE WHEN count(e.price) > 0 THEN fsum(e.price ORDER BY {{order}}) / count(e.price) ELSE 0.0 END AS avg_price_7d,
+    strftime(max(e.ts), '{TS_FMT}') AS last_event_ts
+"""
+ITEM_AGGREGATES = f"""
+    count(*) FILTER (WHERE e.event_type = 'view') AS views_7d,
+    count(*) FILTER (WHERE e.event_type = 'cart') AS carts_7d,
+    count(*) FILTER (WHERE e.event_type = 'purchase') AS purchases_7d,
+    strftime(max(e.ts), '{TS_FMT}') AS last_event_ts,
+    CAST(
+        count(*) FILTER (WHERE e.event_type = 'view') * {W_VIEW}
+        + count(*) FILTER (WHERE e.event_type = 'cart') * {W_CART}
+        + count(*) FILTER (WHERE e.event_type = 'purchase') * {W_PURCHASE}
+    AS DOUBLE) AS popularity_score_7d
+"""
+AGGREGATES = {"user_id": USER_AGGREGATES, "item_id": ITEM_AGGREGATES}
+
+# Row order of the pandas engine: file order for the current features; for snapshots, events read
+# back from fact_interactions (whole-second event_ts) and stably sorted by time
+FILE_ORDER = "e.file_row_number"
+FACT_TIME_ORDER = "date_trunc('second', e.ts), e.file_row_number"
+
+FEATURES_7D_SQL = """
+SELECT e.{key}, {aggregates}
+FROM events e
+WHERE e.ts >= CAST(? AS TIMESTAMPTZ) AND e.{key} IS NOT NULL
+GROUP BY e.{key}
+ORDER BY e.{key}
+"""
+
+# One row per (entity, snapshot day) over events in [day - window, day), as compute_snapshots
+SNAPSHOTS_SQL = f"""
+SELECT CAST(e.{{key}} AS VARCHAR) AS {{key}}, strftime(d.day, '{TS_FMT}') AS feature_ts, {{aggregates}}
+FROM (SELECT CAST(unnest(CAST(? AS VARCHAR[])) AS TIMESTAMPTZ) AS day) d
+JOIN events e ON e.ts >= d.day - to_seconds(CAST(? AS BIGINT)) AND e.ts < d.day
+WHERE e.{{key}} IS NOT NULL
+GROUP BY e.{{key}}, d.day
+ORDER BY d.day, e.{{key}}
+"""
+
+# Pairs (A, B), A < B, of items seen by the same user, as cooccurrence_from_pairs
+COOCCURRENCE_SQL = """
+WITH pairs AS (
+    SELECT DISTINCT user_id, CAST(item_id AS VARCHAR) AS item_id
+    FROM events
+    WHERE ts >= CAST(? AS TIMESTAMPTZ) AND user_id IS NOT NULL
+)
+SELECT a.item_id AS item_id_a, b.item_id AS item_id_b, count(*) AS cooc_count_30d
+FROM pairs a JOIN pairs b ON a.user_id = b.user_id AND a.item_id < b.item_id
+GROUP BY a.item_id, b.item_id
+HAVING count(*) >= ?
+ORDER BY cooc_count_30d DESC, item_id_a, item_id_b
+"""
+
+# Features of the snapshot taken at the start of each event's day (see SNAPSHOT_INTERVAL): the
+# same rows point_in_time_join picks with a one-day tolerance, as snapshots are daily midnights
+SNAPSHOT_JOIN = """
+LEFT JOIN {history} h
+    ON h.{key} = CAST(b.{key} AS VARCHAR)
+    AND h.feature_ts = strftime(date_trunc('day', CAST(b."timestamp" AS TIMESTAMPTZ)), '{ts_fmt}')
+"""
+
+
+def _sql_string(value) -> str:
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+class DuckDBFeatureEngine:
+    """
+    The build_features feature definitions as SQL over the prepared interactions parquet, run
+    by DuckDB (multi-threaded, spilling to disk past its memory limit) instead of pandas.
+    Every method returns or writes the same rows, types and order as the pandas engine.
+    """
+
+    def __init__(
+        self,
+        interactions_fp: Path,
+        threads: Optional[int] = DUCKDB_THREADS,
+        memory_limit: Optional[str] = DUCKDB_MEMORY_LIMIT,
+        temp_dir: Path = DUCKDB_TEMP_DIR,
+    ):
+        self.interactions_fp = Path(interactions_fp)
+        temp_dir.mkdir(parents=True, exist_ok=True)
+        self.con = duckdb.connect()
+        self.con.execute("SET TimeZone = 'UTC'")
+        self.con.execute(f"SET temp_directory = {_sql_string(temp_dir)}")
+        if threads is not None:
+            self.con.execute(f"SET threads = {int(threads)}")
+        if memory_limit is not None:
+            self.con.execute(f"SET memory_limit = {_sql_string(memory_limit)}")
+        # Prepared interactions (clean_and_eda): timestamp is UTC, price numeric
+        self.con.execute(f"""
+            CREATE TEMP VIEW events AS
+            SELECT user_id, item_id, event_type, CAST("timestamp" AS TIMESTAMPTZ) AS ts,
+                   TRY_CAST(price AS DOUBLE) AS price, file_row_number
+            FROM read_parquet({_sql_string(self.interactions_fp)}, file_row_number = true)
+        """)
+
+    def close(self):
+        self.con.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _frame(self, sql: str, params: Optional[list] = None) -> pd.DataFrame:
+        # Through Arrow, so nullable integers become float64 with NaN as in pandas
+        return self.con.execute(sql, params or []).fetch_record_batch(BATCH_ROWS).read_all().to_pandas()
+
+    def features_7d(self, t7: datetime) -> Tuple[pd.DataFrame, pd.DataFrame]:
+        """features_user / features_item (feature_kernel_7d over events at or after t7)."""
+        since = t7.strftime(TS_FMT)
+        return tuple(
+            self._frame(FEATURES_7D_SQL.format(key=key, aggregates=AGGREGATES[key].format(order=FILE_ORDER)), [since])
+            for key in ("user_id", "item_id")
+        )
+
+    def cooccurrence_batches(self, t30: datetime, min_count: int = 1) -> Iterator[pd.DataFrame]:
+        """
+        Exact item_item_cooccurrence over events at or after t30 (no per-user cap), in frames of
+        at most BATCH_ROWS pairs, so the pairs are never all held in pandas at once.
+        """
+        reader = self.con.execute(COOCCURRENCE_SQL, [t30.strftime(TS_FMT), min_count]).fetch_record_batch(BATCH_ROWS)
+        empty = True
+        for batch in reader:
+            empty = False
+            yield batch.to_pandas()
+        if empty:
+            yield reader.schema.empty_table().to_pandas()
+
+    def window(self, since: datetime) -> pd.DataFrame:
+        """user_id, item_id, timestamp of events at or after `since`, in file order (for the pandas
+        co-occurrence modes DuckDB does not implement)."""
+        return self._frame(
+            'SELECT user_id, item_id, ts AS "timestamp" FROM events '
+            "WHERE ts >= CAST(? AS TIMESTAMPTZ) ORDER BY file_row_number",
+            [since.strftime(TS_FMT)],
+        )
+
+    def update_feature_history(self, conn: sqlite3.Connection, now: datetime) -> int:
+        """
+        update_feature_history for a fact table loaded from this engine's parquet: computes
+        every stale daily snapshot in DuckDB (kept in temp tables for write_training_frame)
+        and writes them to the warehouse history tables in SNAPSHOT_BATCH_DAYS batches.
+        """
+        days, max_id = stale_snapshot_days(conn, now)
+        day_strings = [d.strftime(TS_FMT) for d in days]
+        for key, table in HISTORY_TABLES.items():
+            self.con.execute(
+                f"CREATE OR REPLACE TEMP TABLE {table} AS "
+                + SNAPSHOTS_SQL.format(key=key, aggregates=AGGREGATES[key].format(order=FACT_TIME_ORDER)),
+                [day_strings, int(SNAPSHOT_WINDOW.total_seconds())],
+            )
+
+        for batch in snapshot_batches(days):
+            params = [batch[0].strftime(TS_FMT), batch[-1].strftime(TS_FMT)]
+            user_hist, item_hist = (
+                self._frame(f"SELECT * FROM {table} WHERE feature_ts BETWEEN ? AND ? ORDER BY feature_ts, {key}", params)
+                for key, table in HISTORY_TABLES.items()
+            )
+            write_snapshots(conn, user_hist, item_hist, batch)
+            logger.info(
+                f"Feature history (duckdb): {len(batch)} daily snapshots {batch[0]:%Y-%m-%d}..{batch[-1]:%Y-%m-%d} "
+                f"({len(user_hist)} user rows, {len(item_hist)} item rows)"
+            )
+        mark_history_folded(conn, max_id)
+        if not days:
+            logger.info("Feature history: snapshots up to date")
+        return len(days)
+
+    def _history_features(self, key: str) -> List[str]:
+        cols = [r[0] for r in self.con.execute(f"DESCRIBE {HISTORY_TABLES[key]}").fetchall()]
+        return [c for c in cols if c not in (key, "feature_ts")]
+
+    def _has_missing(self, key: str) -> bool:
+        """Whether any event has no snapshot to join (its integer features then become float)."""
+        missing = self.con.execute(
+            'SELECT count(*) FILTER (WHERE h.feature_ts IS NULL) FROM '
+            '(SELECT user_id, item_id, ts AS "timestamp" FROM events) b'
+            + SNAPSHOT_JOIN.format(history=HISTORY_TABLES[key], key=key, ts_fmt=TS_FMT)
+        ).fetchone()[0]
+        return missing > 0
+
+    def write_training_frame(self, out_fp: Path, order: Tuple[str, ...] = ("item_id", "user_id")) -> int:
+        """
+        The training frame of build_features (each interaction with the item, then user,
+        snapshot of its day; clashing names suffixed _x/_y as in point_in_time_join), streamed
+        from the parquet in record batches to out_fp. Needs update_feature_history first.
+        """
+        features = {key: self._history_features(key) for key in order}
+        as_float = {key: self._has_missing(key) for key in order}
+        selects = {
+            key: (
+                "SELECT " + ", ".join(f"h.{c}" for c in features[key]) + " FROM frame_batch b"
+                + SNAPSHOT_JOIN.format(history=HISTORY_TABLES[key], key=key, ts_fmt=TS_FMT)
+                + " ORDER BY b.__row"
+            )
+            for key in order
+        }
+
+        def frame_table(batch: pa.RecordBatch) -> pa.Table:
+            self.con.register("frame_batch", pa.Table.from_batches([batch]).append_column(
+                "__row", pa.array(range(batch.num_rows), type=pa.int64())
+            ))
+            table = pa.Table.from_batches([batch])
+            for key in order:
+                values = self.con.execute(selects[key]).fetch_record_batch(BATCH_ROWS).read_all()
+                clash = [c for c in values.column_names if c in table.column_names]
+                table = table.rename_columns([c + "_x" if c in clash else c for c in table.column_names])
+                for c in values.column_names:
+                    column = values.column(c)
+                    if as_float[key] and pa.types.is_integer(column.type):
+                        column = column.cast(pa.float64())
+                    table = table.append_column(c + "_y" if c in clash else c, column)
+            self.con.unregister("frame_batch")
+            return table.replace_schema_metadata()
+
+        # The writer is opened with the schema of an empty batch, so an empty frame still
+        # gets a file (as the pandas engine writes one)
+        source = pq.ParquetFile(self.interactions_fp)
+        empty = pa.RecordBatch.from_pylist([], schema=source.schema_arrow)
+        rows = 0
+        with pq.ParquetWriter(out_fp, frame_table(empty).schema) as writer:
+            for batch in source.iter_batches(batch_size=BATCH_ROWS):
+                table = frame_table(batch)
+                writer.write_table(table)
+                rows += table.num_rows
+        return rows
@@ -0,0 +1,201 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+
+from src.common.logger import get_logger
+from src.transformation.feature_kernels import feature_kernel_7d
+
+logger = get_logger("feature_history")
+
+TS_FMT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Daily snapshots of the 7-day user/item features. The snapshot at midnight D covers events in
+# [D - 7 days, D), so an event on day D joined to it never sees itself or anything later.
+SNAPSHOT_INTERVAL = timedelta(days=1)
+SNAPSHOT_WINDOW = timedelta(days=7)
+SNAPSHOT_BATCH_DAYS = 30  # calendar days of snapshots computed (and held in memory) per batch
+HISTORY_TABLES = {"user_id": "features_user_history", "item_id": "features_item_history"}
+# rolling_state key: last fact interaction_id (rowid) folded into the history. Cleared with the
+# rest of rolling_state whenever fact_interactions is rebuilt, which recomputes every snapshot.
+HISTORY_STATE_KEY = "history_last_interaction_id"
+
+
+def _day_start(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def reset_feature_history(conn: sqlite3.Connection):
+    """Used by replace mode: fact_interactions was rewritten, so every snapshot is recomputed."""
+    with conn:
+        for table in HISTORY_TABLES.values():
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM feature_snapshots")
+        conn.execute("DELETE FROM rolling_state WHERE key = ?", (HISTORY_STATE_KEY,))
+
+
+def _snapshot_range(conn: sqlite3.Connection, now: datetime) -> pd.DatetimeIndex:
+    """Every snapshot midnight after the first fact event, up to now."""
+    first = conn.execute("SELECT MIN(event_ts) FROM fact_interactions").fetchone()[0]
+    if first is None:
+        return pd.DatetimeIndex([], tz="UTC")
+    first_day = _day_start(pd.Timestamp(first).to_pydatetime()) + SNAPSHOT_INTERVAL
+    return pd.date_range(first_day, _day_start(now), freq=SNAPSHOT_INTERVAL, tz="UTC")
+
+
+def missing_snapshot_days(conn: sqlite3.Connection, now: datetime) -> List[datetime]:
+    """Midnights after the first fact event, up to now, without a recorded snapshot."""
+    done = {r[0] for r in conn.execute("SELECT feature_ts FROM feature_snapshots")}
+    return [d.to_pydatetime() for d in _snapshot_range(conn, now) if d.strftime(TS_FMT) not in done]
+
+
+def _last_folded_id(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM rolling_state WHERE key = ?", (HISTORY_STATE_KEY,)).fetchone()
+    return int(row[0]) if row else 0
+
+
+def stale_snapshot_days(conn: sqlite3.Connection, now: datetime) -> Tuple[List[datetime], int]:
+    """
+    Snapshot days to (re)compute and the fact rowid they account for: the missing days, plus
+    every recorded day D whose window [D - 7 days, D) holds a fact row appended since the last
+    update (events loaded late for days that already have a snapshot).
+    """
+    last_id = _last_folded_id(conn)
+    max_id = conn.execute("SELECT COALESCE(MAX(rowid), 0) FROM fact_interactions").fetchone()[0]
+    days = set(missing_snapshot_days(conn, now))
+    if max_id > last_id:
+        event_days = [
+            datetime.strptime(r[0], "%Y-%m-%d").replace(tzinfo=timezone.utc)
+            for r in conn.execute(
+                "SELECT DISTINCT substr(event_ts, 1, 10) FROM fact_interactions WHERE rowid > ? AND rowid <= ?",
+                (last_id, max_id),
+            )
+        ]
+        # an event on day E is in the windows of the snapshots at E + 1 .. E + 7 days
+        n_windows = int(SNAPSHOT_WINDOW / SNAPSHOT_INTERVAL)
+        covered = {e + SNAPSHOT_INTERVAL * i for e in event_days for i in range(1, n_windows + 1)}
+        days |= {d.to_pydatetime() for d in _snapshot_range(conn, now) if d.to_pydatetime() in covered}
+    return sorted(days), int(max_id)
+
+
+def mark_history_folded(conn: sqlite3.Connection, max_id: int):
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO rolling_state (key, value) VALUES (?, ?)", (HISTORY_STATE_KEY, str(max_id))
+        )
+
+
+def _read_events(conn: sqlite3.Connection, start: datetime, end: datetime) -> pd.DataFrame:
+    events = pd.read_sql_query(
+        "SELECT user_id, item_id, event_type, event_ts, price FROM fact_interactions "
+        "WHERE event_ts >= ? AND event_ts < ?",
+        conn, params=[start.strftime(TS_FMT), end.strftime(TS_FMT)],
+    )
+    events = events.rename(columns={"event_ts": "timestamp"})
+    events["timestamp"] = pd.to_datetime(events["timestamp"], utc=True, errors="coerce")
+    return events.sort_values("timestamp", kind="mergesort", ignore_index=True)
+
+
+def compute_snapshots(events: pd.DataFrame, days: List[datetime]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    User and item snapshots (with feature_ts) for each day. events must be sorted by timestamp;
+    each day's window is a contiguous slice found by binary search, fed to the same kernel as
+    the online features.
+    """
+    ts = events["timestamp"].to_numpy(dtype="datetime64[ns]")
+    users, items = [], []
+    for day in days:
+        bounds = pd.DatetimeIndex([day - SNAPSHOT_WINDOW, day]).tz_convert("UTC").tz_localize(None)
+        lo, hi = np.searchsorted(ts, bounds.to_numpy(dtype="datetime64[ns]"), side="left")
+        if lo == hi:
+            continue
+        user_features, item_features = feature_kernel_7d(events.iloc[lo:hi])
+        feature_ts = day.strftime(TS_FMT)
+        users.append(user_features.assign(feature_ts=feature_ts))
+        items.append(item_features.assign(feature_ts=feature_ts))
+
+    def stack(parts: List[pd.DataFrame], key: str) -> pd.DataFrame:
+        if not parts:
+            return pd.DataFrame(columns=[key, "feature_ts"])
+        df = pd.concat(parts, ignore_index=True)
+        return df[[key, "feature_ts"] + [c for c in df.columns if c not in (key, "feature_ts")]]
+
+    return stack(users, "user_id"), stack(items, "item_id")
+
+
+def _insert_sql(table: str, cols: List[str]) -> str:
+    return f"INSERT OR REPLACE INTO {table} ({', '.join(cols)}) VALUES ({', '.join(['?'] * len(cols))})"
+
+
+def write_snapshots(conn: sqlite3.Connection, user_hist: pd.DataFrame, item_hist: pd.DataFrame, days: List[datetime]):
+    """Snapshot rows of the given days (replacing any earlier ones) and their feature_snapshots records, in one transaction."""
+    built_at = datetime.utcnow().strftime(TS_FMT)
+    n_users = user_hist["feature_ts"].value_counts()
+    n_items = item_hist["feature_ts"].value_counts()
+    day_strings = [(day.strftime(TS_FMT),) for day in days]
+    with conn:
+        for df, table in ((user_hist, HISTORY_TABLES["user_id"]), (item_hist, HISTORY_TABLES["item_id"])):
+            conn.executemany(f"DELETE FROM {table} WHERE feature_ts = ?", day_strings)
+            if not df.empty:
+                conn.executemany(_insert_sql(table, list(df.columns)), df.itertuples(index=False, name=None))
+        conn.executemany(
+            _insert_sql("feature_snapshots", ["feature_ts", "users", "items", "built_at_utc"]),
+            [
+                (d, int(n_users.get(d, 0)), int(n_items.get(d, 0)), built_at)
+                for d in (day.strftime(TS_FMT) for day in days)
+            ],
+        )
+
+
+def snapshot_batches(days: List[datetime]) -> List[List[datetime]]:
+    """
+    Sorted days cut into batches spanning at most SNAPSHOT_BATCH_DAYS calendar days, so a batch
+    of scattered recomputed days does not read every event in between.
+    """
+    batches = []
+    for day in days:
+        if batches and day - batches[-1][0] < SNAPSHOT_INTERVAL * SNAPSHOT_BATCH_DAYS:
+            batches[-1].append(day)
+        else:
+            batches.append([day])
+    return batches
+
+
+def update_feature_history(conn: sqlite3.Connection, now: datetime) -> int:
+    """
+    Compute and store the stale snapshots (the whole history on the first run, then the days
+    since the last run and the days whose window received late events), so the history always
+    matches a rebuild from fact_interactions. Returns the number of snapshot days written.
+    """
+    days, max_id = stale_snapshot_days(conn, now)
+    for batch in snapshot_batches(days):
+        events = _read_events(conn, batch[0] - SNAPSHOT_WINDOW, batch[-1])
+        user_hist, item_hist = compute_snapshots(events, batch)
+        write_snapshots(conn, user_hist, item_hist, batch)
+        logger.info(
+            f"Feature history: {len(batch)} daily snapshots {batch[0]:%Y-%m-%d}..{batch[-1]:%Y-%m-%d} "
+            f"({len(user_hist)} user rows, {len(item_hist)} item rows)"
+        )
+    mark_history_folded(conn, max_id)
+    if not days:
+        logger.info("Feature history: snapshots up to date")
+    return len(days)
+
+
+def read_history(
+    conn: sqlite3.Connection,
+    key: str,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> pd.DataFrame:
+    """Snapshot rows of the user_id or item_id history table with feature_ts in [since, until]."""
+    sql = f"SELECT * FROM {HISTORY_TABLES[key]} WHERE 1 = 1"
+    params = []
+    if since is not None:
+        sql += " AND feature_ts >= ?"
+        params.append(since.strftime(TS_FMT))
+    if until is not None:
+        sql += " AND feature_ts <= ?"
+        params.append(until.strftime(TS_FMT))
+    return pd.read_sql_query(sql, conn, params=params)
@@ -0,0 +1,227 @@
+import sqlite3
+import numpy as np
+import pandas as pd
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+from src.common.logger import get_logger
+
+logger = get_logger("rolling_features")
+
+TS_FMT = "%Y-%m-%dT%H:%M:%SZ"
+BUCKET_TABLES = ["agg_user_daily", "agg_item_daily", "agg_user_item_daily"]
+
+USER_BUCKET_COLS = ["events", "purchases", "price_sum", "price_count"]
+ITEM_BUCKET_COLS = ["views", "carts", "purchases"]
+
+
+def _day_start(ts: datetime) -> datetime:
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _upsert_sql(table: str, key_cols: List[str], sum_cols: List[str]) -> str:
+    cols = key_cols + sum_cols + ["last_event_ts"]
+    updates = [f"{c} = {c} + excluded.{c}" for c in sum_cols]
+    updates.append("last_event_ts = MAX(last_event_ts, excluded.last_event_ts)")
+    return (
+        f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(['?'] * len(cols))}) "
+        f"ON CONFLICT ({', '.join(key_cols)}) DO UPDATE SET {', '.join(updates)}"
+    )
+
+
+def user_buckets(events: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    """Partial user aggregates over `keys`; events carry ISO-string event_ts."""
+    return (
+        events.assign(is_purchase=(events["event_type"] == "purchase").astype(np.int64))
+              .groupby(keys, as_index=False)
+              .agg(
+                  events=("event_type", "count"),
+                  purchases=("is_purchase", "sum"),
+                  price_sum=("price", "sum"),
+                  price_count=("price", "count"),
+                  last_event_ts=("event_ts", "max"),
+              )
+    )
+
+
+def item_buckets(events: pd.DataFrame, keys: List[str]) -> pd.DataFrame:
+    return (
+        events.assign(
+            views=(events["event_type"] == "view").astype(np.int64),
+            carts=(events["event_type"] == "cart").astype(np.int64),
+            purchases=(events["event_type"] == "purchase").astype(np.int64),
+        )
+        .groupby(keys, as_index=False)
+        .agg(views=("views", "sum"), carts=("carts", "sum"), purchases=("purchases", "sum"),
+             last_event_ts=("event_ts", "max"))
+    )
+
+
+def reset_rolling_state(conn: sqlite3.Connection):
+    """Forget all buckets; the next update re-aggregates fact_interactions from the start."""
+    with conn:
+        for table in BUCKET_TABLES:
+            conn.execute(f"DELETE FROM {table}")
+        conn.execute("DELETE FROM rolling_state")
+    logger.info("Reset rolling aggregate state")
+
+
+def _last_aggregated_id(conn: sqlite3.Connection) -> int:
+    row = conn.execute("SELECT value FROM rolling_state WHERE key = 'last_interaction_id'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def update_daily_buckets(conn: sqlite3.Connection) -> int:
+    """
+    Fold fact rows appended since the last run into per-day buckets.
+    Returns the number of new events aggregated.
+    """
+    last_id = _last_aggregated_id(conn)
+    new = pd.read_sql_query(
+        "SELECT interaction_id, user_id, item_id, event_type, event_ts, price "
+        "FROM fact_interactions WHERE interaction_id > ?",
+        conn, params=[last_id],
+    )
+    if new.empty:
+        logger.info("Rolling buckets: no new events")
+        return 0
+
+    new["day"] = new["event_ts"].str.slice(0, 10)
+    users = user_buckets(new, ["user_id", "day"])
+    items = item_buckets(new, ["item_id", "day"])
+    user_items = new.groupby(["user_id", "item_id", "day"], as_index=False).agg(last_event_ts=("event_ts", "max"))
+
+    with conn:
+        conn.executemany(
+            _upsert_sql("agg_user_daily", ["user_id", "day"], USER_BUCKET_COLS),
+            users[["user_id", "day"] + USER_BUCKET_COLS + ["last_event_ts"]].itertuples(index=False, name=None),
+        )
+        conn.executemany(
+            _upsert_sql("agg_item_daily", ["item_id", "day"], ITEM_BUCKET_COLS),
+            items[["item_id", "day"] + ITEM_BUCKET_COLS + ["last_event_ts"]].itertuples(index=False, name=None),
+        )
+        conn.executemany(
+            _upsert_sql("agg_user_item_daily", ["user_id", "item_id", "day"], []),
+            user_items.itertuples(index=False, name=None),
+        )
+        conn.execute(
+            "INSERT OR REPLACE INTO rolling_state (key, value) VALUES ('last_interaction_id', ?)",
+            (str(int(new["interaction_id"].max())),),
+        )
+
+    logger.info(f"Rolling buckets: aggregated {len(new)} new events")
+    return len(new)
+
+
+def prune_buckets(conn: sqlite3.Connection, t7: datetime, t30: datetime):
+    """Drop buckets for days entirely before the 7-day (user/item) and 30-day (user-item) windows."""
+    d7 = t7.strftime("%Y-%m-%d")
+    d30 = t30.strftime("%Y-%m-%d")
+    with conn:
+        dropped = conn.execute("DELETE FROM agg_user_daily WHERE day < ?", (d7,)).rowcount
+        dropped += conn.execute("DELETE FROM agg_item_daily WHERE day < ?", (d7,)).rowcount
+        dropped += conn.execute("DELETE FROM agg_user_item_daily WHERE day < ?", (d30,)).rowcount
+    logger.info(f"Rolling buckets: pruned {dropped} expired buckets")
+
+
+def _boundary_events(conn: sqlite3.Connection, since: datetime) -> pd.DataFrame:
+    """
+    Events on the first (partial) day of a window. Buckets are per day, so this
+    day is re-read from fact_interactions to honour the exact window start.
+    """
+    day_end = _day_start(since) + timedelta(days=1)
+    return pd.read_sql_query(
+        "SELECT user_id, item_id, event_type, event_ts, price FROM fact_interactions "
+        "WHERE event_ts >= ? AND event_ts < ?",
+        conn, params=[since.strftime(TS_FMT), day_end.strftime(TS_FMT)],
+    )
+
+
+def _combine(parts: List[pd.DataFrame], key: str, sum_cols: List[str]) -> pd.DataFrame:
+    stacked = pd.concat([p for p in parts if not p.empty], ignore_index=True)
+    if stacked.empty:
+        return pd.DataFrame(columns=[key] + sum_cols + ["last_event_ts"])
+    aggs = {c: "sum" for c in sum_cols}
+    aggs["last_event_ts"] = "max"
+    return stacked.groupby(key, as_index=False).agg(aggs)
+
+
+def rolling_features_7d(conn: sqlite3.Connection, t7: datetime) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """User and item 7-day features from daily buckets plus the partial first day."""
+    first_day = t7.strftime("%Y-%m-%d")
+    boundary = _boundary_events(conn, t7)
+
+    user_full_days = pd.read_sql_query(
+        f"SELECT user_id, {', '.join(USER_BUCKET_COLS)}, last_event_ts FROM agg_user_daily WHERE day > ?",
+        conn, params=[first_day],
+    )
+    users = _combine([user_full_days, user_buckets(boundary, ["user_id"])], "user_id", USER_BUCKET_COLS)
+    user_features = pd.DataFrame({
+        "user_id": users["user_id"],
+        "events_7d": users["events"].astype(np.int64),
+        "purchases_7d": users["purchases"].astype(np.int64),
+        "avg_price_7d": (users["price_sum"] / users["price_count"].replace(0, np.nan)).astype(float).fillna(0.0),
+        "last_event_ts": users["last_event_ts"],
+    })
+
+    item_full_days = pd.read_sql_query(
+        f"SELECT item_id, {', '.join(ITEM_BUCKET_COLS)}, last_event_ts FROM agg_item_daily WHERE day > ?",
+        conn, params=[first_day],
+    )
+    items = _combine([item_full_days, item_buckets(boundary, ["item_id"])], "item_id", ITEM_BUCKET_COLS)
+    item_features = pd.DataFrame({
+        "item_id": items["item_id"],
+        "views_7d": items["views"].astype(int),
+        "carts_7d": items["carts"].astype(int),
+        "purchases_7d": items["purchases"].astype(int),
+        "last_event_ts": items["last_event_ts"],
+    })
+    item_features["popularity_score_7d"] = (
+        item_features["views_7d"] * 1
+        + item_features["carts_7d"] * 3
+        + item_features["purchases_7d"] * 5
+    ).astype(float)
+
+    return user_features, item_features
+
+
+def rolling_user_items_30d(conn: sqlite3.Connection, t30: datetime) -> pd.DataFrame:
+    """
+    (user_id, item_id, timestamp) rows with the latest event per pair inside the 30-day
+    window, in the shape expected by cooccurrence.build_cooccurrence.
+    """
+    pairs = pd.read_sql_query(
+        "SELECT user_id, item_id, MAX(last_event_ts) AS last_event_ts FROM agg_user_item_daily "
+        "WHERE day > ? OR (day = ? AND last_event_ts >= ?) GROUP BY user_id, item_id",
+        conn, params=[t30.strftime("%Y-%m-%d"), t30.strftime("%Y-%m-%d"), t30.strftime(TS_FMT)],
+    )
+    pairs["timestamp"] = pd.to_datetime(pairs.pop("last_event_ts"), utc=True)
+    return pairs
+
+
+def diff_frames(expected: pd.DataFrame, actual: pd.DataFrame, keys: List[str], name: str) -> List[str]:
+    """
+    Compare two feature tables on `keys`. Integer and string columns must match exactly;
+    float columns are compared to 1e-9 relative (sums are accumulated in a different order).
+    """
+    issues = []
+    if sorted(expected.columns) != sorted(actual.columns):
+        return [f"{name}: columns differ {list(expected.columns)} vs {list(actual.columns)}"]
+
+    merged = expected.merge(actual, on=keys, how="outer", suffixes=("_full", "_incr"), indicator=True)
+    only_full = int((merged["_merge"] == "left_only").sum())
+    only_incr = int((merged["_merge"] == "right_only").sum())
+    if only_full or only_incr:
+        issues.append(f"{name}: {only_full} keys only in full recompute, {only_incr} only in incremental")
+
+    both = merged[merged["_merge"] == "both"]
+    for col in [c for c in expected.columns if c not in keys]:
+        left, right = both[f"{col}_full"], both[f"{col}_incr"]
+        if pd.api.types.is_float_dtype(left) or pd.api.types.is_float_dtype(right):
+            same = np.isclose(left.astype(float), right.astype(float), rtol=1e-9, atol=1e-12)
+        else:
+            same = (left.astype(str) == right.astype(str)).to_numpy()
+        bad = int((~same).sum())
+        if bad:
+            issues.append(f"{name}.{col}: {bad} mismatched rows")
+    return issues
@@ -0,0 +1,145 @@
+import re
+import sqlite3
+import pandas as pd
+from datetime import datetime, timezone
+from typing import List, Set
+
+from src.common.logger import get_logger
+
+logger = get_logger("warehouse_load")
+
+LOAD_MODES = ("replace", "incremental")
+BATCH_SIZE = 50_000
+
+# Business key of an interaction (same key used for dedup in preparation)
+FACT_KEY_COLS = ["user_id", "item_id", "event_type", "event_ts"]
+FACT_KEY_INDEX_SQL = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS ux_fact_interactions_key "
+    "ON fact_interactions (user_id, item_id, event_type, event_ts)"
+)
+
+
+def _utc_iso() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def declared_tables(schema_sql: str) -> List[str]:
+    return re.findall(r"CREATE TABLE IF NOT EXISTS (\w+)", schema_sql)
+
+
+def table_ddl(schema_sql: str, table: str) -> str:
+    match = re.search(rf"CREATE TABLE IF NOT EXISTS {table} \(.*?\n\);", schema_sql, re.DOTALL)
+    if not match:
+        raise ValueError(f"Table {table} not declared in warehouse schema")
+    return match.group(0)
+
+
+def table_columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    return [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+
+
+def table_has_primary_key(conn: sqlite3.Connection, table: str) -> bool:
+    return any(row[5] > 0 for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def ensure_declared_schema(conn: sqlite3.Connection, schema_sql: str) -> List[str]:
+    """
+    Tables written by DataFrame.to_sql(if_exists="replace") lose the keys declared in
+    warehouse_schema.sql. Rebuild any such table from the declared DDL, keeping its rows.
+    Returns the names of the tables that were rebuilt.
+    """
+    rebuilt = []
+    for table in declared_tables(schema_sql):
+        cols = table_columns(conn, table)
+        if not cols or table_has_primary_key(conn, table):
+            continue
+
+        legacy = f"{table}__legacy"
+        with conn:
+            conn.execute(f"ALTER TABLE {table} RENAME TO {legacy}")
+            conn.execute(table_ddl(schema_sql, table))
+            shared = [c for c in table_columns(conn, table) if c in cols]
+            col_list = ", ".join(shared)
+            conn.execute(f"INSERT OR REPLACE INTO {table} ({col_list}) SELECT {col_list} FROM {legacy}")
+            conn.execute(f"DROP TABLE {legacy}")
+        rebuilt.append(table)
+        logger.info(f"Rebuilt {table} with declared schema")
+    return rebuilt
+
+
+def loaded_snapshots(conn: sqlite3.Connection, table: str) -> Set[str]:
+    rows = conn.execute("SELECT source_snapshot FROM load_watermark WHERE table_name = ?", (table,))
+    return {r[0] for r in rows}
+
+
+def _record_load(conn: sqlite3.Connection, table: str, snapshot: str, rows: int):
+    conn.execute(
+        "INSERT OR REPLACE INTO load_watermark (table_name, source_snapshot, loaded_at_utc, row_count) "
+        "VALUES (?, ?, ?, ?)",
+        (table, snapshot, _utc_iso(), rows),
+    )
+
+
+def _executemany_batched(conn: sqlite3.Connection, sql: str, df: pd.DataFrame, batch_size: int) -> int:
+    written = 0
+    for start in range(0, len(df), batch_size):
+        chunk = df.iloc[start:start + batch_size]
+        cur = conn.executemany(sql, chunk.itertuples(index=False, name=None))
+        written += cur.rowcount
+    return written
+
+
+def append_snapshot(
+    conn: sqlite3.Connection,
+    table: str,
+    df: pd.DataFrame,
+    snapshot: str,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """
+    Insert rows of one source snapshot and record it in load_watermark, in one transaction.
+    Rows whose unique key already exists are ignored. Returns the number of rows inserted.
+    """
+    cols = list(df.columns)
+    sql = f"INSERT OR IGNORE INTO {table} ({', '.join(cols)}) VALUES ({', '.join(['?'] * len(cols))})"
+    with conn:
+        inserted = _executemany_batched(conn, sql, df, batch_size)
+        _record_load(conn, table, snapshot, inserted)
+    return inserted
+
+
+def upsert_snapshot(
+    conn: sqlite3.Connection,
+    table: str,
+    df: pd.DataFrame,
+    key_cols: List[str],
+    snapshot: str,
+    batch_size: int = BATCH_SIZE,
+) -> int:
+    """Insert-or-update rows on key_cols and record the snapshot in load_watermark."""
+    cols = list(df.columns)
+    updates = ", ".join(f"{c} = excluded.{c}" for c in cols if c not in key_cols)
+    sql = (
+        f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(['?'] * len(cols))}) "
+        f"ON CONFLICT ({', '.join(key_cols)}) DO UPDATE SET {updates}"
+    )
+    with conn:
+        written = _executemany_batched(conn, sql, df, batch_size)
+        _record_load(conn, table, snapshot, written)
+    return written
+
+
+def replace_rows(conn: sqlite3.Connection, table: str, df: pd.DataFrame, batch_size: int = BATCH_SIZE) -> int:
+    """Swap the contents of a declared table in one transaction (keeps its keys, unlike to_sql replace)."""
+    cols = list(df.columns)
+    sql = f"INSERT INTO {table} ({', '.join(cols)}) VALUES ({', '.join(['?'] * len(cols))})"
+    with conn:
+        conn.execute(f"DELETE FROM {table}")
+        return _executemany_batched(conn, sql, df, batch_size)
+
+
+def reset_watermark(conn: sqlite3.Connection, table: str, snapshot: str, rows: int):
+    """Used by replace mode: the table now holds exactly one snapshot."""
+    with conn:
+        conn.execute("DELETE FROM load_watermark WHERE table_name = ?", (table,))
+        _record_load(conn, table, snapshot, rows)
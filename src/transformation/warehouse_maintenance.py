@@ -0,0 +1,85 @@
+import sqlite3
+from pathlib import Path
+
+from src.common.logger import get_logger
+from src.common.sqlite_connection import configure_connection
+from src.config import WAREHOUSE_DB
+from src.transformation.rolling_features import reset_rolling_state
+from src.transformation.warehouse_load import declared_tables, ensure_declared_schema
+
+logger = get_logger("warehouse_maintenance")
+
+SCHEMA_PATH = Path("src/transformation/warehouse_schema.sql")
+
+# Persistent database settings. WAL lets readers (feature lookups, evaluation) run while the
+# nightly build writes: they read the last committed snapshot instead of waiting on the
+# writer's lock. page_size only changes through a VACUUM before WAL is enabled.
+PAGE_SIZE = 8192
+JOURNAL_MODE = "wal"
+
+
+def connect_warehouse(db_path: Path = WAREHOUSE_DB) -> sqlite3.Connection:
+    return configure_connection(sqlite3.connect(db_path))
+
+
+def enable_wal(conn: sqlite3.Connection, page_size: int = PAGE_SIZE) -> str:
+    """Switch to WAL (resizing pages first when needed). Returns the journal mode."""
+    mode = conn.execute("PRAGMA journal_mode").fetchone()[0]
+    if mode == JOURNAL_MODE:
+        return mode
+    if conn.execute("PRAGMA page_size").fetchone()[0] != page_size:
+        conn.execute(f"PRAGMA page_size = {page_size}")
+        conn.execute("VACUUM")
+    return conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}").fetchone()[0]
+
+
+def index_names(conn: sqlite3.Connection) -> list:
+    return [r[0] for r in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_autoindex_%' ORDER BY name"
+    )]
+
+
+def maintain_warehouse(db_path: Path = WAREHOUSE_DB) -> dict:
+    """
+    Warehouse maintenance stage (after build_features):
+    - WAL journal and PAGE_SIZE pages
+    - tables that lost their declared keys (to_sql replace) rebuilt from warehouse_schema.sql,
+      and every declared index created (fact_interactions by user/item and time, ...)
+    - ANALYZE, so the planner picks those indexes
+    """
+    schema_sql = SCHEMA_PATH.read_text(encoding="utf-8")
+    conn = connect_warehouse(db_path)
+    try:
+        journal_mode = enable_wal(conn)
+        conn.executescript(schema_sql)
+        rebuilt = ensure_declared_schema(conn, schema_sql)
+        if rebuilt:
+            # Indexes are dropped with the legacy tables; recreate them
+            conn.executescript(schema_sql)
+        if "fact_interactions" in rebuilt:
+            reset_rolling_state(conn)
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA optimize")
+        conn.commit()
+        summary = {
+            "journal_mode": journal_mode,
+            "page_size": conn.execute("PRAGMA page_size").fetchone()[0],
+            "tables": len(declared_tables(schema_sql)),
+            "rebuilt": rebuilt,
+            "indexes": index_names(conn),
+        }
+    finally:
+        conn.close()
+    logger.info(
+        f"Warehouse maintenance: journal_mode={summary['journal_mode']} page_size={summary['page_size']} "
+        f"rebuilt={summary['rebuilt'] or 'none'} indexes={len(summary['indexes'])}"
+    )
+    return summary
+
+
+def main():
+    maintain_warehouse()
+
+
+if __name__ == "__main__":
+    main()
@@ -45,3 +45,90 @@ CREATE TABLE IF NOT EXISTS item_item_cooccurrence (
   cooc_count_30d INTEGER NOT NULL,
   PRIMARY KEY (item_id_a, item_id_b)
 );
+
+-- Source snapshots already loaded per table (incremental load watermark)
+CREATE TABLE IF NOT EXISTS load_watermark (
+  table_name TEXT NOT NULL,
+  source_snapshot TEXT NOT NULL,
+  loaded_at_utc TEXT NOT NULL,
+  row_count INTEGER,
+  PRIMARY KEY (table_name, source_snapshot)
+);
+
+-- Lookups of the first (partial) day of a feature window
+CREATE INDEX IF NOT EXISTS idx_fact_interactions_event_ts ON fact_interactions (event_ts);
+
+-- Per-user / per-item event history in a time range (also covers COUNT(*) by item and time)
+CREATE INDEX IF NOT EXISTS idx_fact_interactions_user_ts ON fact_interactions (user_id, event_ts);
+CREATE INDEX IF NOT EXISTS idx_fact_interactions_item_ts ON fact_interactions (item_id, event_ts);
+
+-- Per-day partial aggregates for incrementally maintained rolling-window features
+CREATE TABLE IF NOT EXISTS agg_user_daily (
+  user_id TEXT NOT NULL,
+  day TEXT NOT NULL,
+  events INTEGER NOT NULL,
+  purchases INTEGER NOT NULL,
+  price_sum REAL NOT NULL,
+  price_count INTEGER NOT NULL,
+  last_event_ts TEXT,
+  PRIMARY KEY (user_id, day)
+);
+
+CREATE TABLE IF NOT EXISTS agg_item_daily (
+  item_id TEXT NOT NULL,
+  day TEXT NOT NULL,
+  views INTEGER NOT NULL,
+  carts INTEGER NOT NULL,
+  purchases INTEGER NOT NULL,
+  last_event_ts TEXT,
+  PRIMARY KEY (item_id, day)
+);
+
+-- Latest event per user-item pair and day (input to 30-day co-occurrence)
+CREATE TABLE IF NOT EXISTS agg_user_item_daily (
+  user_id TEXT NOT NULL,
+  item_id TEXT NOT NULL,
+  day TEXT NOT NULL,
+  last_event_ts TEXT,
+  PRIMARY KEY (user_id, item_id, day)
+);
+
+-- Progress of the rolling aggregates (last fact interaction_id folded into buckets)
+CREATE TABLE IF NOT EXISTS rolling_state (
+  key TEXT PRIMARY KEY,
+  value TEXT
+);
+
+-- Daily snapshots of the 7-day features for point-in-time joins (feature_ts = snapshot midnight,
+-- covering events in [feature_ts - 7 days, feature_ts))
+CREATE TABLE IF NOT EXISTS features_user_history (
+  user_id TEXT NOT NULL,
+  feature_ts TEXT NOT NULL,
+  events_7d INTEGER,
+  purchases_7d INTEGER,
+  avg_price_7d REAL,
+  last_event_ts TEXT,
+  PRIMARY KEY (user_id, feature_ts)
+);
+
+CREATE TABLE IF NOT EXISTS features_item_history (
+  item_id TEXT NOT NULL,
+  feature_ts TEXT NOT NULL,
+  views_7d INTEGER,
+  carts_7d INTEGER,
+  purchases_7d INTEGER,
+  last_event_ts TEXT,
+  popularity_score_7d REAL,
+  PRIMARY KEY (item_id, feature_ts)
+);
+
+CREATE INDEX IF NOT EXISTS idx_features_user_history_ts ON features_user_history (feature_ts);
+CREATE INDEX IF NOT EXISTS idx_features_item_history_ts ON features_item_history (feature_ts);
+
+-- Snapshot days already computed
+CREATE TABLE IF NOT EXISTS feature_snapshots (
+  feature_ts TEXT PRIMARY KEY,
+  users INTEGER,
+  items INTEGER,
+  built_at_utc TEXT
+);
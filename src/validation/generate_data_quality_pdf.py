@@ -1,5 +1,6 @@
 import json
 from pathlib import Path
+from typing import Optional
 from reportlab.lib.pagesizes import A4
 from reportlab.pdfgen import canvas
 from src.config import REPORTS_DIR
@@ -7,12 +8,14 @@ from src.common.logger import get_logger
 
 logger = get_logger("dq_pdf")
 
-def load_latest_report(pattern: str) -> dict:
-    files = sorted(REPORTS_DIR.glob(pattern))
-    if not files:
-        raise FileNotFoundError(f"No reports found matching: {pattern}")
-    latest = files[-1]
-    return json.loads(latest.read_text(encoding="utf-8")), latest.name
+def load_latest_report(pattern: str, path: Optional[Path] = None) -> dict:
+    if path is None:
+        files = sorted(REPORTS_DIR.glob(pattern))
+        if not files:
+            raise FileNotFoundError(f"No reports found matching: {pattern}")
+        path = files[-1]
+    path = Path(path)
+    return json.loads(path.read_text(encoding="utf-8")), path.name
 
 def write_section(c, title, y, lines):
     c.setFont("Helvetica-Bold", 12)
@@ -28,11 +31,12 @@ def write_section(c, title, y, lines):
         y -= 14
     return y
 
-def main():
+def main(interactions_report: Optional[Path] = None, products_report: Optional[Path] = None) -> Path:
+    """PDF from the given validation reports (default: the latest of each). Returns its path."""
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
-    interactions, i_name = load_latest_report("validation_interactions_*.json")
-    products, p_name = load_latest_report("validation_products_*.json")
+    interactions, i_name = load_latest_report("validation_interactions_*.json", interactions_report)
+    products, p_name = load_latest_report("validation_products_*.json", products_report)
 
     out_pdf = REPORTS_DIR / "Data_Quality_Report.pdf"
     c = canvas.Canvas(str(out_pdf), pagesize=A4)
@@ -74,6 +78,7 @@ def main():
 
     c.save()
     logger.info(f"Wrote PDF report: {out_pdf}")
+    return out_pdf
 
 if __name__ == "__main__":
     main()
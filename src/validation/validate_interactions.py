@@ -1,7 +1,14 @@
 import json
+import os
+import tempfile
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from pathlib import Path
 from datetime import datetime
+from typing import Iterable, Optional, Tuple
+from src.common.dataset_reader import dataset_schema, iter_batches, list_files, read_table
 from src.common.logger import get_logger
 from src.config import INTERACTIONS_RAW, VALIDATED_DIR, REPORTS_DIR
 from src.validation.utils_latest_partition import latest_partition
@@ -18,22 +25,33 @@ EXPECTED_SCHEMA = {
 
 ALLOWED_EVENT_TYPES = {"view", "cart", "purchase"}
 PRICE_MIN, PRICE_MAX = 0.0, 100000.0
+DUP_KEY = ["user_id", "item_id", "event_type", "timestamp"]
 
-def main():
-    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
-    VALIDATED_DIR.mkdir(parents=True, exist_ok=True)
+# "auto" streams partitions whose parquet files exceed STREAMING_MIN_BYTES on disk
+VALIDATION_MODES = ("auto", "in_memory", "streaming")
+STREAMING_MIN_BYTES = 256 * 1024 * 1024
+STREAM_BATCH_SIZE = 131_072
+DUP_SPILL_BUCKETS = 64
 
-    part_dir = latest_partition(INTERACTIONS_RAW)
-    files = sorted(part_dir.glob("*.parquet"))
-    if not files:
-        raise FileNotFoundError(f"No parquet files in latest partition: {part_dir}")
 
-    df = pd.concat([pd.read_parquet(f) for f in files], ignore_index=True)
-    logger.info(f"Loaded {len(df)} rows from {part_dir}")
+def check_schema(dtypes: dict) -> list:
+    """Columns + dtypes against EXPECTED_SCHEMA; dtypes maps column -> pandas dtype string."""
+    schema_issues = []
+    for col, exp_dtype in EXPECTED_SCHEMA.items():
+        if col not in dtypes:
+            schema_issues.append(f"Missing column: {col}")
+        else:
+            # pandas dtype checks are not always perfect; good enough for assignment
+            actual = dtypes[col]
+            if exp_dtype not in actual:
+                schema_issues.append(f"Dtype mismatch for {col}: expected~{exp_dtype}, got {actual}")
+    extra_cols = [c for c in dtypes if c not in EXPECTED_SCHEMA]
+    if extra_cols:
+        schema_issues.append(f"Unexpected columns: {extra_cols}")
+    return schema_issues
 
-    report = {}
-    report["dataset"] = "interactions"
-    report["partition"] = str(part_dir)
+
+def validate_frame(df: pd.DataFrame, report: dict) -> dict:
     report["row_count"] = int(len(df))
     report["columns"] = list(df.columns)
 
@@ -42,24 +60,12 @@ def main():
     report["missing_values"] = {k: int(v) for k, v in nulls.items()}
 
     # 2) Duplicate entries (define your “duplicate key”)
-    dup_key = ["user_id", "item_id", "event_type", "timestamp"]
+    dup_key = DUP_KEY
     duplicates = int(df.duplicated(subset=dup_key).sum()) if all(c in df.columns for c in dup_key) else None
     report["duplicate_rows_on_key"] = {"key": dup_key, "count": duplicates}
 
     # 3) Schema mismatch (columns + dtypes)
-    schema_issues = []
-    for col, exp_dtype in EXPECTED_SCHEMA.items():
-        if col not in df.columns:
-            schema_issues.append(f"Missing column: {col}")
-        else:
-            # pandas dtype checks are not always perfect; good enough for assignment
-            actual = str(df[col].dtype)
-            if exp_dtype not in actual:
-                schema_issues.append(f"Dtype mismatch for {col}: expected~{exp_dtype}, got {actual}")
-    extra_cols = [c for c in df.columns if c not in EXPECTED_SCHEMA]
-    if extra_cols:
-        schema_issues.append(f"Unexpected columns: {extra_cols}")
-    report["schema_issues"] = schema_issues
+    report["schema_issues"] = check_schema({c: str(t) for c, t in df.dtypes.items()})
 
     # 4) Range/format checks
     # timestamp parseability
@@ -73,17 +79,166 @@ def main():
         "bad_event_types": bad_events,
         "price_out_of_range": int(((df["price"] < PRICE_MIN) | (df["price"] > PRICE_MAX)).sum()) if "price" in df.columns else None
     }
+    return report
+
+
+class DistinctKeyCounter:
+    """
+    Counts distinct duplicate keys across batches with bounded memory.
+    Each row key is hashed to 64 bits; hashes are spilled to DUP_SPILL_BUCKETS temp files
+    partitioned by their high bits, and each bucket is de-duplicated on its own at the end.
+    (A 64-bit collision needs ~4e9 distinct keys before it becomes likely.)
+    """
+
+    def __init__(self, n_buckets: int = DUP_SPILL_BUCKETS):
+        self.n_buckets = n_buckets
+        self._dir = tempfile.TemporaryDirectory(prefix="dupkeys_")
+        self._files = [open(Path(self._dir.name) / f"bucket_{i:03d}.bin", "wb") for i in range(n_buckets)]
+
+    def add(self, keys: pd.DataFrame):
+        hashes = pd.util.hash_pandas_object(keys, index=False).to_numpy(dtype=np.uint64)
+        bucket = (hashes >> np.uint64(58)) % np.uint64(self.n_buckets)
+        order = np.argsort(bucket, kind="stable")
+        bounds = np.searchsorted(bucket[order], np.arange(self.n_buckets + 1))
+        for i in range(self.n_buckets):
+            part = hashes[order[bounds[i]:bounds[i + 1]]]
+            if len(part):
+                self._files[i].write(part.tobytes())
+
+    def distinct(self) -> int:
+        total = 0
+        for f in self._files:
+            f.close()
+            total += len(np.unique(np.fromfile(f.name, dtype=np.uint64)))
+        return total
+
+    def close(self):
+        """Remove the spill files (also after a failed run)."""
+        for f in self._files:
+            f.close()
+        self._dir.cleanup()
+
+
+def validate_batches(batches: Iterable[pa.RecordBatch], schema: pa.Schema, report: dict, writer=None) -> dict:
+    """
+    Same report as validate_frame, computed one record batch at a time and merged.
+    If a ParquetWriter is given, each batch is also written to the validated copy.
+    """
+    columns = list(schema.names)
+    dtypes = {c: str(t) for c, t in schema.empty_table().to_pandas().dtypes.items()}
+    has_dup_key = all(c in columns for c in DUP_KEY)
+
+    row_count = 0
+    nulls = {c: 0 for c in columns}
+    bad_ts = 0 if "timestamp" in columns else None
+    bad_events = 0 if "event_type" in columns else None
+    price_oor = 0 if "price" in columns else None
+    keys = DistinctKeyCounter() if has_dup_key else None
+
+    try:
+        for batch in batches:
+            if writer is not None:
+                writer.write_batch(batch)
+            bdf = batch.to_pandas()
+            row_count += len(bdf)
+            for c, v in bdf.isna().sum().items():
+                nulls[c] += int(v)
+            if keys is not None:
+                keys.add(bdf[DUP_KEY])
+            if bad_ts is not None:
+                bad_ts += int(pd.to_datetime(bdf["timestamp"], errors="coerce", utc=True).isna().sum())
+            if bad_events is not None:
+                bad_events += int((~bdf["event_type"].isin(ALLOWED_EVENT_TYPES)).sum())
+            if price_oor is not None:
+                price_oor += int(((bdf["price"] < PRICE_MIN) | (bdf["price"] > PRICE_MAX)).sum())
+        duplicates = (row_count - keys.distinct()) if keys is not None else None
+    finally:
+        if keys is not None:
+            keys.close()
+
+    report["row_count"] = row_count
+    report["columns"] = columns
+    report["missing_values"] = nulls
+    report["duplicate_rows_on_key"] = {
+        "key": DUP_KEY,
+        "count": duplicates,
+    }
+    report["schema_issues"] = check_schema(dtypes)
+    report["format_checks"] = {"bad_timestamps": bad_ts}
+    report["range_checks"] = {"bad_event_types": bad_events, "price_out_of_range": price_oor}
+    return report
+
+
+def main(
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    mode: str = "auto",
+    partition_dir: Optional[Path] = None,
+) -> Tuple[Path, Path]:
+    """
+    Validate partition_dir (default: the latest hour partition), or every partition with date in
+    [start_date, end_date] (inclusive, YYYY-MM-DD) when either bound is given.
+    Returns (validated parquet, JSON report).
+    mode: "in_memory" loads the partition as one DataFrame, "streaming" processes record
+    batches with bounded memory, "auto" picks streaming for large partitions.
+    """
+    if mode not in VALIDATION_MODES:
+        raise ValueError(f"Unknown mode {mode!r}; expected one of {VALIDATION_MODES}")
+
+    REPORTS_DIR.mkdir(parents=True, exist_ok=True)
+    VALIDATED_DIR.mkdir(parents=True, exist_ok=True)
+
+    if start_date is None and end_date is None:
+        part_dir = Path(partition_dir) if partition_dir is not None else latest_partition(INTERACTIONS_RAW)
+        scope = {"partition_dir": part_dir}
+        partition_label = str(part_dir)
+    else:
+        scope = {"start_date": start_date, "end_date": end_date}
+        partition_label = str(INTERACTIONS_RAW / f"date={start_date or '*'}..{end_date or '*'}")
+
+    files = list_files(INTERACTIONS_RAW, **scope)
+    if not files:
+        raise FileNotFoundError(f"No parquet files in partition(s): {partition_label}")
+
+    if mode == "auto":
+        size = sum(Path(f).stat().st_size for f in files)
+        mode = "streaming" if size >= STREAMING_MIN_BYTES else "in_memory"
 
-    # Save JSON report
     run_ts = datetime.utcnow().strftime("%Y%m%d_%H%M%S")
+    out_valid = VALIDATED_DIR / f"interactions_validated_{run_ts}.parquet"
+
+    report = {}
+    report["dataset"] = "interactions"
+    report["partition"] = partition_label
+
+    # Written under a temp name and renamed on success: a run that fails partway must not leave
+    # a readable, truncated interactions_validated_*.parquet for the next stage to pick up
+    tmp_valid = out_valid.with_name(f".{out_valid.name}.tmp")
+    try:
+        if mode == "in_memory":
+            table = read_table(INTERACTIONS_RAW, **scope)
+            df = table.to_pandas()
+            logger.info(f"Loaded {len(df)} rows from {partition_label}")
+            validate_frame(df, report)
+
+            # Save validated copy (optional but useful for later tasks)
+            pq.write_table(table, tmp_valid)
+        else:
+            schema = dataset_schema(INTERACTIONS_RAW)
+            with pq.ParquetWriter(tmp_valid, schema) as writer:
+                batches = iter_batches(INTERACTIONS_RAW, **scope, batch_size=STREAM_BATCH_SIZE)
+                validate_batches(batches, schema, report, writer=writer)
+            logger.info(f"Streamed {report['row_count']} rows from {partition_label}")
+        os.replace(tmp_valid, out_valid)
+    finally:
+        tmp_valid.unlink(missing_ok=True)
+
+    # Save JSON report
     out_json = REPORTS_DIR / f"validation_interactions_{run_ts}.json"
     out_json.write_text(json.dumps(report, indent=2), encoding="utf-8")
     logger.info(f"Wrote validation JSON report to {out_json}")
-
-    # Save validated copy (optional but useful for later tasks)
-    out_valid = VALIDATED_DIR / f"interactions_validated_{run_ts}.parquet"
-    df.to_parquet(out_valid, index=False)
     logger.info(f"Wrote validated dataset to {out_valid}")
+    return out_valid, out_json
 
 if __name__ == "__main__":
     main()
@@ -1,7 +1,9 @@
 import json
 import pandas as pd
+import pyarrow.parquet as pq
 from pathlib import Path
 from datetime import datetime
+from typing import Optional, Tuple
 from src.common.logger import get_logger
 from src.config import PRODUCTS_RAW, VALIDATED_DIR, REPORTS_DIR
 from src.validation.utils_latest_partition import latest_partition
@@ -10,16 +12,33 @@ logger = get_logger("validate_products")
 
 REQUIRED_FIELDS = ["id", "title", "price", "category"]
 
-def main():
+# Raw product files, in order of preference (ingestion writes jsonl or parquet; json is legacy)
+PRODUCT_FILES = ["products.jsonl", "products.parquet", "products.json"]
+
+def load_products(path: Path) -> list:
+    if path.suffix == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    if path.suffix == ".parquet":
+        return pq.read_table(path).to_pylist()
+    return json.loads(path.read_text(encoding="utf-8"))
+
+def latest_products_file() -> Path:
+    part_dir = latest_partition(PRODUCTS_RAW)
+    candidates = [part_dir / name for name in PRODUCT_FILES if (part_dir / name).exists()]
+    if not candidates:
+        raise FileNotFoundError(f"None of {PRODUCT_FILES} found in: {part_dir}")
+    return candidates[0]
+
+def main(products_file: Optional[Path] = None) -> Tuple[Path, Path]:
+    """Validate products_file (default: the latest raw partition). Returns (validated parquet, JSON report)."""
     REPORTS_DIR.mkdir(parents=True, exist_ok=True)
     VALIDATED_DIR.mkdir(parents=True, exist_ok=True)
 
-    part_dir = latest_partition(PRODUCTS_RAW)
-    json_file = part_dir / "products.json"
-    if not json_file.exists():
-        raise FileNotFoundError(f"products.json not found in: {part_dir}")
+    json_file = Path(products_file) if products_file is not None else latest_products_file()
+    part_dir = json_file.parent
 
-    data = json.loads(json_file.read_text(encoding="utf-8"))
+    data = load_products(json_file)
     df = pd.json_normalize(data)
     logger.info(f"Loaded {len(df)} rows from {json_file}")
 
@@ -63,6 +82,7 @@ def main():
     out_valid = VALIDATED_DIR / f"products_validated_{run_ts}.parquet"
     df.to_parquet(out_valid, index=False)
     logger.info(f"Wrote validated dataset to {out_valid}")
+    return out_valid, out_json
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,94 @@
+import sqlite3
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from src.transformation import feature_history as fh
+
+SCHEMA_SQL = (Path(__file__).resolve().parents[1] / "src/transformation/warehouse_schema.sql").read_text(encoding="utf-8")
+START = datetime(2024, 3, 1, tzinfo=timezone.utc)
+NOW = START + timedelta(days=40, hours=6)
+
+
+def make_events(n: int, seed: int, days: int = 40) -> list:
+    rng = pd.Series(range(n)).sample(frac=1.0, random_state=seed).to_list()
+    rows = []
+    for i in rng:
+        ts = START + timedelta(hours=(i * 7919 + seed * 104729) % (days * 24), minutes=i % 60)
+        rows.append((
+            f"u{i % 13}", f"i{i % 17}", ("view", "add_to_cart", "purchase")[i % 3],
+            ts.strftime(fh.TS_FMT), float(5 + i % 40),
+        ))
+    return rows
+
+
+def warehouse(*batches) -> sqlite3.Connection:
+    conn = sqlite3.connect(":memory:")
+    conn.executescript(SCHEMA_SQL)
+    for rows in batches:
+        append(conn, rows)
+    return conn
+
+
+def append(conn: sqlite3.Connection, rows: list):
+    with conn:
+        conn.executemany(
+            "INSERT INTO fact_interactions (user_id, item_id, event_type, event_ts, price) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+
+
+def dump(conn: sqlite3.Connection) -> dict:
+    out = {}
+    for key, table in fh.HISTORY_TABLES.items():
+        out[table] = pd.read_sql_query(f"SELECT * FROM {table} ORDER BY feature_ts, {key}", conn)
+    out["feature_snapshots"] = pd.read_sql_query(
+        "SELECT feature_ts, users, items FROM feature_snapshots ORDER BY feature_ts", conn
+    )
+    return out
+
+
+def assert_same_history(conn: sqlite3.Connection, expected: sqlite3.Connection):
+    got, want = dump(conn), dump(expected)
+    for table in want:
+        pdt.assert_frame_equal(got[table], want[table], check_exact=False, obj=table)
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    # Several batches per run, so stale days are spread over batches
+    monkeypatch.setattr(fh, "SNAPSHOT_BATCH_DAYS", 4)
+
+
+def test_incremental_history_matches_rebuild_after_late_events(small_batches):
+    first = make_events(300, seed=1, days=30)
+    # Late events for days that already have a snapshot, plus events of new days
+    late = make_events(60, seed=2, days=30)
+    new = [(u, i, e, (datetime.strptime(ts, fh.TS_FMT) + timedelta(days=30)).strftime(fh.TS_FMT), p)
+           for u, i, e, ts, p in make_events(40, seed=3, days=10)]
+
+    conn = warehouse(first)
+    fh.update_feature_history(conn, START + timedelta(days=30, hours=1))
+    append(conn, late + new)
+    written = fh.update_feature_history(conn, NOW)
+
+    expected = warehouse(first + late + new)
+    fh.update_feature_history(expected, NOW)
+    assert_same_history(conn, expected)
+    assert 0 < written < len(fh.missing_snapshot_days(warehouse(first + late + new), NOW))
+
+
+def test_up_to_date_history_writes_nothing():
+    conn = warehouse(make_events(200, seed=4))
+    assert fh.update_feature_history(conn, NOW) > 0
+    assert fh.update_feature_history(conn, NOW) == 0
+
+
+def test_reset_forces_full_recompute():
+    conn = warehouse(make_events(200, seed=5))
+    n_days = fh.update_feature_history(conn, NOW)
+    fh.reset_feature_history(conn)
+    assert fh.update_feature_history(conn, NOW) == n_days
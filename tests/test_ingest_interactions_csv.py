@@ -0,0 +1,51 @@
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.ingestion import ingest_interactions_csv as ingest
+
+HEADER = "user_id,item_id,event_type,timestamp,price\n"
+
+
+def write_csv(path, prices):
+    rows = [f"u{i},00{i},view,2024-03-01T00:00:00Z,{p}\n" for i, p in enumerate(prices)]
+    path.write_text(HEADER + "".join(rows), encoding="utf-8")
+    return path
+
+
+@pytest.mark.parametrize("block_size", [1 << 20, 64])
+def test_bad_price_cells_land_as_null(tmp_path, block_size):
+    csv_path = write_csv(tmp_path / "events.csv", ["1.5", "abc", "", "NaN", "2e3", "12.5.1", "-4"])
+    rows, bad = ingest.ingest_file(csv_path, out_dir=tmp_path / "out", block_size=block_size)
+
+    table = pq.read_table(tmp_path / "out" / "events.parquet")
+    assert rows == 7
+    assert bad == 2
+    assert table.schema.field("price").type == pa.float64()
+    assert table.column("item_id").to_pylist()[:2] == ["000", "001"]
+    prices = table.column("price").to_pylist()
+    assert prices[0] == 1.5 and prices[4] == 2000.0 and prices[6] == -4.0
+    assert prices[1] is None and prices[2] is None and prices[5] is None
+    assert prices[3] is None  # a CSV null value, as for a float column
+
+
+def test_clean_prices_are_not_counted(tmp_path):
+    csv_path = write_csv(tmp_path / "events.csv", ["1", "2.25", ""])
+    rows, bad = ingest.ingest_file(csv_path, out_dir=tmp_path / "out")
+    assert (rows, bad) == (3, 0)
+    assert pq.read_table(tmp_path / "out" / "events.parquet").column("price").to_pylist() == [1.0, 2.25, None]
+
+
+def test_manifest_records_bad_price_cells(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingest, "RAW_BASE", tmp_path / "raw")
+    monkeypatch.setattr(ingest, "MANIFEST_PATH", tmp_path / "raw" / "_ingest_manifest.json")
+    incoming = tmp_path / "incoming"
+    incoming.mkdir()
+    write_csv(incoming / "events.csv", ["3", "x", "4"])
+
+    ingest.main(workers=1, incoming_dir=incoming)
+    [entry] = json.loads(ingest.MANIFEST_PATH.read_text(encoding="utf-8")).values()
+    assert entry["rows"] == 3
+    assert entry["bad_price_cells"] == 1
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+from src.ingestion import ingest_products_api as api
+
+ETAG = '"catalog-v1"'
+
+
+class StubCatalog:
+    """Paginated catalog served by the stub server; each test sets the server behaviour."""
+
+    def __init__(self, n_items: int, total_header: bool = False, ignore_page: bool = False,
+                 not_found_past_end: bool = True, fail_first: int = 0):
+        self.items = [{"id": i, "title": f"item {i}", "price": float(i)} for i in range(n_items)]
+        self.total_header = total_header
+        self.ignore_page = ignore_page
+        self.not_found_past_end = not_found_past_end
+        self.fail_first = fail_first
+        self.requested_pages = []
+        self.lock = threading.Lock()
+
+
+def make_handler(catalog: StubCatalog):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            page, limit = int(query["page"][0]), int(query["limit"][0])
+            with catalog.lock:
+                catalog.requested_pages.append(page)
+                if catalog.fail_first > 0:
+                    catalog.fail_first -= 1
+                    return self._send(503, [])
+
+            if page == 1 and self.headers.get("If-None-Match") == ETAG:
+                return self._send(304, None)
+            if catalog.ignore_page:
+                page = 1
+            chunk = catalog.items[(page - 1) * limit: page * limit]
+            if not chunk and page > 1 and catalog.not_found_past_end:
+                return self._send(404, {"error": "page out of range"})
+            self._send(200, chunk)
+
+        def _send(self, status, payload):
+            body = b"" if payload is None else json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("ETag", ETAG)
+            if catalog.total_header:
+                self.send_header("X-Total-Count", str(len(catalog.items)))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    monkeypatch.setattr(api, "_backoff_sec", lambda attempt: 0)
+    servers = []
+
+    def start(catalog: StubCatalog) -> str:
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(catalog))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}/products"
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def fetch(url: str, validators=None, page_size: int = 10):
+    return asyncio.run(api.fetch_catalog(url, validators or {}, page_size=page_size))
+
+
+def test_short_page_ends_catalog(serve):
+    records, validators = fetch(serve(StubCatalog(25)))
+    assert [r["id"] for r in records] == list(range(25))
+    assert validators["etag"] == ETAG
+
+
+def test_total_count_header_fetches_all_pages(serve):
+    catalog = StubCatalog(100, total_header=True)
+    records, _ = fetch(serve(catalog))
+    assert [r["id"] for r in records] == list(range(100))
+    assert sorted(catalog.requested_pages) == list(range(1, 11))
+
+
+def test_not_found_past_end_ends_catalog(serve):
+    # Fills page 1 and the whole first window exactly, so the catalog ends on a 404
+    n_items = 10 * (1 + api.MAX_CONCURRENCY)
+    records, _ = fetch(serve(StubCatalog(n_items)))
+    assert [r["id"] for r in records] == list(range(n_items))
+
+
+def test_empty_page_ends_catalog(serve):
+    records, _ = fetch(serve(StubCatalog(30, not_found_past_end=False)))
+    assert len(records) == 30
+
+
+def test_server_ignoring_page_param_stops(serve):
+    records, _ = fetch(serve(StubCatalog(50, ignore_page=True)))
+    assert [r["id"] for r in records] == list(range(10))
+
+
+def test_page_cap(serve, monkeypatch):
+    monkeypatch.setattr(api, "MAX_PAGES", 3)
+    with pytest.raises(RuntimeError, match="MAX_PAGES"):
+        fetch(serve(StubCatalog(100)))
+
+
+def test_retries_transient_errors(serve):
+    records, _ = fetch(serve(StubCatalog(5, fail_first=2)))
+    assert len(records) == 5
+
+
+def test_not_modified_skips_catalog(serve):
+    records, validators = fetch(serve(StubCatalog(5)), validators={"etag": ETAG})
+    assert records is None
+    assert validators == {"etag": ETAG}
+
+
+@pytest.mark.parametrize("output_format", api.OUTPUT_FORMATS)
+def test_main_writes_catalog_then_skips_unchanged(serve, monkeypatch, tmp_path, output_format):
+    monkeypatch.setattr(api, "RAW_BASE", tmp_path)
+    monkeypatch.setattr(api, "HTTP_CACHE_PATH", tmp_path / "_http_cache.json")
+    url = serve(StubCatalog(135))
+
+    out_path = api.main(url, output_format)
+    assert out_path.name == f"products.{output_format}"
+    if output_format == "jsonl":
+        rows = [json.loads(line) for line in out_path.read_text(encoding="utf-8").splitlines()]
+    else:
+        import pyarrow.parquet as pq
+        rows = pq.read_table(out_path).to_pylist()
+    assert [r["id"] for r in rows] == list(range(135))
+
+    assert api.main(url, output_format) is None
@@ -0,0 +1,56 @@
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from src.modeling import serve
+
+N_ITEMS = 20
+
+
+@pytest.fixture(scope="module")
+def base_url():
+    rec = serve.Recommender.from_model(serve.synthetic_model(n_items=N_ITEMS, n_neighbors=3))
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    threading.Thread(target=serve.serve_http, args=(rec,), kwargs={"port": port}, daemon=True).start()
+    url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f"{url}/stats", timeout=1).close()
+            break
+        except OSError:
+            time.sleep(0.05)
+    return url
+
+
+def get(url: str):
+    try:
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_recommend_default_k(base_url):
+    status, payload = get(f"{base_url}/recommend?items=P0,P1")
+    assert status == 200
+    assert len(payload["recommendations"]) == serve.K
+
+
+@pytest.mark.parametrize("k", ["abc", "0", "-3", str(N_ITEMS + 1), "2.5"])
+def test_recommend_rejects_bad_k(base_url, k):
+    status, payload = get(f"{base_url}/recommend?items=P0&k={k}")
+    assert status == 400
+    assert "k must be" in payload["error"]
+
+
+def test_recommend_k_up_to_catalog_size(base_url):
+    status, payload = get(f"{base_url}/recommend?items=P0&k={N_ITEMS}")
+    assert status == 200
+    assert "P0" not in payload["recommendations"]